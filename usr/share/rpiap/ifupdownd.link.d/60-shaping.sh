@@ -0,0 +1,95 @@
+#!/bin/sh
+
+ifname=$1
+phase=$2
+basename="`basename $0`"
+lan='lan'
+env='/var/lib/rpiap/env'
+
+# one per-client class for every host address of the LAN /24 (udhcpd.conf)
+hosts=256
+
+if ! grep -Fxq -- "${ifname}" "${env}/lan"; then
+  # shaping is on the 'lan' bridge, (re)applied when a LAN interface comes up
+  exit 0
+fi
+
+if [ x"${phase}" != xup ]; then
+  exit 0
+fi
+
+log() {
+  text=$1
+  echo "${basename}: INFO: LAN ${ifname}: ${phase}: ${text}"
+}
+
+# setting name, default value (non-numeric values of numeric settings count as 0)
+setting() {
+  value="`cat "${env}/$1" 2>/dev/null || echo "$2"`"
+  case "$2" in
+    [0-9]*)
+      case "${value}" in
+        ''|*[!0-9]*) value=0 ;;
+      esac
+    ;;
+  esac
+  echo "${value}"
+}
+
+enabled="`setting shaping_enabled false`"
+download="`setting shaping_download 0`"
+client_limit="`setting shaping_client_limit 0`"
+
+# remove previous shaping
+tc qdisc del dev "${lan}" root 2>/dev/null || :
+
+if [ x"${enabled}" != xtrue ]; then
+  log "traffic shaping on '${lan}' disabled"
+  exit 0
+fi
+
+if [ "${client_limit}" -eq 0 ]; then
+  # cake shares the bandwidth fairly between clients (destination hosts),
+  # so one client downloading does not fill the queue for the others
+  if [ "${download}" -gt 0 ]; then
+    bandwidth="bandwidth ${download}mbit"
+  else
+    bandwidth="unlimited"
+  fi
+  if tc qdisc replace dev "${lan}" root cake ${bandwidth} besteffort dual-dsthost; then
+    log "cake on '${lan}', ${bandwidth}, fair queuing per client"
+  fi
+  exit 0
+fi
+
+# per-client cap: HTB class per LAN host address, fq_codel in each
+if [ "${download}" -gt 0 ]; then
+  total="${download}"
+else
+  total=10000
+fi
+rate="$((total * 1000 / hosts))"
+[ "${rate}" -gt 0 ] || rate=1
+
+tc qdisc add dev "${lan}" root handle 1: htb default 10
+tc class add dev "${lan}" parent 1: classid 1:1 htb rate "${total}mbit" ceil "${total}mbit" quantum 60000
+i=0
+while [ "${i}" -lt "${hosts}" ]; do
+  classid="`printf '%x' $((16 + i))`"
+  tc class add dev "${lan}" parent 1:1 classid "1:${classid}" htb rate "${rate}kbit" ceil "${client_limit}mbit"
+  # few flows per client, 256 default sized fq_codel instances would hold about 13 MB
+  tc qdisc add dev "${lan}" parent "1:${classid}" fq_codel flows 64
+  i=$((i + 1))
+done
+# IPv4: the last octet of the client address selects its class, no two clients share a cap;
+# IPv6 (SLAAC addresses of the ULA prefix) is hashed into the same classes, collisions share a cap
+if tc filter add dev "${lan}" parent 1: protocol ip prio 1 handle 1 flow map key dst and 0xff divisor "${hosts}" baseclass 1:10 \
+  && tc filter add dev "${lan}" parent 1: protocol ipv6 prio 2 handle 2 flow hash keys dst divisor "${hosts}" baseclass 1:10; then
+  log "htb on '${lan}', ${total} Mbit/s total, ${client_limit} Mbit/s per client"
+else
+  # without the filter all clients would share the default class (one client limit)
+  tc qdisc del dev "${lan}" root 2>/dev/null || :
+  echo "${basename}: ERROR: LAN ${ifname}: ${phase}: cannot classify clients on '${lan}', shaping disabled"
+fi
+
+exit 0
@@ -0,0 +1,110 @@
+#!/bin/sh
+
+# SQM (smart queue management) of a WAN interface against bufferbloat:
+# the uplink is shaped slightly below its real speed, so the queue builds here
+# (cake; HTB + fq_codel when cake is not available; HTB + a short FIFO without
+# both) instead of in the modem.
+# Upload is shaped on the interface, download on an IFB device the ingress
+# traffic is redirected to. Bandwidths in kbit/s, missing or 0 = not shaped:
+#
+#   /var/lib/rpiap/env/sqm_<interface>_upload
+#   /var/lib/rpiap/env/sqm_<interface>_download
+#
+# Also run by 90-udhcpc.py when it falls back to another uplink.
+
+ifname=$1
+phase=$2
+basename="`basename $0`"
+env="${RPIAP_ENV_DIR:-/var/lib/rpiap/env}"
+ifb="`printf 'ifb4%.11s' "${ifname}"`"
+
+if grep -Fxq -- "${ifname}" "${env}/lan"; then
+  # ifname is in LAN configuration
+  exit 0
+fi
+
+log() {
+  text=$1
+  echo "${basename}: INFO: WAN ${ifname}: ${phase}: ${text}"
+}
+
+# bandwidth setting in kbit/s, non-numeric values count as 0
+setting() {
+  value="`cat "${env}/$1" 2>/dev/null`"
+  case "${value}" in
+    ''|*[!0-9]*) value=0 ;;
+  esac
+  echo "${value}"
+}
+
+# shape device rate(kbit/s) cake-options, prints the qdisc used
+shape() {
+  dev=$1
+  rate=$2
+  options=$3
+  if tc qdisc replace dev "${dev}" root cake bandwidth "${rate}kbit" ${options} 2>/dev/null; then
+    echo "cake"
+    return 0
+  fi
+  tc qdisc del dev "${dev}" root 2>/dev/null || :
+  tc qdisc add dev "${dev}" root handle 1: htb default 1 || return 1
+  tc class add dev "${dev}" parent 1: classid 1:1 htb rate "${rate}kbit" ceil "${rate}kbit" quantum 1514 || return 1
+  if tc qdisc add dev "${dev}" parent 1:1 fq_codel 2>/dev/null; then
+    echo "htb+fq_codel"
+    return 0
+  fi
+  # no AQM: at least keep the queue short, ~100 ms of full size packets
+  limit=$((rate / 120))
+  [ "${limit}" -ge 10 ] || limit=10
+  tc qdisc add dev "${dev}" parent 1:1 pfifo limit "${limit}" || return 1
+  echo "htb+pfifo"
+}
+
+# redirect all ingress traffic of ifname to the ifb (u32 when matchall is not available)
+redirect() {
+  tc qdisc add dev "${ifname}" handle ffff: ingress || return 1
+  tc filter add dev "${ifname}" parent ffff: protocol all prio 10 matchall action mirred egress redirect dev "${ifb}" 2>/dev/null ||
+    tc filter add dev "${ifname}" parent ffff: protocol all prio 10 u32 match u32 0 0 action mirred egress redirect dev "${ifb}"
+}
+
+clear() {
+  tc qdisc del dev "${ifname}" root 2>/dev/null || :
+  tc qdisc del dev "${ifname}" ingress 2>/dev/null || :
+  ip link del "${ifb}" 2>/dev/null || :
+}
+
+if [ x"${phase}" = xup ]; then
+  upload="`setting "sqm_${ifname}_upload"`"
+  download="`setting "sqm_${ifname}_download"`"
+
+  clear
+
+  if [ "${upload}" -gt 0 ]; then
+    # nat: fairness between LAN hosts behind the masquerade
+    if qdisc="`shape "${ifname}" "${upload}" "besteffort dual-srchost nat"`"; then
+      log "upload shaped to ${upload} kbit/s (${qdisc})"
+    fi
+  fi
+
+  if [ "${download}" -gt 0 ]; then
+    if ip link add name "${ifb}" type ifb && ip link set "${ifb}" up &&
+       redirect &&
+       qdisc="`shape "${ifb}" "${download}" "besteffort dual-dsthost nat ingress"`"; then
+      log "download shaped to ${download} kbit/s via ${ifb} (${qdisc})"
+    else
+      tc qdisc del dev "${ifname}" ingress 2>/dev/null || :
+      ip link del "${ifb}" 2>/dev/null || :
+      echo "${basename}: ERROR: WAN ${ifname}: ${phase}: cannot shape download via ${ifb}"
+    fi
+  fi
+
+  if [ "${upload}" -eq 0 ] && [ "${download}" -eq 0 ]; then
+    log "not shaped"
+  fi
+fi
+
+if [ x"${phase}" = xdown ]; then
+  clear
+fi
+
+exit 0
@@ -3,12 +3,14 @@
 import os
 import sys
 import logging
+import subprocess
 
 
 # settings
 UDHCPC_ENV="/var/lib/rpiap/service/udhcpc/env/IFACE"
 UDHCPC_CONTROL="/var/lib/rpiap/service/udhcpc/supervise/control"
 LAN_ENV="/var/lib/rpiap/env/lan"
+SQM_STAGE=os.path.join(os.path.dirname(os.path.abspath(__file__)), "60-sqm.sh")
 
 
 def lan_interfaces() -> [str]:
@@ -42,6 +44,15 @@ def udhcpc_up(interface: str) -> None:
         f.write("tu")
 
 
+def sqm_apply(interface: str) -> None:
+    """
+    re-apply SQM shaping of the interface (settings may have changed since it came up)
+    """
+
+    if os.path.exists(SQM_STAGE):
+        subprocess.run([SQM_STAGE, interface, "up"])
+
+
 def udhcpc_down() -> None:
     """
     """
@@ -109,6 +120,7 @@ if __name__ == "__main__":
                 else:
                     if interface == activeinterface:
                         bkiface = bkinterfaces[0]
+                        sqm_apply(bkiface)
                         udhcpc_up(bkiface)
                         log(f"falling back to {bkiface}, and running udhcpc on {bkiface}")
                     else:
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+
+"""
+Local DNS benchmark: replays a query mix against a resolver, the upstream is a
+stub answering every A/AAAA query after a delay (and SERVFAIL for a fraction).
+
+  dns-bench.py stub --listen 127.0.0.2:53 --delay 30 --servfail 0.02
+  dns-bench.py replay --resolver 127.0.0.1:53 --queries 5000 --names 500
+
+  dns-bench.py run --dqcache /usr/sbin/dqcache      # as root
+    runs dqcache (forward only) on 127.0.0.1 with the stub on 127.0.0.2 as its
+    upstream, replays the mix and reports the resolver's metrics parsed from
+    its log by www/dnsmetrics.py next to the client side latencies
+
+Names are chosen with Zipf-like popularity, so popular names are answered
+from the cache after the first miss, and the short TTL of the stub makes some
+of them expire again during the run.
+"""
+
+import os
+import sys
+import time
+import random
+import socket
+import shutil
+import signal
+import struct
+import argparse
+import tempfile
+import threading
+import subprocess
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "www"))
+from dnsmetrics import DnsMetrics, TAI64_BASE  # noqa: E402
+
+QTYPE_A = 1
+QTYPE_AAAA = 28
+RCODE_SERVFAIL = 2
+
+
+def address(value: str) -> tuple:
+    host, _, port = value.rpartition(":")
+    return host, int(port)
+
+
+def encode_name(name: str) -> bytes:
+    return b"".join(bytes([len(label)]) + label.encode() for label in name.rstrip(".").split(".")) + b"\0"
+
+
+def query_packet(qid: int, name: str, qtype: int) -> bytes:
+    return struct.pack("!HHHHHH", qid, 0x0100, 1, 0, 0, 0) + encode_name(name) + struct.pack("!HH", qtype, 1)
+
+
+def question_end(packet: bytes) -> int:
+    pos = 12
+    while packet[pos]:
+        pos += packet[pos] + 1
+    return pos + 5
+
+
+def stub(listen: tuple, delay: float, servfail: float, ttl: int) -> None:
+    """
+    answer A/AAAA queries after delay ms (in a thread per query), SERVFAIL for a fraction of them
+    """
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(listen)
+
+    def answer(packet: bytes, client: tuple) -> None:
+        time.sleep(random.uniform(0.5, 1.5) * delay / 1000)
+        qid, flags = struct.unpack("!HH", packet[:4])
+        end = question_end(packet)
+        qtype = struct.unpack("!H", packet[end - 4:end - 2])[0]
+        question = packet[12:end]
+        if random.random() < servfail:
+            reply = struct.pack("!HHHHHH", qid, 0x8180 | (flags & 0x0100) | RCODE_SERVFAIL, 1, 0, 0, 0) + question
+        elif qtype in (QTYPE_A, QTYPE_AAAA):
+            if qtype == QTYPE_A:
+                rdata = bytes([192, 0, 2, random.randrange(1, 255)])
+            else:
+                rdata = bytes.fromhex("20010db8") + bytes(11) + bytes([random.randrange(1, 255)])
+            record = struct.pack("!HHHIH", 0xc00c, qtype, 1, ttl, len(rdata)) + rdata
+            reply = struct.pack("!HHHHHH", qid, 0x8180 | (flags & 0x0100), 1, 1, 0, 0) + question + record
+        else:
+            reply = struct.pack("!HHHHHH", qid, 0x8180 | (flags & 0x0100), 1, 0, 0, 0) + question
+        sock.sendto(reply, client)
+
+    while True:
+        packet, client = sock.recvfrom(512)
+        if len(packet) > 12:
+            threading.Thread(target=answer, args=(packet, client), daemon=True).start()
+
+
+def replay(resolver: tuple, queries: int, names: int, rate: float, timeout: float) -> dict:
+    """
+    send the query mix at rate queries/s, return latencies in ms and counts
+    """
+
+    weights = [1 / (rank + 1) for rank in range(names)]
+    mix = random.choices(range(names), weights=weights, k=queries)
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.connect(resolver)
+    sent = {}
+    latencies = []
+    servfails = 0
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def receive() -> None:
+        nonlocal servfails
+        sock.settimeout(0.2)
+        while not done.is_set():
+            try:
+                packet = sock.recv(512)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            qid, flags = struct.unpack("!HH", packet[:4])
+            with lock:
+                start = sent.pop(qid, None)
+            if start is None:
+                continue
+            latencies.append((time.monotonic() - start) * 1000)
+            if flags & 0xf == RCODE_SERVFAIL:
+                servfails += 1
+
+    receiver = threading.Thread(target=receive, daemon=True)
+    receiver.start()
+    start = time.monotonic()
+    for number, rank in enumerate(mix):
+        # ids are reused after 65536 queries, old ones have timed out by then
+        qid = number & 0xffff
+        qtype = QTYPE_AAAA if rank % 4 == 3 else QTYPE_A
+        with lock:
+            sent[qid] = time.monotonic()
+        sock.send(query_packet(qid, f"host{rank}.bench.example", qtype))
+        pause = start + (number + 1) / rate - time.monotonic()
+        if pause > 0:
+            time.sleep(pause)
+    deadline = time.monotonic() + timeout
+    while sent and time.monotonic() < deadline:
+        time.sleep(0.05)
+    done.set()
+    receiver.join()
+    sock.close()
+
+    latencies.sort()
+    return {
+        "queries": queries,
+        "answered": len(latencies),
+        "lost": len(sent),
+        "servfails": servfails,
+        "p50": percentile(latencies, 0.5),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+        "mean": statistics.mean(latencies) if latencies else None,
+    }
+
+
+def percentile(samples: list, fraction: float):
+    if not samples:
+        return None
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def ms(value) -> str:
+    return "--" if value is None else f"{value:.1f} ms"
+
+
+def tai64n(now: float) -> str:
+    seconds = int(now)
+    return f"@{TAI64_BASE + seconds:016x}{int((now - seconds) * 1e9):08x}"
+
+
+def run(args: argparse.Namespace) -> None:
+    """
+    dqcache (forward only) with the stub as upstream, log timestamped like multilog t
+    """
+
+    if os.geteuid() != 0:
+        sys.exit("dns-bench.py: run must be started as root (dqcache chroots and drops privileges)")
+    resolver = ("127.0.0.1", 53)
+    upstream = ("127.0.0.2", 53)
+    root = tempfile.mkdtemp(prefix="dns-bench-")
+    stub_process = None
+    dqcache = None
+    try:
+        os.makedirs(os.path.join(root, "servers"))
+        os.makedirs(os.path.join(root, "dump"))
+        with open(os.path.join(root, "servers", "@"), "w") as f:
+            f.write(f"{upstream[0]}\n")
+
+        stub_process = subprocess.Popen([sys.executable, os.path.abspath(__file__), "stub",
+                                         "--listen", f"{upstream[0]}:{upstream[1]}", "--delay", str(args.delay),
+                                         "--servfail", str(args.servfail), "--ttl", str(args.ttl)])
+        env = dict(os.environ, IP=resolver[0], ROOT=root, CACHESIZE=str(args.cachesize), FORWARDONLY="yes",
+                   OKCLIENT="1", UID="65534", GID="65534")
+        dqcache = subprocess.Popen([args.dqcache], env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        log = []
+
+        def read_log() -> None:
+            for line in dqcache.stdout:
+                log.append(f"{tai64n(time.time())} {line.decode('utf-8', errors='replace').rstrip()}")
+
+        reader = threading.Thread(target=read_log, daemon=True)
+        reader.start()
+        time.sleep(0.5)
+
+        result = replay(resolver, args.queries, args.names, args.rate, args.timeout)
+        # the log is read after the last answers
+        time.sleep(0.5)
+        dqcache.terminate()
+        dqcache.wait()
+        reader.join(1)
+
+        metrics = DnsMetrics()
+        for line in log:
+            metrics.line(line)
+        report(result, metrics.snapshot())
+    finally:
+        for process in (dqcache, stub_process):
+            if process is not None and process.poll() is None:
+                process.send_signal(signal.SIGTERM)
+                process.wait()
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def report(result: dict, snapshot: dict = None) -> None:
+    print(f"client:   {result['queries']} queries, {result['answered']} answered, {result['lost']} lost,"
+          f" {result['servfails']} servfail, p50 {ms(result['p50'])}, p95 {ms(result['p95'])},"
+          f" p99 {ms(result['p99'])}")
+    if snapshot is None:
+        return
+    totals = snapshot["totals"]
+    hit_rate = "--" if totals["hit_rate"] is None else f"{totals['hit_rate'] * 100:.1f}%"
+    print(f"resolver: {totals['queries']} queries, hit rate {hit_rate}, {totals['servfails']} servfail,"
+          f" p50 {ms(totals['latency_p50'])}, p95 {ms(totals['latency_p95'])},"
+          f" upstream p50 {ms(totals['upstream_p50'])}, p95 {ms(totals['upstream_p95'])}")
+    for upstream in snapshot["upstreams"]:
+        print(f"upstream: {upstream['server']} {upstream['answers']} answers, {upstream['servfails']} servfail,"
+              f" p50 {ms(upstream['p50'])}, p95 {ms(upstream['p95'])}")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="replay a DNS query mix against a resolver with a stub upstream")
+    parser.add_argument("mode", choices=["stub", "replay", "run"])
+    parser.add_argument("--listen", type=address, default=("127.0.0.2", 53), help="stub address ip:port")
+    parser.add_argument("--resolver", type=address, default=("127.0.0.1", 53), help="resolver address ip:port")
+    parser.add_argument("--delay", type=float, default=30, help="stub answer delay in ms")
+    parser.add_argument("--servfail", type=float, default=0.02, help="fraction of stub answers that are SERVFAIL")
+    parser.add_argument("--ttl", type=int, default=30, help="TTL of stub answers")
+    parser.add_argument("--queries", type=int, default=5000, help="queries to replay")
+    parser.add_argument("--names", type=int, default=500, help="distinct names in the mix")
+    parser.add_argument("--rate", type=float, default=200, help="queries per second")
+    parser.add_argument("--timeout", type=float, default=3, help="seconds to wait for the last answers")
+    parser.add_argument("--dqcache", default="/usr/sbin/dqcache", help="dqcache binary (run)")
+    parser.add_argument("--cachesize", type=int, default=10000000, help="CACHESIZE of dqcache (run)")
+    args = parser.parse_args()
+
+    try:
+        if args.mode == "stub":
+            stub(args.listen, args.delay, args.servfail, args.ttl)
+        elif args.mode == "replay":
+            report(replay(args.resolver, args.queries, args.names, args.rate, args.timeout))
+        else:
+            run(args)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+
+"""
+DNS prefetch sidecar of dqcache: keeps popular names in the cache.
+
+Follows the dqcache log (see www/dnsmetrics.py): 'query' lines of clients
+make a name popular (score decaying with POPULARITY_HALFLIFE), 'rr' and
+'nodata' lines give the TTL of its answer. dqcache answers from the cache
+until the TTL runs out and has no refresh of its own, so right after a top
+name expired the sidecar asks dqcache for it. dqcache fetches it upstream,
+and the next client is answered from the cache instead of paying the lookup.
+
+Prefetch queries are limited by a budget (queries per hour, token bucket),
+so metered uplinks are not drained. Settings (re-read every minute):
+
+  /var/lib/rpiap/env/dns_prefetch_budget   queries per hour, 0 = disabled (default 300)
+  /var/lib/rpiap/env/dns_prefetch_top      number of popular names kept (default 100)
+
+  dns-prefetch.py [--log FILE] [--resolver IP] [-v]
+"""
+
+import os
+import sys
+import math
+import time
+import errno
+import random
+import select
+import socket
+import struct
+import logging
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "www"))
+from dnsmetrics import DnsMetricsCollector, parse_tai64n, LOG_FILE  # noqa: E402
+
+# settings
+ENV_DIR="/var/lib/rpiap/env"
+DQCACHE_IP_FILE="/etc/rpiap/dqcache/env/IP"
+DEFAULT_BUDGET=300
+DEFAULT_TOP=100
+POPULARITY_HALFLIFE=3600
+# at least this many (decayed) queries to be prefetched
+MIN_SCORE=2
+# prefetch this long after the expiry (dqcache answers from the cache until then)
+PREFETCH_DELAY=0.2
+# names expired longer ago are not popular any more
+PREFETCH_WINDOW=30
+# answers with shorter TTLs are not worth the budget
+MIN_TTL=10
+# an unanswered prefetch is retried after this
+RETRY=10
+MAX_NAMES=10000
+TICK=1
+SETTINGS_INTERVAL=60
+REPORT_INTERVAL=600
+
+TYPES = {"a": 1, "ns": 2, "cname": 5, "soa": 6, "ptr": 12, "mx": 15, "txt": 16, "aaaa": 28, "srv": 33}
+QTYPE_CNAME = 5
+# only names clients ask for addresses of are prefetched
+PREFETCH_TYPES = (1, 28)
+
+
+def qtype(value: str) -> int:
+    """Record type as logged, a number or a mnemonic"""
+    if value.isdigit():
+        return int(value)
+    return TYPES.get(value.lower(), 0)
+
+
+def read_setting(name: str, default: int) -> int:
+    try:
+        with open(os.path.join(ENV_DIR, name)) as f:
+            return max(0, int(f.read().strip()))
+    except (OSError, ValueError):
+        return default
+
+
+def query_packet(qid: int, name: str, qtype: int) -> bytes:
+    labels = [label for label in name.rstrip(".").split(".") if label]
+    qname = b"".join(bytes([len(label)]) + label.encode() for label in labels) + b"\0"
+    return struct.pack("!HHHHHH", qid, 0x0100, 1, 0, 0, 0) + qname + struct.pack("!HH", qtype, 1)
+
+
+class Popularity:
+    """Popular (name, type) keys and the expiry of their cached answers, fed with dqcache log lines."""
+
+    def __init__(self, own_port: int = 0):
+        self.own_port = own_port
+        # key -> [score, updated]
+        self.scores = {}
+        # key -> expiry
+        self.expires = {}
+        # CNAME target -> name
+        self.aliases = {}
+        # key -> asked, prefetches in flight
+        self.inflight = {}
+        self.decay = math.log(2) / POPULARITY_HALFLIFE
+
+    def score(self, key: tuple, now: float) -> float:
+        score, updated = self.scores.get(key, (0, now))
+        return score * math.exp(-self.decay * (now - updated))
+
+    def line(self, line: str) -> None:
+        fields = line.split()
+        now = None
+        if fields and fields[0].startswith("@"):
+            now = parse_tai64n(fields.pop(0))
+        if now is None:
+            now = time.time()
+        if not fields:
+            return
+        kind = fields[0]
+
+        if kind == "query" and len(fields) >= 5:
+            # client is ip:port:id in hex, own prefetches are not popularity
+            client = fields[2].split(":")
+            if len(client) >= 2 and client[1] == f"{self.own_port:04x}":
+                return
+            key = (fields[4].lower().rstrip("."), qtype(fields[3]))
+            if key[1] not in PREFETCH_TYPES:
+                return
+            self.scores[key] = [self.score(key, now) + 1, now]
+            if len(self.scores) > MAX_NAMES:
+                self.prune(now)
+        elif kind in ("rr", "nodata") and len(fields) >= 5:
+            try:
+                ttl = int(fields[2])
+            except ValueError:
+                return
+            rtype = qtype(fields[3])
+            name = fields[4].lower().rstrip(".")
+            if rtype == QTYPE_CNAME and len(fields) >= 6:
+                self.aliases[fields[5].lower().rstrip(".")] = name
+                if len(self.aliases) > MAX_NAMES:
+                    self.aliases.pop(next(iter(self.aliases)))
+            # the answer of name expires with its first record, also through CNAMEs pointing to it
+            for _ in range(8):
+                for key in ((name, rtype),) if rtype != QTYPE_CNAME else ((name, t) for t in PREFETCH_TYPES):
+                    expires = self.expires.get(key)
+                    if ttl < MIN_TTL:
+                        self.expires.pop(key, None)
+                    elif expires is None or expires <= now or now + ttl < expires:
+                        self.expires[key] = now + ttl
+                    self.inflight.pop(key, None)
+                if name not in self.aliases:
+                    break
+                name = self.aliases[name]
+
+    def prune(self, now: float) -> None:
+        """Forget the least popular fifth of the names"""
+        keys = sorted(self.scores, key=lambda key: self.score(key, now))
+        for key in keys[:len(keys) // 5]:
+            self.scores.pop(key)
+            self.expires.pop(key, None)
+
+    def due(self, now: float, top: int) -> list:
+        """Top names whose cached answer just expired, most popular first"""
+        popular = sorted(((self.score(key, now), key) for key in self.scores), reverse=True)[:top]
+        result = []
+        for score, key in popular:
+            if score < MIN_SCORE:
+                break
+            expires = self.expires.get(key)
+            if expires is None or not (expires + PREFETCH_DELAY <= now < expires + PREFETCH_WINDOW):
+                continue
+            asked = self.inflight.get(key)
+            if asked is not None and now - asked < RETRY:
+                continue
+            result.append(key)
+        return result
+
+
+class Budget:
+    """Token bucket of queries per hour"""
+
+    def __init__(self, per_hour: int):
+        self.set(per_hour)
+        self.tokens = min(1.0, float(per_hour))
+        self.updated = time.monotonic()
+
+    def set(self, per_hour: int) -> None:
+        self.per_hour = per_hour
+        # burst of a tenth of the hour
+        self.capacity = max(1.0, per_hour / 10)
+
+    def take(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.per_hour / 3600)
+        self.updated = now
+        if self.per_hour <= 0 or self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+def prefetch(args: argparse.Namespace) -> None:
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.connect((args.resolver, 53))
+    sock.setblocking(False)
+    popularity = Popularity(sock.getsockname()[1])
+    collector = DnsMetricsCollector(args.log, metrics=popularity)
+    budget = Budget(read_setting("dns_prefetch_budget", DEFAULT_BUDGET))
+    top = read_setting("dns_prefetch_top", DEFAULT_TOP)
+    logging.info(f"prefetching top {top} names via {args.resolver}, budget {budget.per_hour} queries/hour")
+
+    settings_read = time.monotonic()
+    reported = time.monotonic()
+    sent = skipped = 0
+    error = ""
+    while True:
+        try:
+            collector.read()
+            error = ""
+        except OSError as e:
+            if str(e) != error:
+                logging.warning(f"cannot read {args.log}: {e}")
+            error = str(e)
+            collector.close()
+
+        now = time.time()
+        for key in popularity.due(now, top):
+            if not budget.take():
+                skipped += 1
+                # not retried before RETRY, the budget refills slowly
+                popularity.inflight[key] = now
+                continue
+            name, rtype = key
+            try:
+                sock.send(query_packet(random.randrange(65536), name, rtype))
+            except OSError as e:
+                if e.errno not in (errno.ECONNREFUSED, errno.EAGAIN):
+                    logging.warning(f"cannot send query to {args.resolver}: {e}")
+                break
+            popularity.inflight[key] = now
+            sent += 1
+            logging.debug(f"prefetch {name} type {rtype}")
+
+        # answers are not needed, the log tells the new expiry
+        while select.select([sock], [], [], 0)[0]:
+            try:
+                sock.recv(4096)
+            except OSError:
+                break
+
+        if time.monotonic() - settings_read >= SETTINGS_INTERVAL:
+            budget.set(read_setting("dns_prefetch_budget", DEFAULT_BUDGET))
+            top = read_setting("dns_prefetch_top", DEFAULT_TOP)
+            settings_read = time.monotonic()
+        if time.monotonic() - reported >= REPORT_INTERVAL:
+            logging.info(f"prefetched {sent}, skipped {skipped} (budget {budget.per_hour}/hour),"
+                         f" tracking {len(popularity.scores)} names")
+            sent = skipped = 0
+            reported = time.monotonic()
+        time.sleep(TICK)
+
+
+def resolver_ip() -> str:
+    try:
+        with open(DQCACHE_IP_FILE) as f:
+            return f.read().strip() or "127.0.0.1"
+    except OSError:
+        return "127.0.0.1"
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="prefetch popular names into dqcache before clients miss them")
+    parser.add_argument("--log", default=os.environ.get("RPIAP_DQCACHE_LOG") or LOG_FILE, help="dqcache log")
+    parser.add_argument("--resolver", default=resolver_ip(), help="dqcache address")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(format="dns-prefetch.py: %(levelname)s: %(message)s",
+                        level=logging.DEBUG if args.verbose else logging.INFO)
+    try:
+        prefetch(args)
+    except KeyboardInterrupt:
+        pass
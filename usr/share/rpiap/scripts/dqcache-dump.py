@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+
+"""
+Runs dqcache as a child and manages its cache dump ($ROOT/dump/dnsdata, written
+by dqcache on SIGALRM and loaded when it starts):
+
+- graceful stop: on SIGTERM (svc -t, svc -d, WAN change in udhcpc.sh) the cache
+  is dumped first, then dqcache is stopped
+- adaptive timer: dumped when the cache churned by DUMP_CHURN of CACHESIZE
+  since the last dump (at most every MIN_INTERVAL), at least every MAX_INTERVAL
+  while it is used
+- warm start: the dump found at start is checked and the hit rate of the first
+  WARMUP seconds is compared to the steady hit rate of the previous run
+
+dqcache log lines are passed through to stdout unchanged. 'query' lines count
+as queries; as in www/dnsmetrics.py a query is a cache hit when it is answered
+right away ('query N', only 'cached' lines, 'sent N'; no 'tx' upstream). The
+second field of 'stats' lines is the cache motion in bytes. Metrics are kept
+in METRICS_FILE:
+
+  dqcache-dump.py /usr/sbin/dqcache
+  dqcache-dump.py --status
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import selectors
+import subprocess
+
+# settings
+METRICS_FILE="/var/cache/rpiap/dqcache.json"
+DUMP_CHURN=0.1
+MIN_INTERVAL=300
+MAX_INTERVAL=3600
+DUMP_TIMEOUT=10
+WARMUP=300
+# bytes of cache motion per miss, when dqcache does not log stats
+MISS_SIZE=256
+CHECK_INTERVAL=1
+
+
+class DumpManager:
+
+    def __init__(self, root: str, cachesize: int):
+        self.dump = os.path.join(root, "dump", "dnsdata")
+        self.threshold = max(1, int(cachesize * DUMP_CHURN))
+        self.started = time.time()
+        self.last_dump = time.time()
+        self.dump_requested = None
+        self.dumps = 0
+        self.motion = 0
+        self.motion_at_dump = 0
+        self.stats_seen = False
+        self.misses_at_dump = 0
+        self.queries = 0
+        self.hits = 0
+        # query answered right away when sent NUM follows
+        self.fresh = None
+        self.warmup = None
+        self.previous = load_metrics()
+        self.start = self.check_dump()
+
+    def check_dump(self) -> dict:
+        """
+        describe the dump dqcache starts with
+        """
+
+        try:
+            st = os.stat(self.dump)
+        except OSError:
+            log("cold start: no cache dump")
+            return {"warm": False, "size": 0, "age": None}
+        age = int(time.time() - st.st_mtime)
+        if st.st_size == 0:
+            log("cold start: cache dump is empty")
+            return {"warm": False, "size": 0, "age": age}
+        log(f"warm start: cache dump {st.st_size} bytes, {age // 60} min old")
+        return {"warm": True, "size": st.st_size, "age": age}
+
+    def dump_mtime(self) -> float:
+        try:
+            return os.stat(self.dump).st_mtime
+        except OSError:
+            return 0
+
+    def line(self, line: str) -> None:
+        fields = line.split()
+        if not fields:
+            return
+        kind = fields[0]
+        if kind == "query":
+            self.queries += 1
+            self.fresh = fields[1] if len(fields) > 1 else None
+            return
+        if kind == "cached":
+            # one line per cached record (NS, glue, CNAME, ...) of the query
+            return
+        if kind == "sent":
+            if len(fields) > 1 and fields[1] == self.fresh:
+                self.hits += 1
+            self.fresh = None
+            return
+        self.fresh = None
+        if kind == "stats" and len(fields) > 2:
+            try:
+                self.motion = int(fields[2])
+                self.stats_seen = True
+            except ValueError:
+                pass
+
+    def churn(self) -> int:
+        if self.stats_seen:
+            return self.motion - self.motion_at_dump
+        misses = self.queries - self.hits
+        return (misses - self.misses_at_dump) * MISS_SIZE
+
+    def dump_due(self) -> str:
+        """
+        reason to dump now, '' when not due
+        """
+
+        if self.dump_requested is not None:
+            return ""
+        since = time.time() - self.last_dump
+        if since >= MIN_INTERVAL and self.churn() >= self.threshold:
+            return "cache churn"
+        if since >= MAX_INTERVAL and self.churn() > 0:
+            return "timer"
+        return ""
+
+    def dump_started(self) -> None:
+        self.dump_requested = (time.time(), self.dump_mtime())
+
+    def dump_done(self) -> bool:
+        """
+        True when the dump requested by dump_started was written
+        """
+
+        if self.dump_requested is None:
+            return False
+        requested, mtime = self.dump_requested
+        if self.dump_mtime() == mtime:
+            if time.time() - requested > DUMP_TIMEOUT:
+                log("cache dump not written", "WARNING")
+                self.dump_requested = None
+            return False
+        self.dump_requested = None
+        self.dumps += 1
+        self.last_dump = time.time()
+        self.motion_at_dump = self.motion
+        self.misses_at_dump = self.queries - self.hits
+        return True
+
+    def tick(self) -> None:
+        if self.warmup is None and time.time() - self.started >= WARMUP:
+            self.warmup = {"queries": self.queries, "hits": self.hits}
+
+    def metrics(self) -> dict:
+        previous_rate = (self.previous or {}).get("hit_rate")
+        warmup = self.warmup or {"queries": self.queries, "hits": self.hits}
+        warmup_rate = hit_rate(warmup["hits"], warmup["queries"])
+        if self.warmup is not None:
+            steady_rate = hit_rate(self.hits - warmup["hits"], self.queries - warmup["queries"])
+        else:
+            steady_rate = None
+        recovered = None
+        if warmup_rate is not None and previous_rate:
+            recovered = warmup_rate / previous_rate
+        return {
+            "started": int(self.started),
+            "updated": int(time.time()),
+            "start": self.start,
+            "queries": self.queries,
+            "hits": self.hits,
+            "warmup_hit_rate": warmup_rate,
+            "warmup_complete": self.warmup is not None,
+            # steady state (after the warmup), the next run compares its warmup to it
+            "hit_rate": steady_rate if steady_rate is not None else previous_rate,
+            "previous_hit_rate": previous_rate,
+            "recovered": recovered,
+            "dumps": self.dumps,
+            "last_dump": int(self.last_dump) if self.dumps else None,
+            "churn": self.churn(),
+            "churn_threshold": self.threshold,
+        }
+
+    def save(self) -> None:
+        try:
+            os.makedirs(os.path.dirname(METRICS_FILE), exist_ok=True)
+            tmp = f"{METRICS_FILE}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(self.metrics(), f)
+            os.replace(tmp, METRICS_FILE)
+        except OSError as e:
+            log(f"cannot write {METRICS_FILE}: {e}", "WARNING")
+
+
+def hit_rate(hits: int, queries: int):
+    if queries <= 0:
+        return None
+    return hits / queries
+
+
+def load_metrics() -> dict:
+    try:
+        with open(METRICS_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def log(text: str, level: str = "INFO") -> None:
+    print(f"dqcache-dump.py: {level}: {text}", flush=True)
+
+
+def run(argv: list) -> int:
+
+    manager = DumpManager(os.environ.get("ROOT", "."), int(os.environ.get("CACHESIZE", "1000000")))
+    child = subprocess.Popen(argv, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+
+    def dump(reason: str) -> None:
+        if manager.dump_requested is None:
+            log(f"dumping cache ({reason})")
+            child.send_signal(signal.SIGALRM)
+            manager.dump_started()
+
+    stop = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.append(signum))
+    # svc -a still dumps on demand
+    signal.signal(signal.SIGALRM, lambda signum, frame: dump("requested"))
+
+    selector = selectors.DefaultSelector()
+    selector.register(child.stdout, selectors.EVENT_READ)
+    buf = b""
+    saved = 0
+    stopping = False
+
+    while True:
+        for key, _ in selector.select(CHECK_INTERVAL):
+            data = os.read(child.stdout.fileno(), 65536)
+            if not data:
+                selector.unregister(child.stdout)
+                break
+            sys.stdout.buffer.write(data)
+            sys.stdout.buffer.flush()
+            buf += data
+            *lines, buf = buf.split(b"\n")
+            for line in lines:
+                manager.line(line.decode("utf-8", errors="replace"))
+
+        if child.poll() is not None:
+            break
+
+        if stop and not stopping:
+            stopping = True
+            dump("stop")
+
+        if manager.dump_done():
+            log("cache dumped")
+        if stopping and manager.dump_requested is None:
+            child.terminate()
+            child.wait()
+            break
+
+        reason = manager.dump_due()
+        if reason and not stopping:
+            dump(reason)
+
+        manager.tick()
+        if time.time() - saved >= 60:
+            manager.save()
+            saved = time.time()
+
+    manager.save()
+    if stopping:
+        return 0
+    return child.returncode if child.returncode >= 0 else 111
+
+
+def status() -> int:
+    metrics = load_metrics()
+    if metrics is None:
+        print(f"no metrics in {METRICS_FILE}")
+        return 1
+    print(json.dumps(metrics, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) < 2:
+        sys.exit("usage: dqcache-dump.py dqcache [args] | --status")
+    if sys.argv[1] == "--status":
+        sys.exit(status())
+    sys.exit(run(sys.argv[1:]))
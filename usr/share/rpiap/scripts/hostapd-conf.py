@@ -1,7 +1,53 @@
 #!/usr/bin/env python3
 
-import hashlib, binascii, sys, os
-from jinja2 import Template
+import hashlib, hmac, binascii, json, sys, os
+from typing import Optional
+
+# cache of the derived PSK and of the rendered config (root only)
+# entries are keyed by HMAC with a random local key, so the cache does not
+# reveal anything about the password without that key
+CACHE_DIR = "/var/lib/rpiap/hostapd"
+CACHE_KEY = os.path.join(CACHE_DIR, "key")
+CACHE_PSK = os.path.join(CACHE_DIR, "psk")
+# first line: HMAC of template and inputs, then the config
+CACHE_CONF = os.path.join(CACHE_DIR, "hostapd.conf")
+
+
+def warn(text: str) -> None:
+    print(f"{os.path.basename(sys.argv[0])}: warning: {text}", file=sys.stderr)
+
+
+def read(path: str) -> Optional[bytes]:
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def write(path: str, data: bytes) -> None:
+    """Atomic write, readable by root only"""
+    tmp = f"{path}.tmp"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def cache_key() -> bytes:
+    key = read(CACHE_KEY)
+    if key is None or len(key) != 32:
+        os.makedirs(CACHE_DIR, mode=0o700, exist_ok=True)
+        key = os.urandom(32)
+        write(CACHE_KEY, key)
+    return key
+
+
+def keyed_hash(key: bytes, *values: str) -> str:
+    return hmac.new(key, json.dumps(values).encode('utf-8'), hashlib.sha256).hexdigest()
+
 
 ssid = os.getenv("hostapd_ssid")
 if ssid is None:
@@ -24,11 +70,59 @@ else:
 
 country = os.getenv("hostapd_country")
 
-psk = hashlib.pbkdf2_hmac("sha1", password.encode('utf-8'), ssid.encode('utf-8'), 4096, 32)
-psk = binascii.hexlify(psk).decode()
-
 template_content = open(sys.argv[1]).read()
+
+try:
+    key = cache_key()
+except OSError as e:
+    warn(f"cache disabled: {e}")
+    key = None
+
+# rendered config, reused when neither the template nor the inputs changed
+# a corrupt or unreadable cache file is ignored, the config is rendered again
+if key is not None:
+    conf_hmac = keyed_hash(key, template_content, ssid, password, channel, country or "")
+    try:
+        cached = (read(CACHE_CONF) or b"").decode('utf-8').partition("\n")
+        if hmac.compare_digest(cached[0], conf_hmac):
+            sys.stdout.write(cached[2])
+            sys.exit(0)
+    except (OSError, UnicodeDecodeError, TypeError, ValueError) as e:
+        warn(f"ignoring cached config: {e}")
+
+# PSK, derived only when SSID or password changed
+psk = None
+if key is not None:
+    psk_hmac = keyed_hash(key, ssid, password)
+    try:
+        cached = (read(CACHE_PSK) or b"").decode('utf-8').split()
+        if len(cached) == 2 and hmac.compare_digest(cached[0], psk_hmac):
+            # a truncated entry is derived again
+            if len(cached[1]) == 64 and int(cached[1], 16) >= 0:
+                psk = cached[1]
+    except (OSError, UnicodeDecodeError, TypeError, ValueError) as e:
+        warn(f"ignoring cached PSK: {e}")
+
+if psk is None:
+    psk = hashlib.pbkdf2_hmac("sha1", password.encode('utf-8'), ssid.encode('utf-8'), 4096, 32)
+    psk = binascii.hexlify(psk).decode()
+    if key is not None:
+        try:
+            write(CACHE_PSK, f"{psk_hmac} {psk}\n".encode())
+        except OSError as e:
+            warn(f"cannot cache PSK: {e}")
+
+from jinja2 import Template
+
 template = Template(template_content)
 output = template.render(ssid=ssid, psk=psk, channel=channel, mode=mode, country=country)
 
-print(output)
+# print() adds a newline, cache exactly what is printed
+output += "\n"
+if key is not None:
+    try:
+        write(CACHE_CONF, f"{conf_hmac}\n{output}".encode('utf-8'))
+    except OSError as e:
+        warn(f"cannot cache config: {e}")
+
+sys.stdout.write(output)
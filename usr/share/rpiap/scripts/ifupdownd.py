@@ -41,6 +41,9 @@ IFLA_IFNAME = 3
 # Attribute types (from linux/if_addr.h)
 IFA_ADDRESS = 1
 
+# seconds between checks of the trigger directory
+TRIGGER_INTERVAL = 2
+
 def rtattr_parse(data):
     """Parse TLV-encoded Netlink attributes."""
     attrs = {}
@@ -167,6 +170,25 @@ def iflist(allowed = []):
     return ret
 
 
+def triggers_get(directory: str, scripts: [str]) -> [str]:
+    """
+    link scripts named by the files in directory (each file is consumed)
+    """
+
+    if directory is None:
+        return []
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return []
+    for name in names:
+        try:
+            os.unlink(f"{directory}/{name}")
+        except OSError:
+            pass
+    return [script for script in scripts if os.path.basename(script) in names]
+
+
 def scripts_get(directory: str) -> [str]:
     """
     """
@@ -197,6 +219,10 @@ parser.add_argument('-l', '--link',
                         action='store',
                         help='direcrtory containing link up/down scripts')
 
+parser.add_argument('-t', '--trigger',
+                        action='store',
+                        help='directory of files naming link scripts to re-run for the interfaces up (settings changed)')
+
 
 args = parser.parse_args()
 
@@ -258,11 +284,18 @@ while True:
                     subprocess.run(cmd)
                 old[iface]['device'] = current[iface]['device']
 
+        # link scripts re-run after their settings changed
+        for script in triggers_get(args.trigger, linkscripts):
+            for iface in active:
+                cmd = [script, iface, 'up'] + active
+                logging.debug(f'{iface}: settings changed, running {cmd}')
+                subprocess.run(cmd)
+
     except Exception as e:
         logging.fatal('%s' % (e))
 
-    # wait for netlink event
-    r, _, _ = select.select([s], [], [])
+    # wait for netlink event, look for triggers every TRIGGER_INTERVAL seconds
+    r, _, _ = select.select([s], [], [], TRIGGER_INTERVAL if args.trigger else None)
     if len(r) > 0:
         logging.debug('netlink event')
         data = s.recv(65535)
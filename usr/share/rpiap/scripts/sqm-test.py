@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+
+"""
+Latency under load test of the WAN SQM stage (ifupdownd.link.d/60-sqm.sh)
+in network namespaces, run as root:
+
+  client --- router (lan0 | wan0) --- modem --- server
+
+The modem has a slow uplink/downlink with a large buffer (bufferbloat). UDP
+echo probes measure the round trip time idle, while downloading and while
+uploading, first without SQM and then with the router's wan0 shaped by the
+SQM stage to a fraction of the modem speed.
+
+  sqm-test.py --down 20000 --up 5000 --duration 5
+"""
+
+import os
+import sys
+import time
+import socket
+import struct
+import logging
+import argparse
+import tempfile
+import statistics
+import subprocess
+import threading
+
+# settings
+SQM_STAGE=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ifupdownd.link.d", "60-sqm.sh")
+PREFIX="sqmtest"
+NAMESPACES=["client", "router", "modem", "server"]
+SERVER_IP="10.3.0.2"
+ECHO_PORT=7007
+BULK_PORT=7008
+PROBE_INTERVAL=0.05
+# queues drain between measurements
+SETTLE=2
+CHUNK=64 * 1024
+
+
+def ns(name: str) -> str:
+    return f"{PREFIX}-{name}"
+
+
+def run(*cmd: str, check: bool = True) -> None:
+    logging.debug(" ".join(cmd))
+    subprocess.run(cmd, check=check)
+
+
+def nsrun(name: str, *cmd: str, check: bool = True) -> None:
+    run("ip", "netns", "exec", ns(name), *cmd, check=check)
+
+
+def nsspawn(name: str, *args: str) -> subprocess.Popen:
+    """
+    run this script with args in the namespace
+    """
+
+    return subprocess.Popen(["ip", "netns", "exec", ns(name), sys.executable, os.path.abspath(__file__), *args])
+
+
+def setup(down: int, up: int, buffer_ms: int) -> None:
+    """
+    create namespaces and links, modem queues are slow with large buffers
+    """
+
+    for name in NAMESPACES:
+        run("ip", "netns", "add", ns(name))
+        nsrun(name, "ip", "link", "set", "lo", "up")
+
+    links = [
+        ("client", "eth0", "10.1.0.2/24", "router", "lan0", "10.1.0.1/24"),
+        ("router", "wan0", "10.2.0.1/24", "modem", "lan0", "10.2.0.2/24"),
+        ("modem", "wan0", "10.3.0.1/24", "server", "eth0", "10.3.0.2/24"),
+    ]
+    for ns1, if1, ip1, ns2, if2, ip2 in links:
+        run("ip", "link", "add", "tmp1", "netns", ns(ns1), "type", "veth", "peer", "name", "tmp2", "netns", ns(ns2))
+        for name, tmp, ifname, ip in ((ns1, "tmp1", if1, ip1), (ns2, "tmp2", if2, ip2)):
+            nsrun(name, "ip", "link", "set", tmp, "name", ifname)
+            nsrun(name, "ip", "addr", "add", ip, "dev", ifname)
+            nsrun(name, "ip", "link", "set", ifname, "up")
+
+    nsrun("client", "ip", "route", "add", "default", "via", "10.1.0.1")
+    nsrun("router", "ip", "route", "add", "default", "via", "10.2.0.2")
+    nsrun("modem", "ip", "route", "add", "10.1.0.0/24", "via", "10.2.0.1")
+    nsrun("server", "ip", "route", "add", "default", "via", "10.3.0.1")
+    for name in ("router", "modem"):
+        nsrun(name, "sysctl", "-qw", "net.ipv4.ip_forward=1")
+
+    # modem: downlink on lan0 egress, uplink on wan0 egress
+    for ifname, rate in (("lan0", down), ("wan0", up)):
+        nsrun("modem", "tc", "qdisc", "add", "dev", ifname, "root", "tbf",
+              "rate", f"{rate}kbit", "burst", "16k", "latency", f"{buffer_ms}ms")
+
+
+def cleanup() -> None:
+    for name in NAMESPACES:
+        subprocess.run(["ip", "netns", "del", ns(name)], stderr=subprocess.DEVNULL)
+
+
+def echo_server() -> None:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("0.0.0.0", ECHO_PORT))
+    while True:
+        data, addr = sock.recvfrom(64)
+        sock.sendto(data, addr)
+
+
+def bulk_server() -> None:
+    """
+    'd' - send data until the client closes, 'u' - receive data
+    """
+
+    def handle(conn: socket.socket) -> None:
+        with conn:
+            try:
+                mode = conn.recv(1)
+                if mode == b"d":
+                    data = b"\0" * CHUNK
+                    while True:
+                        conn.sendall(data)
+                else:
+                    while conn.recv(CHUNK):
+                        pass
+            except OSError:
+                pass
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("0.0.0.0", BULK_PORT))
+    sock.listen(16)
+    while True:
+        conn, _ = sock.accept()
+        threading.Thread(target=handle, args=(conn,), daemon=True).start()
+
+
+def probe(load: str, duration: float, streams: int) -> None:
+    """
+    measure UDP round trip times with load ('idle', 'download', 'upload'), print them as one line
+    """
+
+    stop = threading.Event()
+
+    def bulk() -> None:
+        try:
+            with socket.create_connection((SERVER_IP, BULK_PORT), timeout=duration + 5) as conn:
+                conn.sendall(load[0].encode())
+                data = b"\0" * CHUNK
+                while not stop.is_set():
+                    if load == "download":
+                        conn.recv(CHUNK)
+                    else:
+                        conn.sendall(data)
+        except OSError:
+            pass
+
+    threads = []
+    if load != "idle":
+        for _ in range(streams):
+            thread = threading.Thread(target=bulk, daemon=True)
+            thread.start()
+            threads.append(thread)
+        # let the queues fill
+        time.sleep(1)
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.settimeout(PROBE_INTERVAL)
+    sent = {}
+    rtts = []
+    seq = 0
+    end = time.monotonic() + duration
+    while time.monotonic() < end:
+        seq += 1
+        sent[seq] = time.monotonic()
+        sock.sendto(struct.pack("!I", seq), (SERVER_IP, ECHO_PORT))
+        deadline = sent[seq] + PROBE_INTERVAL
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            sock.settimeout(remaining)
+            try:
+                data = sock.recv(64)
+            except socket.timeout:
+                break
+            number = struct.unpack("!I", data[:4])[0]
+            if number in sent:
+                rtts.append((time.monotonic() - sent.pop(number)) * 1000)
+    # late replies
+    sock.settimeout(1)
+    try:
+        while sent:
+            number = struct.unpack("!I", sock.recv(64)[:4])[0]
+            if number in sent:
+                rtts.append((time.monotonic() - sent.pop(number)) * 1000)
+    except socket.timeout:
+        pass
+    stop.set()
+
+    print(" ".join(f"{rtt:.2f}" for rtt in rtts), len(sent), flush=True)
+
+
+def measure(load: str, duration: float, streams: int) -> dict:
+    out = subprocess.run(["ip", "netns", "exec", ns("client"), sys.executable, os.path.abspath(__file__),
+                          "--role", "probe", "--load", load, "--duration", str(duration), "--streams", str(streams)],
+                         check=True, capture_output=True, text=True).stdout.split()
+    rtts = sorted(float(rtt) for rtt in out[:-1])
+    lost = int(out[-1])
+    if not rtts:
+        return {"p50": None, "p95": None, "loss": 100.0}
+    return {
+        "p50": statistics.median(rtts),
+        "p95": rtts[min(len(rtts) - 1, int(len(rtts) * 0.95))],
+        "loss": lost * 100 / (lost + len(rtts)),
+    }
+
+
+def sqm(envdir: str, phase: str) -> None:
+    nsrun("router", "env", f"RPIAP_ENV_DIR={envdir}", "sh", SQM_STAGE, "wan0", phase)
+
+
+def report(results: dict) -> None:
+    print(f"{'':10} {'load':10} {'p50 ms':>8} {'p95 ms':>8} {'loss %':>7}")
+    for (mode, load), result in results.items():
+        if result["p50"] is None:
+            print(f"{mode:10} {load:10} {'--':>8} {'--':>8} {result['loss']:7.1f}")
+        else:
+            print(f"{mode:10} {load:10} {result['p50']:8.1f} {result['p95']:8.1f} {result['loss']:7.1f}")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="latency under load with and without WAN SQM")
+    parser.add_argument("--down", type=int, default=20000, help="modem downlink kbit/s")
+    parser.add_argument("--up", type=int, default=5000, help="modem uplink kbit/s")
+    parser.add_argument("--buffer", type=int, default=500, help="modem buffer in ms")
+    parser.add_argument("--sqm-percent", type=int, default=90, help="SQM bandwidth, percent of the modem speed")
+    parser.add_argument("--duration", type=float, default=5, help="seconds per measurement")
+    parser.add_argument("--streams", type=int, default=4, help="parallel TCP streams of the load")
+    parser.add_argument("--role", choices=["test", "echo", "bulk", "probe"], default="test", help=argparse.SUPPRESS)
+    parser.add_argument("--load", default="idle", help=argparse.SUPPRESS)
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(format="%(filename)s: %(levelname)s: %(message)s",
+                        level=logging.DEBUG if args.verbose else logging.INFO)
+
+    if args.role == "echo":
+        echo_server()
+    elif args.role == "bulk":
+        bulk_server()
+    elif args.role == "probe":
+        probe(args.load, args.duration, args.streams)
+    else:
+        if os.geteuid() != 0:
+            sys.exit("sqm-test.py: must run as root (network namespaces)")
+        cleanup()
+        servers = []
+        try:
+            setup(args.down, args.up, args.buffer)
+            servers = [nsspawn("server", "--role", "echo"), nsspawn("server", "--role", "bulk")]
+            time.sleep(0.5)
+
+            with tempfile.TemporaryDirectory() as envdir:
+                with open(os.path.join(envdir, "lan"), "w") as f:
+                    f.write("lan0\n")
+                with open(os.path.join(envdir, "sqm_wan0_download"), "w") as f:
+                    f.write(f"{args.down * args.sqm_percent // 100}\n")
+                with open(os.path.join(envdir, "sqm_wan0_upload"), "w") as f:
+                    f.write(f"{args.up * args.sqm_percent // 100}\n")
+
+                results = {}
+                for mode in ("no SQM", "SQM"):
+                    if mode == "SQM":
+                        sqm(envdir, "up")
+                    for load in ("idle", "download", "upload"):
+                        logging.info(f"{mode}: {load}")
+                        time.sleep(SETTLE)
+                        results[(mode, load)] = measure(load, args.duration, args.streams)
+                sqm(envdir, "down")
+            report(results)
+        finally:
+            for server in servers:
+                server.kill()
+            cleanup()
@@ -9,8 +9,10 @@ if [ x"$1" = xdeconfig ]; then
   busybox ip -4 route flush dev "${interface}"
 
   # remove dns
-  rm -f '/var/lib/rpiap/service/udhcpc/var/@' || :
-  svc -t /etc/service/rpiap_dqcache
+  if [ -e '/var/lib/rpiap/service/udhcpc/var/@' ]; then
+    rm -f '/var/lib/rpiap/service/udhcpc/var/@' || :
+    svc -t /etc/service/rpiap_dqcache
+  fi
 fi
 
 if [ x"$1" = xbound ] || [ x"$1" = xrenew ]; then
@@ -24,11 +26,18 @@ if [ x"$1" = xbound ] || [ x"$1" = xrenew ]; then
     busybox ip -4 route add default via "${router}" dev "${interface}"
   fi
 
-  # update dns
+  # update dns, dqcache is restarted only when the servers changed (renewals
+  # usually keep them), it dumps its cache on stop and loads it on start
   for ns in ${dns}; do
     echo "${ns}"
-  done > '/var/lib/rpiap/service/udhcpc/var/@'
-  svc -t /etc/service/rpiap_dqcache
+  done > '/var/lib/rpiap/service/udhcpc/var/@.tmp'
+  if cmp -s '/var/lib/rpiap/service/udhcpc/var/@.tmp' '/var/lib/rpiap/service/udhcpc/var/@'; then
+    rm -f '/var/lib/rpiap/service/udhcpc/var/@.tmp'
+    echo "dns servers unchanged" >&2
+  else
+    mv -f '/var/lib/rpiap/service/udhcpc/var/@.tmp' '/var/lib/rpiap/service/udhcpc/var/@'
+    svc -t /etc/service/rpiap_dqcache
+  fi
 
   echo "IP=$ip/$subnet router=$router domain=\"$domain\" dns=\"$dns\" lease=$lease" >&2
 fi
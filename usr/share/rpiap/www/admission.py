@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Admission control for heavy endpoints
+Per-endpoint concurrency limit, per-client rate limit (token bucket) and a shared
+cap on bytes generated by in-flight requests. Requests over a limit are rejected
+immediately with 429 and Retry-After instead of queueing, so the settings and
+dashboard endpoints stay responsive while a speedtest is running.
+"""
+
+import math
+import time
+import logging
+from typing import Optional
+from fastapi.responses import JSONResponse
+from starlette.background import BackgroundTask
+
+logger = logging.getLogger(__name__)
+
+# Per-client buckets kept at most, full (idle) buckets are dropped first
+MAX_CLIENTS = 1024
+
+
+class Rejected(Exception):
+    """Request was not admitted, retry after retry_after seconds."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ByteBudget:
+    """Bytes that in-flight requests of all endpoints sharing the budget may hold."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.in_flight = 0
+
+    def reserve(self, nbytes: int) -> bool:
+        if nbytes and self.in_flight + nbytes > self.max_bytes:
+            return False
+        self.in_flight += nbytes
+        return True
+
+    def release(self, nbytes: int) -> None:
+        self.in_flight -= nbytes
+
+
+class Ticket:
+    """Admitted request, release() when its response was sent (safe to call more than once)."""
+
+    def __init__(self, limiter: "EndpointLimiter", nbytes: int):
+        self.limiter = limiter
+        self.nbytes = nbytes
+        self.released = False
+
+    def release(self) -> None:
+        if self.released:
+            return
+        self.released = True
+        self.limiter.active -= 1
+        if self.limiter.budget is not None:
+            self.limiter.budget.release(self.nbytes)
+
+
+class EndpointLimiter:
+    """Admission limits of one endpoint.
+
+    Args:
+        name: Endpoint name used in messages and logs.
+        max_concurrent: Requests served at the same time.
+        rate: Requests per second per client (token bucket refill).
+        burst: Requests a client may make at once (bucket size).
+        budget: Shared in-flight byte budget, None for endpoints not generating data.
+    """
+
+    def __init__(self, name: str, max_concurrent: int, rate: float, burst: int,
+                 budget: Optional[ByteBudget] = None):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.rate = rate
+        self.burst = burst
+        self.budget = budget
+        self.active = 0
+        # client -> [tokens, last refill time]
+        self.buckets = {}
+
+    def _take_token(self, client: str) -> float:
+        """Take one token of client, return 0 or seconds until a token is available."""
+        now = time.monotonic()
+        bucket = self.buckets.get(client)
+        if bucket is None:
+            if len(self.buckets) >= MAX_CLIENTS:
+                self._drop_idle_buckets(now)
+            bucket = self.buckets[client] = [float(self.burst), now]
+        else:
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        if bucket[0] < 1:
+            return (1 - bucket[0]) / self.rate
+        bucket[0] -= 1
+        return 0.0
+
+    def _drop_idle_buckets(self, now: float) -> None:
+        for client, (tokens, last) in list(self.buckets.items()):
+            if tokens + (now - last) * self.rate >= self.burst:
+                del self.buckets[client]
+        # all clients busy, forget the longest idle ones
+        while len(self.buckets) >= MAX_CLIENTS:
+            del self.buckets[min(self.buckets, key=lambda client: self.buckets[client][1])]
+
+    def admit(self, client: str, nbytes: int = 0) -> Ticket:
+        """Admit request of client which will generate nbytes, raise Rejected if over a limit."""
+        if self.active >= self.max_concurrent:
+            raise Rejected(f"Too many concurrent {self.name} requests", 1)
+        wait = self._take_token(client)
+        if wait:
+            raise Rejected(f"Too many {self.name} requests from {client}", wait)
+        if self.budget is not None and not self.budget.reserve(nbytes):
+            raise Rejected(f"Server busy generating {self.name} data", 1)
+        self.active += 1
+        return Ticket(self, nbytes)
+
+
+def client_id(request) -> str:
+    """Return rate limiting key of the request (client IP)."""
+    return request.client.host if request.client else ""
+
+
+def too_many_requests(rejected: Rejected) -> JSONResponse:
+    """429 response for a rejected request."""
+    logger.debug("Admission rejected: %s", rejected)
+    return JSONResponse(
+        status_code=429,
+        content={
+            "success": False,
+            "message": str(rejected),
+            "data": ""
+        },
+        headers={"Retry-After": str(max(1, math.ceil(rejected.retry_after)))}
+    )
+
+
+def release_after(response, ticket: Ticket):
+    """Release ticket once response was sent (streamed responses included)."""
+    response.background = BackgroundTask(ticket.release)
+    return response
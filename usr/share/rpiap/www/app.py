@@ -1,7 +1,11 @@
 from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
+from starlette.staticfiles import NotModifiedResponse
+from fastapi.responses import FileResponse
+from starlette.datastructures import Headers
 from starlette.middleware.sessions import SessionMiddleware
-from routers import home, test_button, test, test_ui, test_select, settings, speedtest
+from starlette.routing import Route
+from routers import home, settings, speedtest
 from routers.api import (
     infobar as api_infobar,
     successbar as api_successbar,
@@ -10,24 +14,49 @@ from routers.api import (
     settings_dns,
     settings_wlan,
     settings_wcli,
+    settings_shaping,
     settings_mode,
     settings_theme,
     speedtest as api_speedtest,
     interfaces as api_interfaces,
-    test_select as api_test_select,
 )
+from templating import templates, precompile_templates
+from assets import asset_manifest
+from stations import station_collector
+from dnsmetrics import dns_metrics_collector
 import logging
+import importlib
+import mimetypes
 import os
+import time
 import shutil
+from contextlib import contextmanager
 
-# Configure debug logging
+# Configure logging, RPIAP_LOG_LEVEL=DEBUG for development (or WARNING, ...)
 logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    level=logging.DEBUG
+    level=os.environ.get("RPIAP_LOG_LEVEL", "INFO").upper()
 )
 
 logger = logging.getLogger(__name__)
 
+# RPIAP_TEST_ROUTES=1 enables the Test pages (/test/..., /api/test/...), off by default (unauthenticated)
+TEST_ROUTES_ENABLED = os.environ.get("RPIAP_TEST_ROUTES", "0").lower() in ("1", "true", "yes")
+
+# Seconds spent in each startup step, see startup_profile.py
+startup_timings = {}
+
+
+@contextmanager
+def startup_step(name: str):
+    """Time one startup step into startup_timings."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_timings[name] = time.perf_counter() - start
+        logger.debug("Startup: %s took %.3fs", name, startup_timings[name])
+
 
 def init_run_env_dir():
     """Initialize /run/rpiap/env directory by copying from /var/lib/rpiap/env if it doesn't exist."""
@@ -67,14 +96,37 @@ class NoCacheStaticFiles(StaticFiles):
     """Custom StaticFiles with Cache-Control reponse header. """
 
     async def get_response(self, path: str, scope):
-        """Override to add proper caching headers and Not Modified responses."""
-        response = await super().get_response(path, scope)
-        response.headers["Cache-Control"] = "no-cache, must-revalidate"
-        # HTTP/1.0 compatibility
-        response.headers["Pragma"] = "no-cache"
-        response.headers["Expires"] = "-1"
+        """Override to add proper caching headers and Not Modified responses.
+
+        Fingerprinted URLs (see assets.py) never change content and are cached
+        for a year; plain URLs are revalidated with ETag. Both are served from
+        the precompressed variant the client accepts.
+        """
+        if scope["method"] not in ("GET", "HEAD"):
+            return await super().get_response(path, scope)
+
+        asset, fingerprinted = asset_manifest.lookup(path)
+        if asset is None:
+            response = await super().get_response(path, scope)
+            response.headers["Cache-Control"] = "no-cache"
+            return response
+
+        request_headers = Headers(scope=scope)
+        coding, file_path = asset.variant(request_headers.get("accept-encoding", ""))
+        headers = {
+            "ETag": f'"{asset.digest[:32]}{"-" + coding if coding else ""}"',
+            "Cache-Control": "public, max-age=31536000, immutable" if fingerprinted else "no-cache",
+            "Vary": "Accept-Encoding",
+        }
+        if coding:
+            headers["Content-Encoding"] = coding
+        response = FileResponse(file_path, headers=headers, method=scope["method"],
+                                media_type=mimetypes.guess_type(asset.path)[0] or "text/plain")
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
         return response
 
+
 # Create app without session middleware (using query parameters instead)
 app = FastAPI(
     title="UI for rpiap",
@@ -82,8 +134,69 @@ app = FastAPI(
     version="1.0.0"
 )
 
-# Initialize run env directory on app startup
-init_run_env_dir()
+
+@app.on_event("startup")
+async def load_static_data():
+    """Initialize run env, load static data tables, fingerprint static files and compile templates once at startup instead of on the first request."""
+    with startup_step("init_run_env_dir"):
+        init_run_env_dir()
+    with startup_step("countries_index"):
+        settings_wlan.countries_index.refresh()
+    with startup_step("asset_manifest"):
+        asset_manifest.build()
+    with startup_step("precompile_templates"):
+        precompile_templates()
+    with startup_step("station_collector"):
+        station_collector.start()
+    with startup_step("dns_metrics_collector"):
+        dns_metrics_collector.start()
+
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    """Stop sampling Wi-Fi stations and following the DNS log."""
+    await station_collector.stop()
+    await dns_metrics_collector.stop()
+
+
+class LazyRouters:
+    """Optional routers imported and included on the first request under one of their path prefixes.
+
+    Until then a placeholder route per prefix stands in for them; it is
+    replaced by the real routes and the request is dispatched again.
+    """
+
+    def __init__(self, app: FastAPI, prefixes: list, modules: list):
+        self.app = app
+        self.prefixes = prefixes
+        # (module name, include prefix)
+        self.modules = modules
+        self.placeholders = []
+        self.loaded = False
+
+    def install(self) -> None:
+        for prefix in self.prefixes:
+            for path in (prefix, prefix + "/{path:path}"):
+                route = Route(path, endpoint=self)
+                self.placeholders.append(route)
+                self.app.router.routes.append(route)
+
+    def load(self) -> None:
+        if self.loaded:
+            return
+        start = time.perf_counter()
+        for route in self.placeholders:
+            self.app.router.routes.remove(route)
+        for name, prefix in self.modules:
+            self.app.include_router(importlib.import_module(name).router, prefix=prefix)
+        self.loaded = True
+        logger.info("Loaded optional routers %s in %.3fs", ", ".join(name for name, _ in self.modules),
+                    time.perf_counter() - start)
+
+    async def __call__(self, scope, receive, send):
+        self.load()
+        await self.app.router(scope, receive, send)
+
 
 # Function for getting current theme from query parameter or default
 def get_current_theme(request: Request):
@@ -102,10 +215,6 @@ app.mount("/static", NoCacheStaticFiles(directory="static"), name="static")
 
 # Include routers
 app.include_router(home.router)
-app.include_router(test_button.router)
-app.include_router(test.router)
-app.include_router(test_ui.router)
-app.include_router(test_select.router)
 app.include_router(settings.router)
 app.include_router(speedtest.router)
 
@@ -117,8 +226,25 @@ app.include_router(sidebar.router)
 app.include_router(settings_dns.router)
 app.include_router(settings_wlan.router)
 app.include_router(settings_wcli.router)
+app.include_router(settings_shaping.router)
 app.include_router(settings_mode.router)
 app.include_router(settings_theme.router)
 app.include_router(api_speedtest.router, prefix="/api")
 app.include_router(api_interfaces.router, prefix="/api")
-app.include_router(api_test_select.router, prefix="/api")
+
+# WAN speedtest and history (ssl, sqlite3) are imported on first use
+LazyRouters(app, ["/api/speedtest/wan", "/api/speedtest/history"], [
+    ("routers.api.speedtest_history", "/api"),
+    ("routers.api.speedtest_wan", "/api"),
+]).install()
+
+# Test pages are only for development, imported on first use
+if TEST_ROUTES_ENABLED:
+    LazyRouters(app, ["/test", "/api/test"], [
+        ("routers.test_button", ""),
+        ("routers.test", ""),
+        ("routers.test_ui", ""),
+        ("routers.test_select", ""),
+        ("routers.api.test_select", "/api"),
+    ]).install()
+templates.env.globals["test_routes"] = TEST_ROUTES_ENABLED
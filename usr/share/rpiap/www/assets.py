@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Static assets
+Content-hashed (fingerprinted) URLs for static files and precompressed
+gzip/brotli variants, built once at startup
+"""
+
+import os
+import gzip
+import time
+import hashlib
+import logging
+from typing import Optional
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, "static")
+STATIC_URL = "/static"
+
+# Precompressed variants survive service restarts here (named by content hash)
+COMPRESSED_CACHE_DIR = "/var/cache/rpiap/static"
+
+COMPRESSIBLE_SUFFIXES = (".css", ".js", ".json", ".svg", ".html", ".txt", ".md")
+# Smaller files are not worth compressing
+MIN_COMPRESS_SIZE = 1024
+# Fingerprint length (hex digits of the SHA-256 of the content)
+FINGERPRINT_LENGTH = 12
+
+
+class Asset:
+    """One static file with its fingerprinted path and compressed variants."""
+
+    def __init__(self, path: str, full_path: str, digest: str):
+        self.path = path
+        self.full_path = full_path
+        self.digest = digest
+        root, ext = os.path.splitext(path)
+        self.fingerprinted_path = f"{root}.{digest[:FINGERPRINT_LENGTH]}{ext}"
+        # content coding -> file
+        self.variants = {}
+
+    def variant(self, accept_encoding: str):
+        """Return (content coding, file) best matching the Accept-Encoding header value.
+
+        A coding refused with q=0 is never selected, even if "*" is accepted.
+        """
+        accepted = set()
+        rejected = set()
+        for item in accept_encoding.split(","):
+            coding, *params = [part.strip() for part in item.split(";")]
+            quality = 1.0
+            for param in params:
+                name, _, value = param.partition("=")
+                if name.strip().lower() == "q":
+                    try:
+                        quality = float(value)
+                    except ValueError:
+                        quality = 0.0
+            if quality > 0:
+                accepted.add(coding.lower())
+            else:
+                rejected.add(coding.lower())
+        for coding in ("br", "gzip"):
+            if coding in rejected or coding not in self.variants:
+                continue
+            if coding in accepted or "*" in accepted:
+                return coding, self.variants[coding]
+        return None, self.full_path
+
+
+class AssetManifest:
+    """Fingerprints of all static files, looked up by plain or fingerprinted path."""
+
+    def __init__(self, static_dir: str, cache_dir: Optional[str]):
+        self.static_dir = static_dir
+        self.cache_dir = cache_dir
+        self.assets = {}
+        self.fingerprinted = {}
+
+    def build(self) -> None:
+        """Hash all static files and create missing compressed variants."""
+        start = time.monotonic()
+        cache_dir = self._usable_cache_dir()
+        assets = {}
+        for dirpath, _, filenames in os.walk(self.static_dir):
+            for filename in filenames:
+                full_path = os.path.join(dirpath, filename)
+                with open(full_path, "rb") as f:
+                    data = f.read()
+                path = os.path.relpath(full_path, self.static_dir)
+                asset = Asset(path, full_path, hashlib.sha256(data).hexdigest())
+                if cache_dir and filename.endswith(COMPRESSIBLE_SUFFIXES) and len(data) >= MIN_COMPRESS_SIZE:
+                    self._compress(asset, data, cache_dir)
+                assets[path] = asset
+
+        if cache_dir:
+            self._remove_stale(assets, cache_dir)
+        self.assets = assets
+        self.fingerprinted = {asset.fingerprinted_path: asset for asset in assets.values()}
+        logger.info("Fingerprinted %s static files in %.3fs", len(assets), time.monotonic() - start)
+
+    def _usable_cache_dir(self) -> Optional[str]:
+        if not self.cache_dir:
+            return None
+        try:
+            os.makedirs(self.cache_dir, mode=0o755, exist_ok=True)
+            if not os.access(self.cache_dir, os.W_OK):
+                raise PermissionError(f"{self.cache_dir} is not writable")
+        except OSError as e:
+            logger.warning("Precompressed static files disabled: %s", e)
+            return None
+        return self.cache_dir
+
+    def _compress(self, asset: Asset, data: bytes, cache_dir: str) -> None:
+        encoders = {"gzip": lambda data: gzip.compress(data, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            encoders["br"] = lambda data: brotli.compress(data, quality=11)
+        for coding, encode in encoders.items():
+            variant_path = os.path.join(cache_dir, f"{asset.digest}.{coding}")
+            if not os.path.exists(variant_path):
+                compressed = encode(data)
+                # keep only variants that save something
+                if len(compressed) >= len(data) * 0.9:
+                    continue
+                tmp_path = f"{variant_path}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(compressed)
+                os.rename(tmp_path, variant_path)
+            asset.variants[coding] = variant_path
+
+    def _remove_stale(self, assets: dict, cache_dir: str) -> None:
+        digests = {asset.digest for asset in assets.values()}
+        for name in os.listdir(cache_dir):
+            if name.split(".", 1)[0] not in digests:
+                try:
+                    os.unlink(os.path.join(cache_dir, name))
+                except OSError as e:
+                    logger.warning("Cannot remove stale compressed file %s: %s", name, e)
+
+    def lookup(self, path: str):
+        """Return (asset, fingerprinted) for a request path relative to the static dir."""
+        asset = self.fingerprinted.get(path)
+        if asset is not None:
+            return asset, True
+        return self.assets.get(path), False
+
+    def url(self, path: str) -> str:
+        """Return URL of static file path, fingerprinted if known."""
+        asset = self.assets.get(path)
+        return f"{STATIC_URL}/{asset.fingerprinted_path if asset else path}"
+
+
+asset_manifest = AssetManifest(STATIC_DIR, COMPRESSED_CACHE_DIR)
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Directory watcher
+Cheap change detection for directories via inotify(7)
+"""
+
+import os
+import struct
+import ctypes
+import ctypes.util
+import logging
+
+logger = logging.getLogger(__name__)
+
+# inotify constants (from linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+IN_WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+                 IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+
+# struct inotify_event { int wd; uint32_t mask; uint32_t cookie; uint32_t len; char name[]; }
+INOTIFY_EVENT = struct.Struct("iIII")
+
+
+class DirWatcher:
+    """Report whether any of the watched directories changed, using inotify.
+
+    Directories that do not exist yet (or disappear) are retried on every call.
+    While not all directories are watched, or when inotify is not available,
+    changed() always returns True so callers fall back to a full rescan.
+    """
+
+    def __init__(self, paths):
+        self.paths = list(paths)
+        self.wds = {}
+        self.fd = -1
+        try:
+            self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if self.fd < 0:
+                raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+        except (OSError, AttributeError) as e:
+            logger.warning("inotify not available, %s will be rescanned on every call: %s", ", ".join(self.paths), e)
+            self.fd = -1
+
+    def _add_watches(self) -> bool:
+        """Add missing watches, returns True if a new watch was added."""
+        added = False
+        for path in self.paths:
+            if path in self.wds.values() or not os.path.isdir(path):
+                continue
+            wd = self.libc.inotify_add_watch(self.fd, path.encode(), IN_WATCH_MASK)
+            if wd < 0:
+                logger.warning("Cannot watch %s: %s", path, os.strerror(ctypes.get_errno()))
+                continue
+            self.wds[wd] = path
+            added = True
+        return added
+
+    def changed(self) -> bool:
+        """Drain pending events, returns True if the directories (may) have changed since the last call."""
+        if self.fd < 0:
+            return True
+
+        changed = self._add_watches()
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            changed = True
+            offset = 0
+            while offset + INOTIFY_EVENT.size <= len(data):
+                wd, mask, _, name_len = INOTIFY_EVENT.unpack_from(data, offset)
+                offset += INOTIFY_EVENT.size + name_len
+                if mask & IN_IGNORED:
+                    # watched directory was removed
+                    self.wds.pop(wd, None)
+
+        if len(self.wds) != len(self.paths):
+            return True
+        return changed
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+DNS metrics
+Follows the dqcache log (multilog 't' timestamps, dnscache log format) into
+per-minute counters kept for the last HISTORY_MINUTES minutes: queries, cache
+hits, client and upstream latency percentiles, SERVFAILs per upstream server.
+
+Log lines used:
+
+    query NUM CLIENT TYPE NAME          query NUM received
+    sent NUM LEN                        answer to query NUM sent
+    tx LEVEL TYPE NAME CONTROL SERVER.. NAME asked upstream
+    rr|nodata SERVER TTL TYPE NAME ..   answer from SERVER
+    nxdomain SERVER TTL NAME            answer from SERVER
+    servfail NAME ERROR                 NAME failed, counted for its last SERVERs
+
+A query is a cache hit when it is answered right away ('query N', only
+'cached' lines, 'sent N').
+
+    python3 dnsmetrics.py --log /var/log/rpiap/dqcache/current   # print minutes once
+"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+import logging
+import argparse
+import threading
+import ipaddress
+from collections import deque
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+LOG_FILE = "/var/log/rpiap/dqcache/current"
+LOG_ENV = "RPIAP_DQCACHE_LOG"
+
+HISTORY_MINUTES = 60
+READ_INTERVAL = 10
+# latency samples kept per minute (reservoir)
+MAX_SAMPLES = 1000
+# unanswered queries / upstream requests tracked
+MAX_PENDING = 4096
+# multilog 't': TAI64N label, TAI = UTC + 10 s in libtai
+TAI64_BASE = (1 << 62) + 10
+
+
+def parse_tai64n(label: str) -> Optional[float]:
+    """'@4000000065a1b2c3...' -> unix time"""
+    if len(label) != 25 or label[0] != "@":
+        return None
+    try:
+        return int(label[1:17], 16) - TAI64_BASE + int(label[17:25], 16) / 1e9
+    except ValueError:
+        return None
+
+
+def format_server(server: str) -> str:
+    """Server address as logged (hex, IPv4 or IPv6) -> printable address"""
+    try:
+        if len(server) == 8:
+            return str(ipaddress.IPv4Address(bytes.fromhex(server)))
+        if len(server) == 32:
+            address = ipaddress.IPv6Address(bytes.fromhex(server))
+            return str(address.ipv4_mapped or address)
+    except ValueError:
+        pass
+    return server
+
+
+def percentile(samples: list, fraction: float) -> Optional[float]:
+    if not samples:
+        return None
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+class Samples:
+    """Latency samples of one minute, a uniform sample when there are more than MAX_SAMPLES."""
+
+    __slots__ = ("count", "values")
+
+    def __init__(self):
+        self.count = 0
+        self.values = []
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        if len(self.values) < MAX_SAMPLES:
+            self.values.append(value)
+        else:
+            index = random.randrange(self.count)
+            if index < MAX_SAMPLES:
+                self.values[index] = value
+
+
+class Minute:
+    """Counters of one minute."""
+
+    __slots__ = ("start", "queries", "hits", "servfails", "latency", "upstream", "servers")
+
+    def __init__(self, start: int):
+        self.start = start
+        self.queries = 0
+        self.hits = 0
+        self.servfails = 0
+        self.latency = Samples()
+        self.upstream = Samples()
+        # server -> [answers, servfails, Samples]
+        self.servers = {}
+
+    def server(self, server: str) -> list:
+        if server not in self.servers:
+            self.servers[server] = [0, 0, Samples()]
+        return self.servers[server]
+
+    def as_dict(self) -> dict:
+        return {
+            "start": self.start,
+            "queries": self.queries,
+            "hits": self.hits,
+            "hit_rate": self.hits / self.queries if self.queries else None,
+            "servfails": self.servfails,
+            "latency_p50": percentile(self.latency.values, 0.5),
+            "latency_p95": percentile(self.latency.values, 0.95),
+            "upstream_p50": percentile(self.upstream.values, 0.5),
+            "upstream_p95": percentile(self.upstream.values, 0.95),
+        }
+
+
+class DnsMetrics:
+    """Parses dqcache log lines into a ring of per-minute counters."""
+
+    def __init__(self, history: int = HISTORY_MINUTES):
+        self.minutes = deque(maxlen=history)
+        # query NUM -> received
+        self.queries = {}
+        # NAME -> (asked, servers)
+        self.requests = {}
+        # query answered right away when sent NUM follows
+        self.fresh = None
+
+    def minute(self, now: float) -> Minute:
+        start = int(now // 60) * 60
+        if self.minutes and start <= self.minutes[-1].start:
+            for minute in reversed(self.minutes):
+                if minute.start == start:
+                    return minute
+            # older than the history, counted in the oldest minute
+            return self.minutes[0]
+        if self.minutes and start - self.minutes[-1].start > 60 * self.minutes.maxlen:
+            self.minutes.clear()
+        if self.minutes:
+            # idle minutes count too
+            for gap in range(self.minutes[-1].start + 60, start, 60):
+                self.minutes.append(Minute(gap))
+        self.minutes.append(Minute(start))
+        return self.minutes[-1]
+
+    def line(self, line: str) -> None:
+        fields = line.split()
+        now = None
+        if fields and fields[0].startswith("@"):
+            now = parse_tai64n(fields.pop(0))
+        if now is None:
+            now = time.time()
+        if not fields:
+            return
+        kind = fields[0]
+
+        if kind == "query" and len(fields) >= 2:
+            self.minute(now).queries += 1
+            if len(self.queries) >= MAX_PENDING:
+                self.queries.pop(next(iter(self.queries)))
+            self.queries[fields[1]] = now
+            self.fresh = fields[1]
+            return
+        if kind == "cached":
+            return
+        if kind == "sent" and len(fields) >= 2:
+            received = self.queries.pop(fields[1], None)
+            if received is not None:
+                minute = self.minute(now)
+                minute.latency.add((now - received) * 1000)
+                if self.fresh == fields[1]:
+                    minute.hits += 1
+            self.fresh = None
+            return
+        self.fresh = None
+
+        if kind == "tx" and len(fields) >= 6:
+            if len(self.requests) >= MAX_PENDING:
+                self.requests.pop(next(iter(self.requests)))
+            self.requests[fields[3].lower()] = (now, [format_server(server) for server in fields[5:]])
+        elif kind in ("rr", "nodata", "nxdomain") and len(fields) >= 4:
+            name = fields[3] if kind == "nxdomain" else (fields[4] if len(fields) >= 5 else "")
+            request = self.requests.pop(name.lower(), None)
+            if request is not None:
+                asked, _ = request
+                latency = (now - asked) * 1000
+                minute = self.minute(now)
+                minute.upstream.add(latency)
+                answers = minute.server(format_server(fields[1]))
+                answers[0] += 1
+                answers[2].add(latency)
+        elif kind == "servfail" and len(fields) >= 2:
+            minute = self.minute(now)
+            minute.servfails += 1
+            request = self.requests.pop(fields[1].lower(), None)
+            for server in (request[1] if request else ["unknown"]):
+                minute.server(server)[1] += 1
+
+    def snapshot(self) -> dict:
+        """Minutes oldest first and per-upstream totals over the history."""
+        servers = {}
+        for minute in self.minutes:
+            for server, (answers, servfails, samples) in minute.servers.items():
+                total = servers.setdefault(server, {"server": server, "answers": 0, "servfails": 0, "samples": []})
+                total["answers"] += answers
+                total["servfails"] += servfails
+                total["samples"].extend(samples.values)
+        upstreams = []
+        for total in servers.values():
+            samples = total.pop("samples")
+            total["p50"] = percentile(samples, 0.5)
+            total["p95"] = percentile(samples, 0.95)
+            upstreams.append(total)
+        upstreams.sort(key=lambda total: total["server"])
+
+        minutes = [minute.as_dict() for minute in self.minutes]
+        queries = sum(minute["queries"] for minute in minutes)
+        hits = sum(minute["hits"] for minute in minutes)
+        latency = [value for minute in self.minutes for value in minute.latency.values]
+        upstream = [value for minute in self.minutes for value in minute.upstream.values]
+        return {
+            "minutes": minutes,
+            "upstreams": upstreams,
+            "totals": {
+                "queries": queries,
+                "hits": hits,
+                "hit_rate": hits / queries if queries else None,
+                "servfails": sum(minute["servfails"] for minute in minutes),
+                "latency_p50": percentile(latency, 0.5),
+                "latency_p95": percentile(latency, 0.95),
+                "upstream_p50": percentile(upstream, 0.5),
+                "upstream_p95": percentile(upstream, 0.95),
+            },
+        }
+
+
+class DnsMetricsCollector:
+    """Follows the dqcache log every interval seconds in a background task (multilog rotation aware).
+
+    The log is read in a worker thread, lock guards metrics against snapshot() from the event loop.
+    metrics is anything with line(line), DnsMetrics by default.
+    """
+
+    def __init__(self, path: str, interval: float = READ_INTERVAL, metrics=None):
+        self.path = path
+        self.interval = interval
+        self.metrics = metrics if metrics is not None else DnsMetrics()
+        self.file = None
+        self.partial = b""
+        self.updated = None
+        self.error = ""
+        self.task = None
+        self.lock = threading.Lock()
+
+    def read(self) -> None:
+        if self.file is None:
+            self.file = open(self.path, "rb")
+        self.feed(self.file.read())
+        try:
+            rotated = os.stat(self.path).st_ino != os.fstat(self.file.fileno()).st_ino
+        except FileNotFoundError:
+            rotated = False
+        if rotated:
+            # multilog renamed 'current', the rest of it was read above
+            self.file.close()
+            self.file = open(self.path, "rb")
+            self.partial = b""
+            self.feed(self.file.read())
+        self.updated = time.time()
+        self.error = ""
+
+    def feed(self, data: bytes) -> None:
+        if not data:
+            return
+        *lines, self.partial = (self.partial + data).split(b"\n")
+        with self.lock:
+            for line in lines:
+                self.metrics.line(line.decode("utf-8", errors="replace"))
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self.read)
+            except OSError as e:
+                if str(e) != self.error:
+                    logger.warning("DNS metrics unavailable: %s", e)
+                self.error = str(e)
+                self.close()
+            except Exception as e:
+                logger.error("DNS metrics failed: %s", e)
+                self.error = f"Error: {e}"
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        self.close()
+
+    def snapshot(self) -> dict:
+        """Metrics snapshot, waits for a running read, call from a thread."""
+        with self.lock:
+            return self.metrics.snapshot()
+
+
+dns_metrics_collector = DnsMetricsCollector(os.environ.get(LOG_ENV) or LOG_FILE)
+
+
+def ms(value: Optional[float]) -> str:
+    return "--" if value is None else f"{value:.1f}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show per-minute DNS metrics from the dqcache log")
+    parser.add_argument("--log", default=dns_metrics_collector.path, help="dqcache log (multilog current)")
+    args = parser.parse_args()
+
+    collector = DnsMetricsCollector(args.log)
+    try:
+        collector.read()
+    except OSError as e:
+        sys.exit(f"dnsmetrics: {e}")
+    snapshot = collector.snapshot()
+    print(f"{'minute':8} {'queries':>8} {'hits':>6} {'servfail':>8}"
+          f" {'p50 ms':>7} {'p95 ms':>7} {'up p50':>7} {'up p95':>7}")
+    for minute in snapshot["minutes"]:
+        print(f"{time.strftime('%H:%M', time.localtime(minute['start'])):8} {minute['queries']:8} {minute['hits']:6}"
+              f" {minute['servfails']:8} {ms(minute['latency_p50']):>7} {ms(minute['latency_p95']):>7}"
+              f" {ms(minute['upstream_p50']):>7} {ms(minute['upstream_p95']):>7}")
+    for upstream in snapshot["upstreams"]:
+        print(f"upstream {upstream['server']}: {upstream['answers']} answers, {upstream['servfails']} servfails,"
+              f" p50 {ms(upstream['p50'])} ms, p95 {ms(upstream['p95'])} ms")
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Envdir helpers
+Crash-safe writes of settings stored as one file per key (daemontools envdir format)
+"""
+
+import os
+import shutil
+import logging
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+# Prefix of the staging directory created inside the env dir.
+# envdir(8) ignores names starting with '.', so a staging directory left behind
+# after a crash never leaks into the service environment.
+STAGING_PREFIX = ".staging."
+
+# Settings the system runs with (copied at boot) and the flag asking for a reboot
+RUN_ENV_DIR = "/run/rpiap/env"
+NEED_REBOOT_FILE = "/run/rpiap/need-reboot"
+
+# ifupdownd re-runs the link script named by each file created here (ifupdownd.py -t)
+REAPPLY_DIR = "/run/rpiap/ifupdownd"
+
+
+def _fsync_dir(path: str) -> None:
+    """Flush directory entries (creations, renames) of path to disk."""
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _read_bytes(path: str):
+    """Return file content or None if the file does not exist or is not a regular file."""
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except (FileNotFoundError, IsADirectoryError):
+        return None
+
+
+def _cleanup_staging(env_dir: str) -> None:
+    """Remove staging directories left behind by an interrupted write."""
+    for name in os.listdir(env_dir):
+        if name.startswith(STAGING_PREFIX):
+            logger.warning("Removing stale staging directory %s", os.path.join(env_dir, name))
+            shutil.rmtree(os.path.join(env_dir, name), ignore_errors=True)
+
+
+def write_settings(env_dir: str, settings: dict, mode: int = 0o600) -> list:
+    """Write settings into env_dir, each key atomically.
+
+    Keys whose value did not change are skipped. Changed keys are staged in a
+    temporary directory inside env_dir (same filesystem), created with the final
+    permissions and fsynced. They are then moved into place with one atomic
+    rename per key and the env dir itself is fsynced, so after a power loss every
+    key holds either its old or its new value, never a partial one.
+
+    The save as a whole is not atomic: a crash between two renames leaves some
+    keys with their new and others with their old value (e.g. a new SSID with
+    the old passphrase). Saving again writes the remaining keys.
+
+    Args:
+        env_dir: Settings directory.
+        settings: Mapping of key (file name) to string value.
+        mode: Permissions of the written files.
+
+    Returns:
+        list: Sorted keys that were actually written.
+
+    Raises:
+        ValueError: If a key is not a plain file name.
+        OSError: If staging or renaming fails; env_dir is left untouched
+            when the failure happens before the first rename, keys renamed
+            before the failure keep their new value.
+    """
+    for key in settings:
+        if not key or key.startswith(".") or os.sep in key:
+            raise ValueError(f"Invalid settings key '{key}'")
+
+    if not os.path.exists(env_dir):
+        os.makedirs(env_dir, mode=0o700)
+
+    changed = {}
+    for key, value in settings.items():
+        data = value.encode("utf-8")
+        if _read_bytes(os.path.join(env_dir, key)) != data:
+            changed[key] = data
+
+    if not changed:
+        logger.debug("Settings in %s unchanged, nothing to write", env_dir)
+        return []
+
+    _cleanup_staging(env_dir)
+    staging_dir = tempfile.mkdtemp(prefix=STAGING_PREFIX, dir=env_dir)
+    try:
+        # stage all changed keys
+        for key, data in changed.items():
+            fd = os.open(os.path.join(staging_dir, key), os.O_WRONLY | os.O_CREAT | os.O_EXCL, mode)
+            try:
+                os.write(fd, data)
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+        # commit
+        for key in changed:
+            os.rename(os.path.join(staging_dir, key), os.path.join(env_dir, key))
+        _fsync_dir(env_dir)
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+    return sorted(changed)
+
+
+def mark_need_reboot() -> None:
+    """Create the need-reboot flag shown by the infobar."""
+    try:
+        os.makedirs(os.path.dirname(NEED_REBOOT_FILE), mode=0o755, exist_ok=True)
+        with open(NEED_REBOOT_FILE, "w") as f:
+            f.write("")
+        os.chmod(NEED_REBOOT_FILE, 0o644)
+    except OSError as e:
+        logger.warning("Could not create need-reboot file: %s", e)
+
+
+def request_reapply(scripts) -> None:
+    """Ask ifupdownd to re-run the link scripts (file names in ifupdownd.link.d) for the interfaces that are up."""
+    for script in scripts:
+        try:
+            with open(os.path.join(REAPPLY_DIR, script), "w") as f:
+                f.write("")
+        except OSError as e:
+            logger.warning("Could not request reapply of %s: %s", script, e)
+
+
+def save_settings(env_dir: str, settings: dict, reapply=()) -> list:
+    """Save settings of a settings form and tell the system about the change.
+
+    Settings are written with write_settings(). If any key changed, either the
+    link scripts in reapply apply them right away (the changed keys are copied
+    to RUN_ENV_DIR as well, so they are not reported as pending), or, without
+    reapply, the need-reboot flag is created.
+
+    Args:
+        env_dir: Settings directory.
+        settings: Mapping of key (file name) to string value.
+        reapply: Link scripts applying these settings, see request_reapply().
+
+    Returns:
+        list: Sorted keys that were actually written.
+
+    Raises:
+        ValueError, OSError: See write_settings().
+    """
+    changed = write_settings(env_dir, settings)
+    if not changed:
+        return changed
+
+    if not reapply:
+        mark_need_reboot()
+        return changed
+
+    if os.path.isdir(RUN_ENV_DIR):
+        try:
+            write_settings(RUN_ENV_DIR, {key: settings[key] for key in changed})
+        except OSError as e:
+            logger.warning("Could not update %s: %s", RUN_ENV_DIR, e)
+    request_reapply(reapply)
+    return changed
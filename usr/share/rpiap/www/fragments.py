@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Rendered fragment cache
+Caches HTML partials whose output depends only on their template context
+(e.g. current_path and theme) and serves them with an ETag, so repeated
+HTMX navigation gets 304 Not Modified instead of a re-render and re-transfer
+"""
+
+import os
+import hashlib
+import logging
+from fastapi import Request
+from fastapi.responses import HTMLResponse, Response
+from fastapi.templating import Jinja2Templates
+from dirwatch import DirWatcher
+from templating import TEMPLATES_DIR
+
+logger = logging.getLogger(__name__)
+
+# Upper bound of cached fragments, current_path comes from the client
+MAX_ENTRIES = 256
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Check If-None-Match header value against a strong ETag."""
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == "*" or tag == etag:
+            return True
+    return False
+
+
+class FragmentCache:
+    """Cache of rendered templates keyed by template name and context.
+
+    The whole cache is dropped when anything in the templates directory
+    changes (including included templates), detected via inotify.
+    """
+
+    def __init__(self, templates_dir: str):
+        self.watcher = DirWatcher([templates_dir, os.path.join(templates_dir, "partials")])
+        self.entries = {}
+
+    def get(self, templates: Jinja2Templates, name: str, context: dict, request: Request = None) -> tuple:
+        """Return (body, etag) of the rendered template.
+
+        Args:
+            templates: Templates used for rendering.
+            name: Template name.
+            context: Template context, values must be hashable; the output
+                must depend on nothing else.
+            request: Passed to the template but not part of the cache key.
+
+        Returns:
+            tuple: Rendered body (bytes) and its quoted ETag.
+        """
+        if self.watcher.changed():
+            self.entries.clear()
+
+        key = (name, tuple(sorted(context.items())))
+        entry = self.entries.get(key)
+        if entry is None:
+            body = templates.get_template(name).render({"request": request, **context}).encode("utf-8")
+            etag = '"%s"' % hashlib.sha256(body).hexdigest()[:32]
+            if len(self.entries) >= MAX_ENTRIES:
+                self.entries.clear()
+            entry = self.entries[key] = (body, etag)
+        return entry
+
+
+fragment_cache = FragmentCache(TEMPLATES_DIR)
+
+
+def cached_template_response(request: Request, templates: Jinja2Templates, name: str, context: dict) -> Response:
+    """Render template through the fragment cache, honouring If-None-Match.
+
+    Args:
+        request: FastAPI request object.
+        templates: Templates used for rendering.
+        name: Template name.
+        context: Template context without request.
+
+    Returns:
+        Response: 304 Not Modified if the client has the current version, HTMLResponse otherwise.
+    """
+    body, etag = fragment_cache.get(templates, name, context, request)
+    # no-cache: the browser may store the fragment but must revalidate it
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return HTMLResponse(content=body, headers=headers)
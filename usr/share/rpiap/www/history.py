@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Speedtest history
+Results of speedtest runs in a small SQLite database (WAL mode), bounded in size,
+with percentile summaries over time
+"""
+
+import os
+import math
+import time
+import sqlite3
+import logging
+import threading
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Measured values stored per run
+METRICS = ("download_mbps", "upload_mbps", "ping_ms", "loaded_ping_ms", "jitter_ms")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    client TEXT NOT NULL,
+    test_type TEXT NOT NULL,
+    interface TEXT NOT NULL DEFAULT '',
+    download_mbps REAL,
+    upload_mbps REAL,
+    ping_ms REAL,
+    loaded_ping_ms REAL,
+    jitter_ms REAL,
+    bytes INTEGER
+);
+CREATE INDEX IF NOT EXISTS results_ts ON results (ts);
+"""
+
+
+def percentile(values: list, p: float) -> Optional[float]:
+    """Return p-th percentile (nearest rank) of values, None for no values."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(len(ordered) * p / 100) - 1)]
+
+
+def summarize(rows: list) -> dict:
+    """Return count and p50/p95 of every metric over rows."""
+    result = {"count": len(rows)}
+    for metric in METRICS:
+        values = [row[metric] for row in rows if row[metric] is not None]
+        result[metric] = {"p50": percentile(values, 50), "p95": percentile(values, 95)}
+    return result
+
+
+class HistoryStore:
+    """Append-mostly store of speedtest results.
+
+    The database is opened on first use. Only the newest max_records results
+    are kept; older ones are deleted every prune_interval inserts. If the
+    database cannot be opened the store logs a warning and stays disabled.
+    """
+
+    def __init__(self, path: str, max_records: int = 10000, prune_interval: int = 100):
+        self.path = path
+        self.max_records = max_records
+        self.prune_interval = prune_interval
+        self.inserts = 0
+        self.lock = threading.Lock()
+        self.db = None
+        self.disabled = False
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        if self.db is None and not self.disabled:
+            try:
+                os.makedirs(os.path.dirname(self.path), mode=0o700, exist_ok=True)
+                db = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+                db.row_factory = sqlite3.Row
+                db.execute("PRAGMA journal_mode=WAL")
+                # WAL + NORMAL: a power loss may lose the last results, never corrupts the database
+                db.execute("PRAGMA synchronous=NORMAL")
+                db.executescript(SCHEMA)
+                self.db = db
+            except (OSError, sqlite3.Error) as e:
+                logger.warning("Speedtest history disabled: %s", e)
+                self.disabled = True
+        return self.db
+
+    def add(self, client: str, test_type: str, interface: str = "", **values) -> Optional[int]:
+        """Store one result, values are METRICS and bytes. Returns its id, None if the store is disabled."""
+        with self.lock:
+            db = self._connect()
+            if db is None:
+                return None
+            record = {metric: values.get(metric) for metric in METRICS}
+            record.update(ts=time.time(), client=client, test_type=test_type, interface=interface,
+                          bytes=values.get("bytes"))
+            columns = ", ".join(record)
+            placeholders = ", ".join(f":{column}" for column in record)
+            cursor = db.execute(f"INSERT INTO results ({columns}) VALUES ({placeholders})", record)
+            self.inserts += 1
+            if self.inserts % self.prune_interval == 0:
+                db.execute("DELETE FROM results WHERE id <= (SELECT MAX(id) FROM results) - ?", (self.max_records,))
+            return cursor.lastrowid
+
+    def query(self, client: Optional[str] = None, test_type: Optional[str] = None,
+              interface: Optional[str] = None, since: Optional[float] = None, limit: Optional[int] = None) -> list:
+        """Return matching results as dicts, newest first."""
+        conditions = []
+        params = []
+        for column, value in (("client", client), ("test_type", test_type), ("interface", interface)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        if since is not None:
+            conditions.append("ts >= ?")
+            params.append(since)
+        sql = "SELECT * FROM results"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        with self.lock:
+            db = self._connect()
+            if db is None:
+                return []
+            return [dict(row) for row in db.execute(sql, params)]
+
+    def summary(self, bucket: Optional[float] = None, **filters) -> dict:
+        """Return p50/p95 of all matching results and, with bucket (seconds), per time bucket (oldest first)."""
+        rows = self.query(**filters)
+        result = summarize(rows)
+        if bucket:
+            buckets = {}
+            for row in rows:
+                buckets.setdefault(int(row["ts"] // bucket), []).append(row)
+            result["buckets"] = [
+                dict(start=key * bucket, **summarize(buckets[key])) for key in sorted(buckets)
+            ]
+        return result
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+DHCP lease index
+Reads the busybox udhcpd lease file into a table indexed by MAC and by IP,
+re-read only when the file changed, and joins it with the kernel neighbour
+(ARP) table from netlink for the online status of the clients.
+
+Lease file: 8 byte big-endian time of writing, then 36 byte records
+(seconds left big-endian, IPv4 address, MAC, hostname[20], 2 pad bytes).
+
+A generated lease file can stand in for udhcpd (development, load tests):
+
+    python3 leases.py --fake /tmp/udhcpd.leases --count 300
+    RPIAP_LEASE_FILE=/tmp/udhcpd.leases uvicorn app:app
+    python3 leases.py --file /tmp/udhcpd.leases          # print clients once
+"""
+
+import os
+import sys
+import time
+import socket
+import struct
+import random
+import logging
+import argparse
+import ipaddress
+import threading
+from typing import Optional
+
+from netlink import nla_parse, NLM_F_REQUEST, NLM_F_DUMP, NLMSG_DONE, NLMSG_ERROR
+
+logger = logging.getLogger(__name__)
+
+LEASE_FILE = "/var/lib/rpiap/service/udhcpd/var/udhcpd.leases"
+LEASE_ENV = "RPIAP_LEASE_FILE"
+LAN_INTERFACE = "lan"
+
+LEASE_HEADER = struct.Struct("!Q")
+LEASE_RECORD = struct.Struct("!I4s6s20s2x")
+
+# rtnetlink neighbour dump
+NETLINK_ROUTE = 0
+RTM_NEWNEIGH = 28
+RTM_GETNEIGH = 30
+NDMSG = struct.Struct("BxxxiHBB")
+NDA_DST = 1
+NDA_LLADDR = 2
+NUD_INCOMPLETE = 0x01
+NUD_REACHABLE = 0x02
+NUD_STALE = 0x04
+NUD_DELAY = 0x08
+NUD_PROBE = 0x10
+NUD_FAILED = 0x20
+NUD_PERMANENT = 0x80
+NUD_ONLINE = NUD_REACHABLE | NUD_DELAY | NUD_PROBE | NUD_PERMANENT
+
+
+def format_mac(mac: bytes) -> str:
+    return ":".join(f"{byte:02x}" for byte in mac)
+
+
+class Lease:
+    """One DHCP lease."""
+
+    __slots__ = ("mac", "ip", "hostname", "expires")
+
+    def __init__(self, mac: str, ip: str, hostname: str, expires: float):
+        self.mac = mac
+        self.ip = ip
+        self.hostname = hostname
+        self.expires = expires
+
+
+class LeaseIndex:
+    """Leases of the udhcpd lease file by MAC and by IP, refreshed when the file changes."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.by_mac = {}
+        self.by_ip = {}
+        self.written = None
+        self.signature = None
+
+    def refresh(self) -> bool:
+        """Re-read the file if it changed since the last read, True if it was read."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            if self.signature is not None:
+                self.by_mac, self.by_ip, self.written, self.signature = {}, {}, None, None
+            return False
+        signature = (st.st_ino, st.st_size, st.st_mtime_ns)
+        if signature == self.signature:
+            return False
+        with open(self.path, "rb") as f:
+            data = f.read()
+        self.update(data)
+        self.signature = signature
+        return True
+
+    def update(self, data: bytes) -> None:
+        """Update the index from lease file contents, unchanged leases are kept as they are."""
+        if len(data) < LEASE_HEADER.size:
+            self.by_mac, self.by_ip, self.written = {}, {}, None
+            return
+        written = LEASE_HEADER.unpack_from(data)[0]
+        by_mac = {}
+        by_ip = {}
+        end = len(data) - (len(data) - LEASE_HEADER.size) % LEASE_RECORD.size
+        for offset in range(LEASE_HEADER.size, end, LEASE_RECORD.size):
+            remaining, nip, mac, hostname = LEASE_RECORD.unpack_from(data, offset)
+            if nip == bytes(4):
+                continue
+            mac = format_mac(mac)
+            ip = str(ipaddress.IPv4Address(nip))
+            hostname = hostname.split(b"\0", 1)[0].decode("utf-8", errors="replace")
+            lease = self.by_mac.get(mac)
+            if lease is None or lease.ip != ip:
+                lease = Lease(mac, ip, hostname, written + remaining)
+            else:
+                lease.hostname = hostname
+                lease.expires = written + remaining
+            by_mac[mac] = lease
+            by_ip[ip] = lease
+        self.by_mac, self.by_ip, self.written = by_mac, by_ip, written
+
+    def get(self, mac: Optional[str] = None, ip: Optional[str] = None) -> Optional[Lease]:
+        if mac is not None:
+            return self.by_mac.get(mac.lower())
+        return self.by_ip.get(ip)
+
+
+def neighbours(interface: Optional[str] = None) -> dict:
+    """IPv4 neighbour table {ip: (mac, state)}, only of interface when given."""
+    ifindex = socket.if_nametoindex(interface) if interface else 0
+    sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+    try:
+        sock.settimeout(2)
+        request = NDMSG.pack(socket.AF_INET, ifindex, 0, 0, 0)
+        sock.send(struct.pack("IHHII", 16 + len(request), RTM_GETNEIGH, NLM_F_REQUEST | NLM_F_DUMP, 1, 0) + request)
+        result = {}
+        while True:
+            data = sock.recv(65536)
+            offset = 0
+            while offset + 16 <= len(data):
+                length, msg_type, _, _, _ = struct.unpack_from("IHHII", data, offset)
+                if length < 16:
+                    return result
+                body = data[offset + 16:offset + length]
+                offset += (length + 3) & ~3
+                if msg_type == NLMSG_DONE:
+                    return result
+                if msg_type == NLMSG_ERROR:
+                    error = -struct.unpack_from("i", body)[0]
+                    if error:
+                        raise OSError(error, os.strerror(error))
+                    return result
+                if msg_type != RTM_NEWNEIGH or len(body) < NDMSG.size:
+                    continue
+                family, index, state, _, _ = NDMSG.unpack_from(body)
+                if family != socket.AF_INET or (ifindex and index != ifindex):
+                    continue
+                attrs = nla_parse(body[NDMSG.size:])
+                if NDA_DST not in attrs:
+                    continue
+                mac = format_mac(attrs[NDA_LLADDR]) if len(attrs.get(NDA_LLADDR, b"")) == 6 else None
+                result[socket.inet_ntoa(attrs[NDA_DST][:4])] = (mac, state)
+    finally:
+        sock.close()
+
+
+def neighbour_status(state: Optional[int]) -> str:
+    if state is None:
+        return "offline"
+    if state & NUD_ONLINE:
+        return "online"
+    if state & NUD_STALE:
+        return "idle"
+    return "offline"
+
+
+class ClientInventory:
+    """DHCP leases joined with the neighbour table of the LAN bridge."""
+
+    def __init__(self, path: str, interface: str = LAN_INTERFACE):
+        self.index = LeaseIndex(path)
+        self.interface = interface
+        self.error = ""
+        self.lock = threading.Lock()
+
+    def clients(self) -> list:
+        """Clients online first, then by IP; neighbours without a lease are listed as static.
+
+        Reads the lease file and the neighbour table, call from a thread.
+        """
+        with self.lock:
+            self.index.refresh()
+            try:
+                table = neighbours(self.interface)
+                self.error = ""
+            except OSError as e:
+                # no 'lan' bridge (yet), leases only
+                if str(e) != self.error:
+                    logger.warning("Neighbour table of %s unavailable: %s", self.interface, e)
+                self.error = str(e)
+                table = {}
+
+            now = time.time()
+            clients = []
+            for lease in self.index.by_mac.values():
+                mac, state = table.get(lease.ip, (None, None))
+                if mac is not None and mac != lease.mac:
+                    # the address is used by another device now
+                    state = None
+                clients.append({
+                    "mac": lease.mac,
+                    "ip": lease.ip,
+                    "hostname": lease.hostname,
+                    "expires_in": max(0, int(lease.expires - now)),
+                    "status": neighbour_status(state),
+                    "lease": True,
+                })
+            for ip, (mac, state) in table.items():
+                # devices with a static address, not multicast or failed entries
+                if ip in self.index.by_ip or mac is None or not state & (NUD_ONLINE | NUD_STALE):
+                    continue
+                if ipaddress.IPv4Address(ip).is_multicast:
+                    continue
+                clients.append({
+                    "mac": mac,
+                    "ip": ip,
+                    "hostname": "",
+                    "expires_in": None,
+                    "status": neighbour_status(state),
+                    "lease": False,
+                })
+            order = {"online": 0, "idle": 1, "offline": 2}
+            clients.sort(key=lambda client: (order[client["status"]], ipaddress.IPv4Address(client["ip"])))
+            return clients
+
+
+client_inventory = ClientInventory(os.environ.get(LEASE_ENV) or LEASE_FILE)
+
+
+def write_fake_leases(path: str, count: int) -> None:
+    """Write count leases in the udhcpd format, from 192.168.137.200 up."""
+    data = LEASE_HEADER.pack(int(time.time()))
+    base = int(ipaddress.IPv4Address("192.168.137.200"))
+    for number in range(count):
+        mac = bytes([0x02, 0x00, 0x00, random.randrange(256), random.randrange(256), number % 256])
+        hostname = f"client{number}".encode()[:19]
+        data += LEASE_RECORD.pack(random.randrange(864000), (base + number).to_bytes(4, "big"), mac,
+                                  hostname.ljust(20, b"\0"))
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show DHCP clients from the udhcpd lease file, or write a fake one")
+    parser.add_argument("--file", default=client_inventory.index.path, help="udhcpd lease file")
+    parser.add_argument("--fake", help="write a fake lease file at this path")
+    parser.add_argument("--count", type=int, default=50, help="leases in the fake lease file")
+    args = parser.parse_args()
+
+    if args.fake:
+        write_fake_leases(args.fake, args.count)
+        sys.exit(0)
+    inventory = ClientInventory(args.file)
+    if not os.path.exists(args.file):
+        sys.exit(f"leases: {args.file} does not exist")
+    print(f"{'ip':15} {'mac':17} {'status':8} {'expires':>8} hostname")
+    for client in inventory.clients():
+        expires = "static" if client["expires_in"] is None else f"{client['expires_in'] // 60}m"
+        print(f"{client['ip']:15} {client['mac']:17} {client['status']:8} {expires:>8} {client['hostname']}")
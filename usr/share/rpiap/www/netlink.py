@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+Netlink helpers
+Message flags, types and attribute (NLA) packing shared by the nl80211
+channel survey (survey.py) and the rtnetlink neighbour dump (leases.py).
+"""
+
+import struct
+
+SOL_NETLINK = 270
+NETLINK_ADD_MEMBERSHIP = 1
+NLM_F_REQUEST = 0x01
+NLM_F_ACK = 0x04
+NLM_F_DUMP = 0x300
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+NLA_TYPE_MASK = 0x3fff
+
+
+def nla_parse(data: bytes) -> dict:
+    """Parse netlink attributes into {type: payload}."""
+    attrs = {}
+    offset = 0
+    while offset + 4 <= len(data):
+        length, attr_type = struct.unpack_from("HH", data, offset)
+        if length < 4:
+            break
+        attrs[attr_type & NLA_TYPE_MASK] = data[offset + 4:offset + length]
+        offset += (length + 3) & ~3
+    return attrs
+
+
+def nla(attr_type: int, payload: bytes) -> bytes:
+    """Pack one netlink attribute (padded to 4 bytes)."""
+    data = struct.pack("HH", 4 + len(payload), attr_type) + payload
+    return data + b"\0" * (-len(data) % 4)
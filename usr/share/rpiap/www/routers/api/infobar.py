@@ -8,6 +8,7 @@ import hashlib
 import logging
 from fastapi import APIRouter, Request
 from fastapi.responses import PlainTextResponse, HTMLResponse
+from dirwatch import DirWatcher
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -20,82 +21,134 @@ ENV_PERSIST_DIR = "/var/lib/rpiap/env"
 ENV_RUN_DIR = "/run/rpiap/env"
 
 
-def env_dirs_differ():
-    """
-    Check if persist env dir (/var/lib/rpiap/env) and run env dir (/run/rpiap/env) differ in content.
-
-    Returns False if either directory doesn't exist or if they have identical content.
-    Returns True if they differ in any way (missing/extra files, different content).
-    """
-    changed_files = get_changed_files()
-    return len(changed_files) > 0
-
-
-def get_changed_files():
-    """
-    Get list of files that differ between persist env dir (/var/lib/rpiap/env) 
-    and run env dir (/run/rpiap/env).
+class EnvDirDiff:
+    """Incremental comparison of the persist and run env dirs.
 
-    Returns list of relative paths of changed files (missing, extra, or different content).
-    Returns empty list if directories don't exist or are identical.
+    Files are compared by size and mtime first, content digests are computed
+    only when those differ and are cached per file until its stat data changes.
+    The resulting list is cached as long as inotify reports no change in
+    either directory, so an unchanged state is answered without touching the disk.
     """
-    changed_files = []
-    
-    if not os.path.exists(ENV_PERSIST_DIR) or not os.path.exists(ENV_RUN_DIR):
-        return changed_files
-
-    try:
-        # Get list of files in both directories (only regular files)
-        persist_files = set()
-        run_files = set()
-
-        for dirname, dirs, files in os.walk(ENV_PERSIST_DIR):
-            for filename in files:
-                rel_path = os.path.relpath(os.path.join(dirname, filename), ENV_PERSIST_DIR)
-                persist_files.add(rel_path)
 
-        for dirname, dirs, files in os.walk(ENV_RUN_DIR):
-            for filename in files:
-                rel_path = os.path.relpath(os.path.join(dirname, filename), ENV_RUN_DIR)
-                run_files.add(rel_path)
+    def __init__(self, persist_dir: str, run_dir: str):
+        self.persist_dir = persist_dir
+        self.run_dir = run_dir
+        self.watcher = DirWatcher([persist_dir, run_dir])
+        self.digests = {}
+        self.result = None
+
+    @staticmethod
+    def _list_files(top: str) -> dict:
+        """Return {relative path: stat result} of regular files under top."""
+        files = {}
+        for dirname, dirs, filenames in os.walk(top):
+            # skip staging directories of in-progress settings writes
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            for filename in filenames:
+                path = os.path.join(dirname, filename)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files[os.path.relpath(path, top)] = st
+        return files
+
+    def _digest(self, path: str, st: os.stat_result) -> bytes:
+        """Return SHA256 of the file content, cached until its stat data changes."""
+        key = (st.st_ino, st.st_size, st.st_mtime_ns, st.st_ctime_ns)
+        cached = self.digests.get(path)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        with open(path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).digest()
+        self.digests[path] = (key, digest)
+        return digest
+
+    def _compare(self) -> list:
+        persist_files = self._list_files(self.persist_dir)
+        run_files = self._list_files(self.run_dir)
+        changed_files = []
 
         # Check for files missing in run dir (present in persist but not in run)
-        for rel_path in persist_files - run_files:
+        for rel_path in persist_files.keys() - run_files.keys():
             logger.debug("Env dirs differ: file %s missing in run dir", rel_path)
             changed_files.append(rel_path)
 
         # Check for extra files in run dir (present in run but not in persist)
-        for rel_path in run_files - persist_files:
+        for rel_path in run_files.keys() - persist_files.keys():
             logger.debug("Env dirs differ: file %s extra in run dir", rel_path)
             changed_files.append(rel_path)
 
-        # Check content of each file that exists in both
-        for rel_path in persist_files & run_files:
-            persist_file = os.path.join(ENV_PERSIST_DIR, rel_path)
-            run_file = os.path.join(ENV_RUN_DIR, rel_path)
-
-            # Compare file contents using SHA256
-            persist_hash = hashlib.sha256()
-            run_hash = hashlib.sha256()
-
-            with open(persist_file, 'rb') as f:
-                persist_hash.update(f.read())
-
-            with open(run_file, 'rb') as f:
-                run_hash.update(f.read())
-
-            if persist_hash.hexdigest() != run_hash.hexdigest():
+        # Check content of each file that exists in both, metadata first
+        used = set()
+        for rel_path in persist_files.keys() & run_files.keys():
+            persist_st = persist_files[rel_path]
+            run_st = run_files[rel_path]
+            if persist_st.st_size != run_st.st_size:
+                changed_files.append(rel_path)
+                continue
+            if persist_st.st_mtime_ns == run_st.st_mtime_ns:
+                # copied with preserved mtime (cp -p, shutil.copy2) and not modified since
+                continue
+            persist_file = os.path.join(self.persist_dir, rel_path)
+            run_file = os.path.join(self.run_dir, rel_path)
+            used.update((persist_file, run_file))
+            if self._digest(persist_file, persist_st) != self._digest(run_file, run_st):
                 logger.debug("Env dirs differ: file %s has different content", rel_path)
                 changed_files.append(rel_path)
 
+        # drop digests of files which are gone or no longer need hashing
+        for path in self.digests.keys() - used:
+            del self.digests[path]
+
         if not changed_files:
             logger.debug("Env dirs are identical")
+        return sorted(changed_files)
+
+    def changed_files(self) -> list:
+        """Return sorted relative paths of files that differ between the env dirs."""
+        if not self.watcher.changed() and self.result is not None:
+            return self.result
+
+        if not os.path.exists(self.persist_dir) or not os.path.exists(self.run_dir):
+            self.result = []
+            return self.result
+
+        try:
+            self.result = self._compare()
+        except Exception as e:
+            logger.error("Error comparing env directories: %s", e)
+            self.result = None
+            return []
+        return self.result
 
-    except Exception as e:
-        logger.error("Error comparing env directories: %s", e)
-        return []
 
-    return sorted(changed_files)
+_env_dir_diff = None
+
+
+def env_dirs_differ():
+    """
+    Check if persist env dir (/var/lib/rpiap/env) and run env dir (/run/rpiap/env) differ in content.
+
+    Returns False if either directory doesn't exist or if they have identical content.
+    Returns True if they differ in any way (missing/extra files, different content).
+    """
+    changed_files = get_changed_files()
+    return len(changed_files) > 0
+
+
+def get_changed_files():
+    """
+    Get list of files that differ between persist env dir (/var/lib/rpiap/env) 
+    and run env dir (/run/rpiap/env).
+
+    Returns list of relative paths of changed files (missing, extra, or different content).
+    Returns empty list if directories don't exist or are identical.
+    """
+    global _env_dir_diff
+    if _env_dir_diff is None:
+        _env_dir_diff = EnvDirDiff(ENV_PERSIST_DIR, ENV_RUN_DIR)
+    return list(_env_dir_diff.changed_files())
 
 
 @router.get("/api/infobar", response_class=PlainTextResponse)
@@ -9,15 +9,12 @@ import fcntl
 import json
 import logging
 from fastapi import APIRouter, Request, Form
-from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
-
-# Get the directory where this script is located
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-
-# Setup templates - use absolute path
-templates_dir = os.path.join(BASE_DIR, "templates")
-templates = Jinja2Templates(directory=templates_dir)
+from fastapi.responses import HTMLResponse, JSONResponse
+from starlette.concurrency import run_in_threadpool
+from templating import templates
+from envdir import write_settings
+from stations import station_collector
+from leases import client_inventory
 
 router = APIRouter()
 
@@ -386,6 +383,75 @@ async def get_lan_info(request: Request):
         return HTMLResponse(content=error_html, status_code=500)
 
 
+@router.get("/interfaces/stations", response_class=HTMLResponse)
+async def get_station_cards(request: Request):
+    """Get Wi-Fi station (client) cards as HTML"""
+    try:
+        template = templates.get_template("partials/station_cards.html")
+        rendered = template.render({
+            "request": request,
+            "stations": station_collector.snapshot(),
+            "updated": station_collector.updated,
+            "error": station_collector.error
+        })
+        return HTMLResponse(content=rendered.strip())
+    except Exception as e:
+        logging.error(f"Error in get_station_cards: {e}", exc_info=True)
+        error_html = f"<div class='error'>Error: {str(e)}</div>"
+        return HTMLResponse(content=error_html, status_code=500)
+
+
+@router.get("/interfaces/stations/data")
+async def get_stations_data():
+    """Get Wi-Fi station statistics as JSON (sampled from hostapd every few seconds)"""
+    return JSONResponse(content={
+        "success": not station_collector.error,
+        "message": station_collector.error,
+        "data": {
+            "updated": station_collector.updated,
+            "interval": station_collector.interval,
+            "stations": station_collector.snapshot()
+        }
+    })
+
+
+@router.get("/interfaces/clients", response_class=HTMLResponse)
+async def get_client_list(request: Request):
+    """Get DHCP client list as HTML"""
+    try:
+        clients = await run_in_threadpool(client_inventory.clients)
+        template = templates.get_template("partials/client_list.html")
+        rendered = template.render({
+            "request": request,
+            "clients": clients,
+            "online": sum(1 for client in clients if client["status"] == "online"),
+            "error": client_inventory.error
+        })
+        return HTMLResponse(content=rendered.strip())
+    except Exception as e:
+        logging.error(f"Error in get_client_list: {e}", exc_info=True)
+        error_html = f"<div class='error'>Error: {str(e)}</div>"
+        return HTMLResponse(content=error_html, status_code=500)
+
+
+@router.get("/interfaces/clients/data")
+async def get_clients_data():
+    """Get DHCP clients (leases joined with the neighbour table) as JSON"""
+    try:
+        clients = await run_in_threadpool(client_inventory.clients)
+    except Exception as e:
+        logging.error(f"Error in get_clients_data: {e}", exc_info=True)
+        return JSONResponse(content={"success": False, "message": str(e), "data": None}, status_code=500)
+    return JSONResponse(content={
+        "success": True,
+        "message": client_inventory.error,
+        "data": {
+            "written": client_inventory.index.written,
+            "clients": clients
+        }
+    })
+
+
 @router.post("/interfaces/activate", response_class=HTMLResponse)
 async def activate_interface(request: Request, interface: str = Form(...)):
     """Activate interface by doing down/up cycle"""
@@ -536,11 +602,9 @@ async def move_interface(request: Request, interface: str = Form(...), target: s
         elif target_name == "other":
             current_lan.discard(interface_name)
 
-        # Write back to file
-        os.makedirs(os.path.dirname(LAN_ENV_FILE), exist_ok=True)
-        with open(LAN_ENV_FILE, 'w') as f:
-            for iface in sorted(current_lan):
-                f.write(f"{iface}\n")
+        # Write back to file atomically
+        lan_content = "".join(f"{iface}\n" for iface in sorted(current_lan))
+        write_settings(os.path.dirname(LAN_ENV_FILE), {os.path.basename(LAN_ENV_FILE): lan_content})
 
         # Get updated data
         interfaces_data = get_interfaces_data()
@@ -7,24 +7,24 @@ Handles GET (load) and POST (save) operations for DNS settings
 import os
 import logging
 from fastapi import APIRouter, Form, Request
-from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
+from fastapi.responses import HTMLResponse, JSONResponse
+from templating import templates
 from typing import Optional
+from envdir import save_settings
 from fastapi import Query
+from starlette.concurrency import run_in_threadpool
+from dnsmetrics import dns_metrics_collector
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-# Get the directory where this script is located
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-
-# Setup templates - use relative path from www directory
-templates_dir = os.path.join(BASE_DIR, "templates")
-templates = Jinja2Templates(directory=templates_dir)
-
 # Settings directory
 ENV_DIR = "/var/lib/rpiap/env"
 
+# Prefetch queries per hour of scripts/dns-prefetch.py
+DEFAULT_PREFETCH_BUDGET = "300"
+MAX_PREFETCH_BUDGET = 100000
+
 
 def load_settings():
     """
@@ -52,43 +52,6 @@ def load_settings():
     return settings
 
 
-def save_settings(settings: dict):
-    """
-    Save provided settings to files
-    """
-    try:
-        if not os.path.exists(ENV_DIR):
-            os.makedirs(ENV_DIR, mode=0o700)
-
-        for key, value in settings.items():
-            file_path = os.path.join(ENV_DIR, key)
-
-            try:
-                with open(file_path, 'w') as f:
-                    f.write(value)
-                # Set proper permissions
-                os.chmod(file_path, 0o600)
-            except Exception as e:
-                logger.error(f"Error saving {key}: {e}")
-
-        # Create /run/rpiap/need-reboot file when any settings are saved
-        try:
-            reboot_flag_dir = "/run/rpiap"
-            reboot_flag_file = os.path.join(reboot_flag_dir, "need-reboot")
-            if not os.path.exists(reboot_flag_dir):
-                os.makedirs(reboot_flag_dir, mode=0o755)
-            with open(reboot_flag_file, 'w') as f:
-                f.write("")
-            os.chmod(reboot_flag_file, 0o644)
-        except Exception as e:
-            logger.warning(f"Could not create need-reboot file: {e}")
-
-        return "Settings saved successfully"
-    except Exception as e:
-        logger.error(f"Error saving settings: {e}")
-        raise
-
-
 @router.get("/api/settings/dns", response_class=HTMLResponse)
 async def get_dns_settings(request: Request, dns_standalone: Optional[str] = Query(None)):
     """Get DNS settings form as HTML"""
@@ -123,7 +86,8 @@ async def get_dns_settings(request: Request, dns_standalone: Optional[str] = Que
 @router.post("/api/settings/dns", response_class=HTMLResponse)
 async def save_dns_settings(
     request: Request,
-    dns_standalone: Optional[str] = Form("false")
+    dns_standalone: Optional[str] = Form("false"),
+    dns_prefetch_budget: Optional[str] = Form(DEFAULT_PREFETCH_BUDGET)
 ):
     """Save DNS settings - POST endpoint, returns HTML form"""
     try:
@@ -136,7 +100,20 @@ async def save_dns_settings(
         else:
             settings["dns_standalone"] = "false"
 
-        message = save_settings(settings)
+        # Validate dns_prefetch_budget - whole number of queries per hour
+        budget = (dns_prefetch_budget or "").strip() or "0"
+        if not budget.isdigit() or int(budget) > MAX_PREFETCH_BUDGET:
+            error_html = templates.get_template("partials/settings_dns_form.html").render({
+                "request": request,
+                "settings": {**load_settings(), **settings, "dns_prefetch_budget": budget},
+                "error": f"Prefetch budget must be between 0 and {MAX_PREFETCH_BUDGET} queries per hour"
+            })
+            error_html = HTMLResponse(content=error_html, status_code=400)
+            error_html.headers["HX-Trigger"] = "showErrorBar"
+            return error_html
+        settings["dns_prefetch_budget"] = str(int(budget))
+
+        save_settings(ENV_DIR, settings)
         current_settings = load_settings()
 
         form_html = templates.get_template("partials/settings_dns_form.html").render({
@@ -161,3 +138,36 @@ async def save_dns_settings(
         error_html.headers["HX-Trigger"] = "showErrorBar"
         return error_html
 
+
+@router.get("/api/settings/dns/metrics", response_class=HTMLResponse)
+async def get_dns_metrics(request: Request):
+    """Get DNS metrics card as HTML"""
+    try:
+        metrics = await run_in_threadpool(dns_metrics_collector.snapshot)
+        template = templates.get_template("partials/settings_dns_metrics.html")
+        rendered = template.render({
+            "request": request,
+            "metrics": metrics,
+            "updated": dns_metrics_collector.updated,
+            "error": dns_metrics_collector.error
+        })
+        return HTMLResponse(content=rendered.strip())
+    except Exception as e:
+        logger.error(f"Error in get_dns_metrics: {e}", exc_info=True)
+        error_html = f"<div class='error'>Error: {str(e)}</div>"
+        return HTMLResponse(content=error_html, status_code=500)
+
+
+@router.get("/api/settings/dns/metrics/data")
+async def get_dns_metrics_data():
+    """Get per-minute DNS metrics as JSON (parsed from the dqcache log)"""
+    metrics = await run_in_threadpool(dns_metrics_collector.snapshot)
+    return JSONResponse(content={
+        "success": not dns_metrics_collector.error,
+        "message": dns_metrics_collector.error,
+        "data": {
+            "updated": dns_metrics_collector.updated,
+            "interval": dns_metrics_collector.interval,
+            **metrics
+        }
+    })
@@ -8,19 +8,13 @@ import os
 import logging
 from fastapi import APIRouter, Form, Request, Query
 from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
+from templating import templates
 from typing import Optional, List
+from envdir import save_settings
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-# Get the directory where this script is located
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-
-# Setup templates - use relative path from www directory
-templates_dir = os.path.join(BASE_DIR, "templates")
-templates = Jinja2Templates(directory=templates_dir)
-
 # Settings directory
 ENV_DIR = "/var/lib/rpiap/env"
 MODE_FILE = os.path.join(ENV_DIR, "mode")
@@ -76,56 +70,26 @@ def load_enabled_interfaces():
         return ["wlan0"]
 
 
-def save_mode(mode: str):
+def format_interfaces(interfaces: List[str]) -> str:
     """
-    Save mode to ENV_DIR/mode file
+    Format interfaces as ENV_DIR/lan file content, only allowed interfaces are kept
     """
-    try:
-        if not os.path.exists(ENV_DIR):
-            os.makedirs(ENV_DIR, mode=0o700)
-
-        with open(MODE_FILE, 'w') as f:
-            f.write(mode)
-        os.chmod(MODE_FILE, 0o600)
-    except Exception as e:
-        logger.error(f"Error saving mode: {e}")
-        raise
+    valid_interfaces = [iface for iface in interfaces if iface in ALLOWED_INTERFACES]
+    return "".join(f"{iface}\n" for iface in valid_interfaces)
 
 
-def save_enabled_interfaces(interfaces: List[str]):
+def save_mode_and_interfaces(mode: str, interfaces: List[str]):
     """
-    Save enabled interfaces to ENV_DIR/lan file
+    Save mode and enabled interfaces together, each file is replaced
+    atomically (see envdir.save_settings)
     """
     try:
-        if not os.path.exists(ENV_DIR):
-            os.makedirs(ENV_DIR, mode=0o700)
-
-        # Filter to only allowed interfaces
-        valid_interfaces = [iface for iface in interfaces if iface in ALLOWED_INTERFACES]
-        
-        with open(LAN_FILE, 'w') as f:
-            for iface in valid_interfaces:
-                f.write(f"{iface}\n")
-        os.chmod(LAN_FILE, 0o600)
+        save_settings(ENV_DIR, {"mode": mode, "lan": format_interfaces(interfaces)})
     except Exception as e:
-        logger.error(f"Error saving enabled interfaces: {e}")
+        logger.error(f"Error saving mode settings: {e}")
         raise
 
 
-def create_reboot_flag():
-    """Create /run/rpiap/need-reboot file when settings are saved"""
-    try:
-        reboot_flag_dir = "/run/rpiap"
-        reboot_flag_file = os.path.join(reboot_flag_dir, "need-reboot")
-        if not os.path.exists(reboot_flag_dir):
-            os.makedirs(reboot_flag_dir, mode=0o755)
-        with open(reboot_flag_file, 'w') as f:
-            f.write("")
-        os.chmod(reboot_flag_file, 0o644)
-    except Exception as e:
-        logger.warning(f"Could not create need-reboot file: {e}")
-
-
 @router.get("/api/settings/mode", response_class=HTMLResponse)
 async def get_mode_settings(request: Request, mode: Optional[str] = Query(None)):
     """Get mode settings form as HTML"""
@@ -172,26 +136,23 @@ async def save_mode_settings(
         if mode not in ["ap", "client", "bridge", "custom"]:
             raise ValueError(f"Invalid mode: {mode}")
 
-        # Save mode
-        save_mode(mode)
-
         # Handle interfaces based on mode
         if mode == "custom":
             # Save custom interfaces
             if custom_interfaces:
-                save_enabled_interfaces(custom_interfaces)
+                interfaces = custom_interfaces
             else:
                 # If no interfaces selected, default to wlan0
-                save_enabled_interfaces(["wlan0"])
+                interfaces = ["wlan0"]
         elif mode == "ap":
-            save_enabled_interfaces(["wlan0"])
+            interfaces = ["wlan0"]
         elif mode == "client":
-            save_enabled_interfaces(["eth0"])
+            interfaces = ["eth0"]
         elif mode == "bridge":
-            save_enabled_interfaces(["eth0", "wlan0"])
+            interfaces = ["eth0", "wlan0"]
 
-        # Create reboot flag
-        create_reboot_flag()
+        # Save mode and interfaces together, the need-reboot flag is created when they changed
+        save_mode_and_interfaces(mode, interfaces)
 
         # Reload settings to get current state
         current_mode = load_mode()
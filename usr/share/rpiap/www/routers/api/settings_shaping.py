@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Traffic Shaping Settings API endpoint
+Handles GET (load) and POST (save) operations for the per-client shaping settings
+applied to the 'lan' bridge by ifupdownd.link.d/60-shaping.sh and the WAN SQM
+bandwidths applied by ifupdownd.link.d/60-sqm.sh, both re-run right after a save
+"""
+
+import os
+import logging
+from fastapi import APIRouter, Form, Request
+from fastapi.responses import HTMLResponse
+from templating import templates
+from typing import Optional
+from envdir import save_settings
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+# Settings directory
+ENV_DIR = "/var/lib/rpiap/env"
+LAN_FILE = os.path.join(ENV_DIR, "lan")
+
+# Allowed interfaces, the ones not in LAN are uplinks (WAN)
+ALLOWED_INTERFACES = ["eth0", "eth1", "eth2", "wlan0", "wlan1", "usb0"]
+
+# Defaults of settings missing in ENV_DIR (shaping off, no caps)
+DEFAULT_SETTINGS = {
+    "shaping_enabled": "false",
+    "shaping_download": "0",
+    "shaping_client_limit": "0",
+}
+
+# Link scripts applying the settings, re-run by ifupdownd after a save
+REAPPLY_SCRIPTS = ("60-shaping.sh", "60-sqm.sh")
+
+# Mbit/s
+MAX_BANDWIDTH = 10000
+# kbit/s
+MAX_SQM_BANDWIDTH = MAX_BANDWIDTH * 1000
+
+
+def load_wan_interfaces():
+    """
+    Allowed interfaces not in ENV_DIR/lan
+    """
+    lan = ["wlan0"]
+    try:
+        if os.path.exists(LAN_FILE):
+            with open(LAN_FILE, 'r') as f:
+                lan = [line.strip() for line in f.readlines() if line.strip()]
+    except Exception as e:
+        logger.error(f"Error loading LAN interfaces: {e}")
+    return [iface for iface in ALLOWED_INTERFACES if iface not in lan]
+
+
+def sqm_keys(interfaces):
+    """Settings of WAN SQM bandwidths (kbit/s) of the interfaces"""
+    return [f"sqm_{iface}_{direction}" for iface in interfaces for direction in ("upload", "download")]
+
+
+def load_settings():
+    """
+    Load shaping settings from individual files in ENV_DIR
+    """
+    settings = dict(DEFAULT_SETTINGS)
+    keys = list(DEFAULT_SETTINGS) + sqm_keys(load_wan_interfaces())
+
+    try:
+        if not os.path.exists(ENV_DIR):
+            logger.warning(f"Settings directory {ENV_DIR} does not exist")
+            return settings
+
+        for key in keys:
+            file_path = os.path.join(ENV_DIR, key)
+            try:
+                if os.path.isfile(file_path):
+                    with open(file_path, 'r') as f:
+                        settings[key] = f.read().strip()
+            except Exception:
+                continue
+    except Exception as e:
+        logger.error(f"Error loading settings: {e}")
+
+    return settings
+
+
+def render_form(request: Request, settings: dict, error: str = "") -> str:
+    return templates.get_template("partials/settings_shaping_form.html").render({
+        "request": request,
+        "settings": settings,
+        "wan_interfaces": load_wan_interfaces(),
+        "error": error
+    })
+
+
+def parse_bandwidth(name: str, value: Optional[str], maximum: int = MAX_BANDWIDTH, unit: str = "Mbit/s") -> str:
+    """Return bandwidth as string, 0 (or empty) means no limit"""
+    value = (value or "").strip() or "0"
+    try:
+        bandwidth = int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a whole number of {unit}")
+    if bandwidth < 0 or bandwidth > maximum:
+        raise ValueError(f"{name} must be between 0 and {maximum} {unit}")
+    return str(bandwidth)
+
+
+@router.get("/api/settings/shaping", response_class=HTMLResponse)
+async def get_shaping_settings(request: Request):
+    """Get traffic shaping settings form as HTML"""
+    try:
+        return HTMLResponse(content=render_form(request, load_settings()), status_code=200)
+    except Exception as e:
+        logger.error(f"Error in get_shaping_settings: {e}")
+        error_html = HTMLResponse(
+            content=render_form(request, dict(DEFAULT_SETTINGS), f"Error loading shaping settings: {str(e)}"),
+            status_code=500
+        )
+        error_html.headers["HX-Trigger"] = "showErrorBar"
+        return error_html
+
+
+@router.post("/api/settings/shaping", response_class=HTMLResponse)
+async def save_shaping_settings(
+    request: Request,
+    shaping_enabled: Optional[str] = Form("false"),
+    shaping_download: Optional[str] = Form("0"),
+    shaping_client_limit: Optional[str] = Form("0")
+):
+    """Save traffic shaping settings - POST endpoint, returns HTML form"""
+    try:
+        settings = {}
+
+        # Validate shaping_enabled - convert to boolean string
+        if (shaping_enabled or "").strip().lower() in ("true", "1", "yes", "on"):
+            settings["shaping_enabled"] = "true"
+        else:
+            settings["shaping_enabled"] = "false"
+
+        # Validate bandwidths
+        try:
+            settings["shaping_download"] = parse_bandwidth("Total download", shaping_download)
+            settings["shaping_client_limit"] = parse_bandwidth("Per-client limit", shaping_client_limit)
+            # WAN SQM fields are named after the settings, one pair per WAN interface
+            form = await request.form()
+            for key in sqm_keys(load_wan_interfaces()):
+                iface, direction = key.split("_")[1:]
+                settings[key] = parse_bandwidth(f"{iface} {direction}", form.get(key), MAX_SQM_BANDWIDTH, "kbit/s")
+        except ValueError as e:
+            error_html = HTMLResponse(content=render_form(request, {**load_settings(), **settings}, str(e)),
+                                      status_code=400)
+            error_html.headers["HX-Trigger"] = "showErrorBar"
+            return error_html
+
+        # applied right away, no reboot needed
+        save_settings(ENV_DIR, settings, reapply=REAPPLY_SCRIPTS)
+
+        # Return success response with HX-Trigger to show success status bar and refresh info bar
+        response = HTMLResponse(content=render_form(request, load_settings()), status_code=200)
+        response.headers["HX-Trigger"] = '{"showSuccessBar": true, "refreshInfoBar": true}'
+        return response
+
+    except Exception as e:
+        logger.error(f"Error saving shaping settings: {e}")
+        # Return error response with HX-Trigger to show error status bar
+        error_html = HTMLResponse(
+            content=render_form(request, load_settings(), f"Error saving shaping settings: {str(e)}"),
+            status_code=500
+        )
+        error_html.headers["HX-Trigger"] = "showErrorBar"
+        return error_html
@@ -8,19 +8,13 @@ import os
 import logging
 from fastapi import APIRouter, Form, Request
 from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
+from templating import templates
 from typing import Optional
+from envdir import save_settings
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-# Get the directory where this script is located
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-
-# Setup templates - use relative path from www directory
-templates_dir = os.path.join(BASE_DIR, "templates")
-templates = Jinja2Templates(directory=templates_dir)
-
 # Settings directory
 ENV_DIR = "/var/lib/rpiap/env"
 
@@ -54,43 +48,6 @@ def load_settings():
     return settings
 
 
-def save_settings(settings: dict):
-    """
-    Save provided settings to files
-    """
-    try:
-        if not os.path.exists(ENV_DIR):
-            os.makedirs(ENV_DIR, mode=0o700)
-
-        for key, value in settings.items():
-            file_path = os.path.join(ENV_DIR, key)
-
-            try:
-                with open(file_path, 'w') as f:
-                    f.write(value)
-                # Set proper permissions
-                os.chmod(file_path, 0o600)
-            except Exception as e:
-                logger.error(f"Error saving {key}: {e}")
-
-        # Create /run/rpiap/need-reboot file when any settings are saved
-        try:
-            reboot_flag_dir = "/run/rpiap"
-            reboot_flag_file = os.path.join(reboot_flag_dir, "need-reboot")
-            if not os.path.exists(reboot_flag_dir):
-                os.makedirs(reboot_flag_dir, mode=0o755)
-            with open(reboot_flag_file, 'w') as f:
-                f.write("")
-            os.chmod(reboot_flag_file, 0o644)
-        except Exception as e:
-            logger.warning(f"Could not create need-reboot file: {e}")
-
-        return "Settings saved successfully"
-    except Exception as e:
-        logger.error(f"Error saving settings: {e}")
-        raise
-
-
 @router.get("/api/settings/wcli", response_class=HTMLResponse)
 async def get_wcli_settings(request: Request):
     """Get Client settings form as HTML"""
@@ -150,7 +107,7 @@ async def save_wcli_settings(
                 return error_html
             settings["wpasupplicant_password"] = wpasupplicant_password
 
-        message = save_settings(settings)
+        save_settings(ENV_DIR, settings)
         current_settings = load_settings()
 
         form_html = templates.get_template("partials/settings_wcli_form.html").render({
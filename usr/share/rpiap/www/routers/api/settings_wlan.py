@@ -6,11 +6,15 @@ Handles GET (load) and POST (save) operations for WLAN settings
 
 import os
 import json
+import time
 import logging
 from fastapi import APIRouter, Form, Request, Query
 from fastapi.responses import HTMLResponse, PlainTextResponse
-from fastapi.templating import Jinja2Templates
+from templating import templates
 from typing import Optional
+from starlette.concurrency import run_in_threadpool
+from envdir import save_settings
+from survey import channel_survey, channel_to_freq, channel_band, score_channels, best_channel, SurveyError
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -18,13 +22,12 @@ logger = logging.getLogger(__name__)
 # Get the directory where this script is located
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-# Setup templates - use relative path from www directory
-templates_dir = os.path.join(BASE_DIR, "templates")
-templates = Jinja2Templates(directory=templates_dir)
-
 # Settings directory
 ENV_DIR = "/var/lib/rpiap/env"
 
+# Rendered select fragments kept by CountriesIndex (keys include request values)
+MAX_FRAGMENTS = 256
+
 
 def load_settings():
     """
@@ -55,104 +58,133 @@ def load_settings():
     return settings
 
 
-def save_settings(settings: dict):
-    """
-    Save provided settings to files
+class CountriesIndex:
     """
-    try:
-        if not os.path.exists(ENV_DIR):
-            os.makedirs(ENV_DIR, mode=0o700)
+    Indexed country/channel table from static/settings.json
 
-        for key, value in settings.items():
-            file_path = os.path.join(ENV_DIR, key)
+    The file is parsed once and reloaded only when its mtime changes. Channel
+    option lists are precomputed per country and rendered select fragments
+    are cached, so switching the country is a dict lookup.
+    """
 
-            try:
-                with open(file_path, 'w') as f:
-                    f.write(value)
-                # Set proper permissions
-                os.chmod(file_path, 0o600)
-            except Exception as e:
-                logger.error(f"Error saving {key}: {e}")
-
-        # Create /run/rpiap/need-reboot file when any settings are saved
+    def __init__(self, path: str):
+        self.path = path
+        self.mtime_ns = None
+        self.countries = []
+        self.by_code = {}
+        self.channels_by_code = {}
+        self.default_channels = []
+        self.fragments = {}
+
+    def refresh(self):
+        """Reload the table if settings.json changed since the last load"""
         try:
-            reboot_flag_dir = "/run/rpiap"
-            reboot_flag_file = os.path.join(reboot_flag_dir, "need-reboot")
-            if not os.path.exists(reboot_flag_dir):
-                os.makedirs(reboot_flag_dir, mode=0o755)
-            with open(reboot_flag_file, 'w') as f:
-                f.write("")
-            os.chmod(reboot_flag_file, 0o644)
+            mtime_ns = os.stat(self.path).st_mtime_ns
+            if mtime_ns == self.mtime_ns:
+                return
+            with open(self.path, 'r') as f:
+                countries = json.load(f).get("countries", [])
         except Exception as e:
-            logger.warning(f"Could not create need-reboot file: {e}")
+            logger.error(f"Error loading countries data: {e}")
+            return
+
+        # Collect all unique channels from all countries
+        all_channels = {}
+        for c in countries:
+            for ch in c.get("allowed_channels", []):
+                if ch["id"] not in all_channels:
+                    all_channels[ch["id"]] = ch["description"]
+
+        self.countries = countries
+        self.by_code = {str(c.get("code", "")): c for c in reversed(countries)}
+        self.channels_by_code = {
+            code: self._build_channels(all_channels, {ch["id"] for ch in c.get("allowed_channels", [])})
+            for code, c in self.by_code.items()
+        }
+        # If no country selected or country not found, only channel 0 is allowed
+        self.default_channels = self._build_channels(all_channels, {0})
+        self.fragments = {}
+        self.mtime_ns = mtime_ns
+
+    @staticmethod
+    def _build_channels(all_channels: dict, allowed_channel_ids: set) -> list:
+        """Build channels list with all channels, disabled if not allowed"""
+        channels = []
+        for channel_id in sorted(all_channels.keys()):
+            is_disabled = channel_id not in allowed_channel_ids
+            description = all_channels[channel_id]
+            if is_disabled:
+                # Remove "(unavailable)" if already present, then add it
+                description = description.replace(" (unavailable)", "") + " (unavailable)"
+            channels.append({
+                "id": channel_id,
+                "description": description,
+                "disabled": is_disabled
+            })
+        return channels
+
+    def get_countries(self) -> list:
+        """Return list of countries"""
+        self.refresh()
+        return self.countries
+
+    def get_channels(self, country: str) -> list:
+        """Return channel options for the country code"""
+        self.refresh()
+        return self.channels_by_code.get(str(country), self.default_channels)
+
+    def _render(self, name: str, key: tuple, context: dict) -> str:
+        """Render template, cached per key until settings.json or the template changes"""
+        # get_template() returns a new object when the template file was modified
+        template = templates.get_template(name)
+        cached = self.fragments.get((name,) + key)
+        if cached is not None and cached[0] is template:
+            return cached[1]
+        html = template.render(context)
+        if len(self.fragments) >= MAX_FRAGMENTS:
+            self.fragments.clear()
+        self.fragments[(name,) + key] = (template, html)
+        return html
+
+    def render_countries_select(self, current_country: str) -> str:
+        """Return rendered countries select with current_country selected"""
+        self.refresh()
+        return self._render("partials/countries_select.html", (str(current_country),), {
+            "countries": self.countries,
+            "current_country": current_country
+        })
+
+    def render_channels_select(self, country: str, current_channel: str) -> str:
+        """Return rendered channels select for the country with current_channel selected"""
+        self.refresh()
+        # unknown countries share the default channels, and one cache entry
+        code = str(country) if str(country) in self.channels_by_code else None
+        return self._render("partials/channels_select.html", (code, str(current_channel)), {
+            "channels": self.get_channels(country),
+            "current_channel": current_channel
+        })
 
-        return "Settings saved successfully"
-    except Exception as e:
-        logger.error(f"Error saving settings: {e}")
-        raise
+
+countries_index = CountriesIndex(os.path.join(BASE_DIR, "static", "settings.json"))
 
 
 def load_countries_data():
     """Load countries data from settings.json"""
-    settings_json_path = os.path.join(BASE_DIR, "static", "settings.json")
-    try:
-        with open(settings_json_path, 'r') as f:
-            data = json.load(f)
-            return data.get("countries", [])
-    except Exception as e:
-        logger.error(f"Error loading countries data: {e}")
-        return []
+    return countries_index.get_countries()
 
 
 def prepare_form_data(settings: dict = None, country: str = None):
     """Prepare countries and channels data for the form"""
     if settings is None:
         settings = load_settings()
-    
-    countries = load_countries_data()
+
     current_country = country if country is not None else settings.get("hostapd_country", "")
     current_channel = settings.get("hostapd_channel", "0")
-    
-    # Collect all unique channels from all countries
-    all_channels = {}
-    for c in countries:
-        for ch in c.get("allowed_channels", []):
-            if ch["id"] not in all_channels:
-                all_channels[ch["id"]] = ch["description"]
-    
-    # Find country data to determine which channels are allowed
-    country_data = None
-    for c in countries:
-        country_code = c.get("code", "")
-        if str(country_code) == str(current_country):
-            country_data = c
-            break
-    
-    # Get allowed channel IDs for selected country
-    allowed_channel_ids = set()
-    if country_data:
-        allowed_channel_ids = {ch["id"] for ch in country_data.get("allowed_channels", [])}
-    else:
-        # If no country selected or country not found, only channel 0 is allowed
-        allowed_channel_ids = {0}
-    
-    # Build channels list with all channels, disabled if not allowed
-    channels = []
-    for channel_id in sorted(all_channels.keys()):
-        is_disabled = channel_id not in allowed_channel_ids
-        description = all_channels[channel_id]
-        if is_disabled:
-            description = description.replace(" (unavailable)", "") + " (unavailable)"
-        channels.append({
-            "id": channel_id,
-            "description": description,
-            "disabled": is_disabled
-        })
-    
+
     return {
-        "countries": countries,
+        "countries": countries_index.get_countries(),
         "current_country": current_country,
-        "channels": channels,
+        "channels": countries_index.get_channels(current_country),
         "current_channel": current_channel
     }
 
@@ -161,14 +193,10 @@ def prepare_form_data(settings: dict = None, country: str = None):
 async def get_countries_select(request: Request):
     """Get countries select as HTML"""
     try:
-        countries = load_countries_data()
         settings = load_settings()
         current_country = settings.get("hostapd_country", "")
-        return templates.TemplateResponse("partials/countries_select.html", {
-            "request": request,
-            "countries": countries,
-            "current_country": current_country
-        })
+        html = countries_index.render_countries_select(current_country)
+        return HTMLResponse(content=html, status_code=200)
     except Exception as e:
         logger.error(f"Error loading countries: {e}")
         return HTMLResponse(content=f"<select><option>Error loading countries</option></select>", status_code=500)
@@ -178,7 +206,6 @@ async def get_countries_select(request: Request):
 async def get_channels_select(request: Request, hostapd_country: str = Query(None, alias="hostapd_country")):
     """Get channels select as HTML based on country"""
     try:
-        countries = load_countries_data()
         settings = load_settings()
         current_channel = settings.get("hostapd_channel", "0")
         
@@ -187,52 +214,9 @@ async def get_channels_select(request: Request, hostapd_country: str = Query(Non
             country = hostapd_country
         else:
             country = settings.get("hostapd_country", "")
-        
-        # Collect all unique channels from all countries
-        all_channels = {}
-        for c in countries:
-            for ch in c.get("allowed_channels", []):
-                if ch["id"] not in all_channels:
-                    all_channels[ch["id"]] = ch["description"]
-        
-        # Find country data to determine which channels are allowed
-        # Handle empty string country code (for "Not set")
-        country_data = None
-        for c in countries:
-            country_code = c.get("code", "")
-            # Compare both as strings, handling empty string case
-            if str(country_code) == str(country):
-                country_data = c
-                break
-        
-        # Get allowed channel IDs for selected country
-        allowed_channel_ids = set()
-        if country_data:
-            allowed_channel_ids = {ch["id"] for ch in country_data.get("allowed_channels", [])}
-        else:
-            # If no country selected or country not found, only channel 0 is allowed
-            allowed_channel_ids = {0}
-        
-        # Build channels list with all channels, disabled if not allowed
-        # Add "(unavailable)" to description if disabled
-        channels = []
-        for channel_id in sorted(all_channels.keys()):
-            is_disabled = channel_id not in allowed_channel_ids
-            description = all_channels[channel_id]
-            if is_disabled:
-                # Remove "(unavailable)" if already present, then add it
-                description = description.replace(" (unavailable)", "") + " (unavailable)"
-            channels.append({
-                "id": channel_id,
-                "description": description,
-                "disabled": is_disabled
-            })
-        
-        return templates.TemplateResponse("partials/channels_select.html", {
-            "request": request,
-            "channels": channels,
-            "current_channel": current_channel
-        })
+
+        html = countries_index.render_channels_select(country, current_channel)
+        return HTMLResponse(content=html, status_code=200)
     except Exception as e:
         logger.error(f"Error loading channels: {e}")
         return HTMLResponse(content=f"<select><option>Error loading channels</option></select>", status_code=500)
@@ -370,7 +354,7 @@ async def save_wlan_settings(
             # If not set, save empty string
             settings["hostapd_country"] = ""
 
-        message = save_settings(settings)
+        save_settings(ENV_DIR, settings)
         current_settings = load_settings()
         form_data = prepare_form_data(current_settings)
 
@@ -394,3 +378,77 @@ async def save_wlan_settings(
         error_response.headers["HX-Trigger"] = json.dumps({"showErrorBar": {"message": error_message}})
         return error_response
 
+
+def survey_channels(country: str) -> list:
+    """Return channel numbers allowed for the country which the survey can score"""
+    return [ch["id"] for ch in countries_index.get_channels(country)
+            if not ch["disabled"] and channel_to_freq(ch["id"])]
+
+
+def render_survey(request: Request, record: Optional[dict], error: str = "") -> HTMLResponse:
+    """Render channel survey partial with channel scores and the suggested channel"""
+    settings = load_settings()
+    try:
+        current_channel = int(settings.get("hostapd_channel", "0") or "0")
+    except ValueError:
+        current_channel = 0
+    scores = []
+    suggested = None
+    if record:
+        scores = score_channels(record["bss"], survey_channels(settings.get("hostapd_country", "")))
+        # stay in the band of the current channel, channel 0 runs hostapd on 5 GHz
+        band = channel_band(current_channel) if current_channel else "5"
+        suggested = best_channel(scores, band) or best_channel(scores)
+
+    return templates.TemplateResponse("partials/settings_wlan_survey.html", {
+        "request": request,
+        "record": record,
+        "scanned_at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(record["timestamp"])) if record else "",
+        "age_minutes": int((time.time() - record["timestamp"]) // 60) if record else 0,
+        "scores": scores,
+        "suggested": suggested,
+        "current_channel": current_channel,
+        "error": error
+    })
+
+
+@router.get("/api/settings/wlan/survey", response_class=HTMLResponse)
+async def get_wlan_survey(request: Request, refresh: Optional[str] = Query(None)):
+    """Get channel survey as HTML, the cached scan unless refresh is requested"""
+    try:
+        record = await run_in_threadpool(channel_survey.get, refresh == "true")
+    except SurveyError as e:
+        logger.warning(f"Channel survey failed: {e}")
+        return render_survey(request, channel_survey.record, str(e))
+    return render_survey(request, record)
+
+
+@router.post("/api/settings/wlan/survey/apply", response_class=HTMLResponse)
+async def apply_wlan_survey(request: Request, channel: str = Form(...)):
+    """Save channel suggested by the survey - POST endpoint, returns the survey HTML"""
+    try:
+        settings = load_settings()
+        try:
+            ch = int(channel.strip())
+        except ValueError:
+            ch = None
+        if ch is None or ch not in survey_channels(settings.get("hostapd_country", "")):
+            error_message = f"Channel '{channel}' is not allowed in the selected country"
+            error_response = PlainTextResponse(content=error_message, status_code=400)
+            error_response.headers["HX-Trigger"] = json.dumps({"showErrorBar": {"message": error_message}})
+            return error_response
+
+        save_settings(ENV_DIR, {"hostapd_channel": str(ch)})
+        logger.info(f"Channel {ch} applied from channel survey")
+
+        # Reload the WLAN form too, it shows the channel
+        response = render_survey(request, channel_survey.record)
+        response.headers["HX-Trigger"] = '{"showSuccessBar": true, "refreshInfoBar": true, "wlanChannelChanged": true}'
+        return response
+
+    except Exception as e:
+        logger.error(f"Error applying surveyed channel: {e}")
+        error_message = f"Error applying channel: {str(e)}"
+        error_response = PlainTextResponse(content=error_message, status_code=500)
+        error_response.headers["HX-Trigger"] = json.dumps({"showErrorBar": {"message": error_message}})
+        return error_response
@@ -6,11 +6,11 @@ Home router - handles /api/sidebar endpoint
 import logging
 from fastapi import APIRouter, Request
 from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
+from templating import templates
+from fragments import cached_template_response
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
-templates = Jinja2Templates(directory="templates")
 
 
 @router.get("/api/sidebar/update")
@@ -25,8 +25,7 @@ async def sidebar_update(request: Request) -> HTMLResponse:
     """
     current_path = str(request.query_params.get("current_path", request.url.path))
     logger.debug("Sidebar update requested for path: %s", current_path)
-    return templates.TemplateResponse("partials/sidebar.html", {
-        "request": request,
+    return cached_template_response(request, templates, "partials/sidebar.html", {
         "current_path": current_path
     })
 
@@ -3,24 +3,243 @@
 Speed Test API endpoint
 Accepts ping and download parameters
 Returns JSON with success, message, and data fields
+Streams raw random data for throughput measurement
+Consumes uploaded data for upload throughput measurement
+Measures latency and jitter with a WebSocket ping train
+Heavy endpoints go through admission control (429 with Retry-After over the limits)
 """
 
 import os
+import re
+import asyncio
+import math
 import binascii
 import time
 import json
-from fastapi import APIRouter, Query, Request
-from fastapi.responses import HTMLResponse, JSONResponse
-from fastapi.templating import Jinja2Templates
+import zlib
+import collections
+from typing import Optional
+from fastapi import APIRouter, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
+from starlette.requests import ClientDisconnect
+from templating import templates
+from admission import ByteBudget, EndpointLimiter, Rejected, Ticket, client_id, too_many_requests, release_after
 
 router = APIRouter()
 
-# Get the directory where this script is located
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Streaming download - random data is generated once and reused by all requests
+# (5 MiB also backs the largest 10 MB hex download, hex encoded per request)
+STREAM_BUFFER_SIZE = 5 * 1024 * 1024
+STREAM_CHUNK_SIZE = 64 * 1024
+STREAM_DEFAULT_SIZE = 25 * 1024 * 1024
+STREAM_MAX_SIZE = 1024 * 1024 * 1024
+STREAM_MAX_DURATION = 30.0
 
-# Setup templates - use absolute path
-templates_dir = os.path.join(BASE_DIR, "templates")
-templates = Jinja2Templates(directory=templates_dir)
+# Upload test - largest accepted request body
+UPLOAD_MAX_SIZE = 64 * 1024 * 1024
+
+# Multi-stream tests - parallel streams per test, statistics kept for recent tests only
+MAX_STREAMS = 8
+STATS_MAX_TESTS = 32
+TEST_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,32}$")
+
+# Latency test - WebSocket ping train, unanswered pings count as lost after PING_TIMEOUT
+PING_DEFAULT_COUNT = 50
+PING_MAX_COUNT = 500
+PING_DEFAULT_INTERVAL = 0.05
+PING_MIN_INTERVAL = 0.01
+PING_MAX_INTERVAL = 1.0
+PING_TIMEOUT = 2.0
+
+# Admission control - data generated by in-flight download requests is capped in total,
+# streams and uploads reuse one buffer / do not buffer, so only their concurrency is limited
+download_budget = ByteBudget(64 * 1024 * 1024)
+download_limiter = EndpointLimiter("download", max_concurrent=4, rate=20, burst=40, budget=download_budget)
+stream_limiter = EndpointLimiter("stream", max_concurrent=2 * MAX_STREAMS, rate=4, burst=2 * MAX_STREAMS)
+upload_limiter = EndpointLimiter("upload", max_concurrent=2 * MAX_STREAMS, rate=20, burst=4 * MAX_STREAMS)
+ping_limiter = EndpointLimiter("latency", max_concurrent=8, rate=1, burst=4)
+
+
+class RandomBuffer:
+    """Preallocated incompressible data reused by all download tests.
+
+    The buffer is split once into write-sized memoryview chunks, so streaming
+    neither generates nor copies data per request. Its CRC32 is computed once
+    as well; a stream is the buffer repeated, so clients verify every full
+    buffer-sized block of what they receive against that single value.
+    """
+
+    def __init__(self, size: int, chunk_size: int):
+        self.data = os.urandom(size)
+        view = memoryview(self.data)
+        self.chunks = [view[i:i + chunk_size] for i in range(0, size, chunk_size)]
+        self.crc32 = zlib.crc32(self.data)
+
+    def hex(self, size: int) -> bytes:
+        """First size hex digits of the buffer for the legacy downloads, encoded per request."""
+        return binascii.hexlify(memoryview(self.data)[:(size + 1) // 2])[:size]
+
+
+_random_buffer = None
+
+
+def get_random_buffer() -> RandomBuffer:
+    """Return the shared random buffer, created on first use."""
+    global _random_buffer
+    if _random_buffer is None:
+        _random_buffer = RandomBuffer(STREAM_BUFFER_SIZE, STREAM_CHUNK_SIZE)
+    return _random_buffer
+
+
+class StreamStats:
+    """Transferred bytes and timing of one stream of a test, from its first to its last transferred chunk."""
+
+    def __init__(self):
+        self.bytes = 0
+        self.start = time.monotonic()
+        self.end = self.start
+
+    def add(self, count: int) -> None:
+        now = time.monotonic()
+        if self.bytes == 0:
+            self.start = now
+        self.bytes += count
+        self.end = now
+
+
+class TestStats:
+    """Per-stream statistics of recent multi-stream tests, keyed by client chosen test id."""
+
+    def __init__(self, max_tests: int):
+        self.max_tests = max_tests
+        self.tests = collections.OrderedDict()
+
+    def stream(self, test_id: str, direction: str, stream_id: int) -> StreamStats:
+        """Return statistics of the stream, created on first use (upload streams span several requests)."""
+        key = (test_id, direction)
+        streams = self.tests.get(key)
+        if streams is None:
+            streams = self.tests[key] = {}
+            while len(self.tests) > self.max_tests:
+                self.tests.popitem(last=False)
+        if stream_id not in streams:
+            streams[stream_id] = StreamStats()
+        return streams[stream_id]
+
+    def summary(self, test_id: str, direction: str) -> Optional[dict]:
+        """Return per-stream and aggregate throughput, None for an unknown test."""
+        streams = self.tests.get((test_id, direction))
+        if not streams:
+            return None
+
+        def speed_mbps(count, duration):
+            return (count * 8) / (duration * 1000000) if duration > 0 else 0
+
+        per_stream = []
+        for stream_id in sorted(streams):
+            stats = streams[stream_id]
+            duration = stats.end - stats.start
+            per_stream.append({
+                "stream": stream_id,
+                "bytes": stats.bytes,
+                "duration": duration,
+                "speed_mbps": speed_mbps(stats.bytes, duration)
+            })
+        total_bytes = sum(stats.bytes for stats in streams.values())
+        duration = max(stats.end for stats in streams.values()) - min(stats.start for stats in streams.values())
+        return {
+            "direction": direction,
+            "streams": per_stream,
+            "bytes": total_bytes,
+            "duration": duration,
+            "speed_mbps": speed_mbps(total_bytes, duration)
+        }
+
+
+test_stats = TestStats(STATS_MAX_TESTS)
+
+
+def get_stream_stats(test_id: Optional[str], direction: str, stream_id: int) -> Optional[StreamStats]:
+    """Return stream statistics for a valid test id, None if the request is not part of a tracked test."""
+    if test_id is None or not TEST_ID_RE.match(test_id):
+        return None
+    return test_stats.stream(test_id, direction, max(0, min(stream_id, MAX_STREAMS - 1)))
+
+
+class BufferStreamingResponse(StreamingResponse):
+    """StreamingResponse sending memoryview chunks of the shared buffer without copying them to bytes."""
+
+    async def stream_response(self, send) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers,
+        })
+        async for chunk in self.body_iterator:
+            if not isinstance(chunk, (bytes, memoryview)):
+                chunk = chunk.encode(self.charset)
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+def server_timing(**metrics) -> str:
+    """Format Server-Timing header value from durations in seconds."""
+    return ", ".join(f"{name};dur={duration * 1000:.3f}" for name, duration in metrics.items())
+
+
+async def stream_random(size: Optional[int] = None, duration: Optional[float] = None,
+                        stats: Optional[StreamStats] = None, ticket: Optional[Ticket] = None):
+    """Yield random data until size bytes were sent or duration seconds elapsed."""
+    chunks = get_random_buffer().chunks
+    deadline = time.monotonic() + duration if duration is not None else None
+    sent = 0
+    i = 0
+    try:
+        while True:
+            chunk = chunks[i]
+            i = (i + 1) % len(chunks)
+            if deadline is not None:
+                if time.monotonic() >= deadline:
+                    break
+            else:
+                remaining = size - sent
+                if remaining <= 0:
+                    break
+                if remaining < len(chunk):
+                    chunk = chunk[:remaining]
+            yield chunk
+            sent += len(chunk)
+            if stats is not None:
+                stats.add(len(chunk))
+    finally:
+        if ticket is not None:
+            ticket.release()
+
+
+def ping_stats(rtts: list, count: int) -> dict:
+    """Summarize round trip times (seconds, in send order) of a ping train of count pings, in ms."""
+    lost = count - len(rtts)
+    result = {
+        "count": count,
+        "received": len(rtts),
+        "loss_percent": (lost * 100.0 / count) if count else 0.0,
+        "min": None,
+        "avg": None,
+        "p95": None,
+        "max": None,
+        "jitter": None
+    }
+    if not rtts:
+        return result
+    ms = [rtt * 1000 for rtt in rtts]
+    ordered = sorted(ms)
+    result["min"] = ordered[0]
+    result["avg"] = sum(ms) / len(ms)
+    result["p95"] = ordered[max(0, math.ceil(len(ordered) * 0.95) - 1)]
+    result["max"] = ordered[-1]
+    # mean difference of consecutive round trips
+    result["jitter"] = (sum(abs(b - a) for a, b in zip(ms, ms[1:])) / (len(ms) - 1)) if len(ms) > 1 else 0.0
+    return result
 
 
 def handle_ping():
@@ -33,28 +252,20 @@ def handle_ping():
 
 
 def handle_download(size: int = 1048576, chunk_id: int = 1):
-    """Handle download test - returns hex encoded data"""
+    """Handle download test - returns hex encoded data with its CRC32"""
     # Limit size to reasonable range (1KB to 10MB)
     size = max(1024, min(size, 10485760))
     
-    # Generate random data
-    data = binascii.hexlify(os.urandom(size//2)).decode('utf-8')
-    
-    # Calculate hash of the generated data (same algorithm as JavaScript)
-    data_hash = 0
-    if len(data) > 0:
-        for char in data:
-            data_hash = ((data_hash << 5) - data_hash) + ord(char)
-            data_hash = data_hash & 0xFFFFFFFF  # Convert to 32-bit unsigned integer
-    
-    # Convert to positive hex string (8 characters)
-    data_hash_hex = format(data_hash, '08x')
+    # Hex of the preallocated random data, checksum computed in C
+    data = get_random_buffer().hex(size)
+    data_hash_hex = format(zlib.crc32(data), '08x')
     
     return {
         "success": True,
         "message": f"Download test completed - {size} bytes (chunk {chunk_id})",
-        "data": data,
-        "hash": data_hash_hex
+        "data": data.decode('ascii'),
+        "hash": data_hash_hex,
+        "hash_type": "crc32"
     }
 
 
@@ -75,7 +286,16 @@ async def speedtest(
             # Use defaults if not provided
             download_size = size if size is not None else 1048576
             chunk_id = id if id is not None else 1
-            result = handle_download(download_size, chunk_id)
+            # hex slice, its encoded copy for the CRC and the JSON body
+            try:
+                ticket = download_limiter.admit(client_id(request), 3 * max(1024, min(download_size, 10485760)))
+            except Rejected as e:
+                return too_many_requests(e)
+            try:
+                return release_after(JSONResponse(content=handle_download(download_size, chunk_id)), ticket)
+            except Exception:
+                ticket.release()
+                raise
         else:
             return JSONResponse(content={
                 "success": False,
@@ -126,8 +346,15 @@ async def speedtest_download(
         # Limit size to reasonable range (1KB to 10MB)
         size = max(1024, min(size, 10485760))
         
-        # Generate random data
-        data = binascii.hexlify(os.urandom(size//2)).decode('utf-8')
+        # Hex encode the shared random data
+        try:
+            ticket = download_limiter.admit(client_id(request), size)
+        except Rejected as e:
+            return too_many_requests(e)
+        try:
+            data = get_random_buffer().hex(size)
+        finally:
+            ticket.release()
         
         end_time = time.time()
         duration = end_time - start_time
@@ -147,3 +374,203 @@ async def speedtest_download(
     except Exception as e:
         return HTMLResponse(content=f"<div class='alert alert--error'>Error: {str(e)}</div>", status_code=500)
 
+
+
+@router.get("/speedtest/stream")
+async def speedtest_stream(
+    request: Request,
+    size: int = Query(None, description=f"Bytes to send (default: {STREAM_DEFAULT_SIZE}, max: {STREAM_MAX_SIZE})"),
+    duration: float = Query(None, description=f"Stream for this many seconds instead of a fixed size"
+                                              f" (max: {STREAM_MAX_DURATION})"),
+    test_id: str = Query(None, description="Test ID grouping parallel streams for /speedtest/stats"),
+    stream: int = Query(0, description=f"Stream number within the test (0-{MAX_STREAMS - 1})")
+):
+    """
+    Streaming download test - raw incompressible bytes, no encoding or JSON wrapping
+    The Server-Timing header (sent before the body) only holds the preparation time,
+    the transfer time of each stream of a test is reported by /speedtest/stats
+    """
+    start_time = time.monotonic()
+    try:
+        ticket = stream_limiter.admit(client_id(request))
+    except Rejected as e:
+        return too_many_requests(e)
+    random_buffer = get_random_buffer()
+    stats = get_stream_stats(test_id, "download", stream)
+    headers = {
+        "Cache-Control": "no-store",
+        "Content-Encoding": "identity",
+        # every full block of X-Buffer-Size bytes has this CRC32
+        "X-Buffer-Size": str(len(random_buffer.data)),
+        "X-Buffer-CRC32": format(random_buffer.crc32, '08x'),
+        "Server-Timing": server_timing(prep=time.monotonic() - start_time),
+    }
+    if duration is not None:
+        duration = max(0.1, min(duration, STREAM_MAX_DURATION))
+        return release_after(BufferStreamingResponse(stream_random(duration=duration, stats=stats, ticket=ticket),
+                                                     media_type="application/octet-stream", headers=headers), ticket)
+
+    size = STREAM_DEFAULT_SIZE if size is None else max(1, min(size, STREAM_MAX_SIZE))
+    headers["Content-Length"] = str(size)
+    return release_after(BufferStreamingResponse(stream_random(size=size, stats=stats, ticket=ticket),
+                                                 media_type="application/octet-stream", headers=headers), ticket)
+
+
+@router.post("/speedtest/upload", response_class=JSONResponse)
+async def speedtest_upload(
+    request: Request,
+    test_id: str = Query(None, description="Test ID grouping parallel streams for /speedtest/stats"),
+    stream: int = Query(0, description=f"Stream number within the test (0-{MAX_STREAMS - 1})")
+):
+    """
+    Upload test endpoint - consumes the request body chunk by chunk without buffering it
+    Returns received bytes and server-side timing (first to last received byte)
+    """
+    start_time = time.monotonic()
+    try:
+        ticket = upload_limiter.admit(client_id(request))
+    except Rejected as e:
+        return too_many_requests(e)
+    stats = get_stream_stats(test_id, "upload", stream)
+    received = 0
+    first_byte_time = None
+    try:
+        async for chunk in request.stream():
+            if not chunk:
+                continue
+            if first_byte_time is None:
+                first_byte_time = time.monotonic()
+            received += len(chunk)
+            if stats is not None:
+                stats.add(len(chunk))
+            if received > UPLOAD_MAX_SIZE:
+                return JSONResponse(status_code=413, content={
+                    "success": False,
+                    "message": f"Upload too large (max {UPLOAD_MAX_SIZE} bytes)",
+                    "data": ""
+                })
+    except ClientDisconnect:
+        return JSONResponse(status_code=400, content={
+            "success": False,
+            "message": "Client disconnected during upload",
+            "data": ""
+        })
+    finally:
+        ticket.release()
+
+    end_time = time.monotonic()
+    duration = end_time - first_byte_time if first_byte_time is not None else 0.0
+    speed_mbps = (received * 8) / (duration * 1000000) if duration > 0 else 0
+    response = JSONResponse(content={
+        "success": True,
+        "message": f"Upload test completed - {received} bytes",
+        "data": {
+            "bytes": received,
+            "duration": duration,
+            "speed_mbps": speed_mbps
+        }
+    })
+    response.headers["Server-Timing"] = server_timing(upload=duration, total=end_time - start_time)
+    return response
+
+
+@router.get("/speedtest/stats", response_class=JSONResponse)
+async def speedtest_stats(
+    request: Request,
+    test_id: str = Query(..., description="Test ID used by the streams"),
+    direction: str = Query("download", description="Test direction: 'download' or 'upload'")
+):
+    """
+    Server-side statistics of a multi-stream test - aggregate and per-stream throughput
+    """
+    if direction not in ("download", "upload"):
+        return JSONResponse(status_code=400, content={
+            "success": False,
+            "message": "Invalid direction. Use 'download' or 'upload'",
+            "data": ""
+        })
+    summary = test_stats.summary(test_id, direction)
+    if summary is None:
+        return JSONResponse(status_code=404, content={
+            "success": False,
+            "message": f"Unknown test '{test_id}'",
+            "data": ""
+        })
+    return JSONResponse(content={
+        "success": True,
+        "message": f"{len(summary['streams'])} {direction} streams",
+        "data": summary
+    })
+
+
+@router.websocket("/speedtest/ws")
+async def speedtest_ws(
+    websocket: WebSocket,
+    count: int = Query(PING_DEFAULT_COUNT, description=f"Number of pings (max: {PING_MAX_COUNT})"),
+    interval: float = Query(PING_DEFAULT_INTERVAL, description=f"Seconds between pings ({PING_MIN_INTERVAL}-{PING_MAX_INTERVAL})")
+):
+    """
+    Latency test - the server sends {"type": "ping", "seq": n}, the client answers {"type": "pong", "seq": n}
+    Round trips are timed on the server; the train ends with {"type": "result", "success": true, "data": {...}}
+    with min/avg/p95/max/jitter in ms and loss. Run it during the download test for latency under load.
+    """
+    count = max(1, min(count, PING_MAX_COUNT))
+    interval = max(PING_MIN_INTERVAL, min(interval, PING_MAX_INTERVAL))
+    try:
+        ticket = ping_limiter.admit(client_id(websocket))
+    except Rejected as e:
+        # 1013 Try Again Later
+        await websocket.close(code=1013, reason=str(e))
+        return
+    try:
+        await run_ping_train(websocket, count, interval)
+    finally:
+        ticket.release()
+
+
+async def run_ping_train(websocket: WebSocket, count: int, interval: float) -> None:
+    """Run the ping train of the latency test on an admitted WebSocket."""
+    await websocket.accept()
+
+    sent = {}
+    rtts = {}
+
+    async def receive_pongs():
+        try:
+            while True:
+                message = await websocket.receive_json()
+                if not isinstance(message, dict) or message.get("type") != "pong":
+                    continue
+                seq = message.get("seq")
+                if seq in sent and seq not in rtts:
+                    rtts[seq] = time.monotonic() - sent[seq]
+        except (WebSocketDisconnect, ValueError):
+            pass
+
+    receiver = asyncio.create_task(receive_pongs())
+    try:
+        for seq in range(count):
+            if receiver.done():
+                break
+            sent[seq] = time.monotonic()
+            await websocket.send_json({"type": "ping", "seq": seq})
+            await asyncio.sleep(interval)
+
+        # give the last pings time to come back
+        deadline = time.monotonic() + PING_TIMEOUT
+        while len(rtts) < count and not receiver.done() and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        if receiver.done():
+            return
+
+        await websocket.send_json({
+            "type": "result",
+            "success": True,
+            "message": "Latency test completed",
+            "data": ping_stats([rtts[seq] for seq in sorted(rtts)], count)
+        })
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Speedtest History API endpoint
+Stores speedtest results (per client, test type and WAN interface)
+Returns histories and p50/p95 summaries over time
+SQLite calls run in the thread pool, a slow SD card must not stall the event loop
+"""
+
+import time
+import logging
+from typing import Optional
+from fastapi import APIRouter, Query, Request
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+from history import HistoryStore, METRICS
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+# Interface udhcpc runs on (active WAN), see ifupdownd.link.d/90-udhcpc.py
+UDHCPC_IFACE_FILE = "/var/lib/rpiap/service/udhcpc/env/IFACE"
+
+HISTORY_DB = "/var/lib/rpiap/speedtest/history.db"
+HISTORY_MAX_RECORDS = 10000
+HISTORY_DEFAULT_LIMIT = 100
+
+history_store = HistoryStore(HISTORY_DB, max_records=HISTORY_MAX_RECORDS)
+
+
+def active_wan_interface() -> str:
+    """Return interface udhcpc currently runs on, empty if none."""
+    try:
+        with open(UDHCPC_IFACE_FILE) as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+def parse_metric(value) -> Optional[float]:
+    """Return value as float, None for missing or invalid values."""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if value >= 0 else None
+
+
+@router.post("/speedtest/history", response_class=JSONResponse)
+async def speedtest_history_add(request: Request):
+    """
+    Store result of a LAN speedtest run by the page
+    Body: JSON with download_mbps, upload_mbps, ping_ms, loaded_ping_ms, jitter_ms and bytes
+    """
+    try:
+        body = await request.json()
+        if not isinstance(body, dict):
+            raise ValueError("JSON object expected")
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={
+            "success": False,
+            "message": f"Invalid result: {e}",
+            "data": ""
+        })
+
+    values = {metric: parse_metric(body.get(metric)) for metric in METRICS}
+    nbytes = parse_metric(body.get("bytes"))
+    record_id = await run_in_threadpool(
+        history_store.add,
+        client=request.client.host if request.client else "",
+        test_type="lan",
+        interface=active_wan_interface(),
+        bytes=int(nbytes) if nbytes is not None else None,
+        **values
+    )
+    if record_id is None:
+        return JSONResponse(status_code=503, content={
+            "success": False,
+            "message": "Speedtest history is not available",
+            "data": ""
+        })
+    return JSONResponse(content={
+        "success": True,
+        "message": "Result stored",
+        "data": {"id": record_id}
+    })
+
+
+@router.get("/speedtest/history", response_class=JSONResponse)
+async def speedtest_history(
+    request: Request,
+    client: str = Query(None, description="Client IP, 'self' for the requesting client"),
+    test_type: str = Query(None, description="Test type: 'lan' or 'wan'"),
+    interface: str = Query(None, description="WAN interface"),
+    days: float = Query(None, description="Only results of the last days"),
+    limit: int = Query(HISTORY_DEFAULT_LIMIT, description=f"Maximum results (max: {HISTORY_MAX_RECORDS})")
+):
+    """
+    Stored results, newest first
+    """
+    if client == "self":
+        client = request.client.host if request.client else ""
+    results = await run_in_threadpool(
+        history_store.query,
+        client=client,
+        test_type=test_type,
+        interface=interface,
+        since=time.time() - days * 86400 if days else None,
+        limit=max(1, min(limit, HISTORY_MAX_RECORDS))
+    )
+    return JSONResponse(content={
+        "success": True,
+        "message": f"{len(results)} results",
+        "data": results
+    })
+
+
+@router.get("/speedtest/history/summary", response_class=JSONResponse)
+async def speedtest_history_summary(
+    request: Request,
+    client: str = Query(None, description="Client IP, 'self' for the requesting client"),
+    test_type: str = Query(None, description="Test type: 'lan' or 'wan'"),
+    interface: str = Query(None, description="WAN interface"),
+    days: float = Query(None, description="Only results of the last days"),
+    bucket: str = Query(None, description="Also summarize per 'hour', 'day' or 'week'")
+):
+    """
+    p50/p95 of every metric over the matching results, optionally per time bucket
+    """
+    buckets = {"hour": 3600, "day": 86400, "week": 7 * 86400}
+    if bucket is not None and bucket not in buckets:
+        return JSONResponse(status_code=400, content={
+            "success": False,
+            "message": "Invalid bucket. Use 'hour', 'day' or 'week'",
+            "data": ""
+        })
+    if client == "self":
+        client = request.client.host if request.client else ""
+    summary = await run_in_threadpool(
+        history_store.summary,
+        bucket=buckets.get(bucket),
+        client=client,
+        test_type=test_type,
+        interface=interface,
+        since=time.time() - days * 86400 if days else None
+    )
+    return JSONResponse(content={
+        "success": True,
+        "message": f"Summary of {summary['count']} results",
+        "data": summary
+    })
@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+WAN Speed Test API endpoint
+Measures latency and download throughput from the Pi itself over one WAN interface,
+so the uplinks (eth0, usb0, ...) can be compared without a client behind the AP.
+The test runs as a background task; the page polls its status partial for progress.
+"""
+
+import os
+import ssl
+import time
+import socket
+import asyncio
+import logging
+from typing import Optional
+from urllib.parse import urlsplit
+from fastapi import APIRouter, Form, Request
+from fastapi.responses import HTMLResponse
+from starlette.concurrency import run_in_threadpool
+from templating import templates
+from routers.api.interfaces import ifaces_get, allowed_interfaces, LAN_ENV_FILE
+from routers.api.speedtest import ping_stats
+from routers.api.speedtest_history import history_store, active_wan_interface
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+# Default target (no public default), any http(s):// URL or tcp://host:port endpoint sending data can be used
+ENV_DIR = "/var/lib/rpiap/env"
+TARGET_SETTING = "speedtest_wan_target"
+
+DEFAULT_DURATION = 10
+MAX_DURATION = 30
+CONNECT_TIMEOUT = 5.0
+LATENCY_PROBES = 5
+READ_SIZE = 64 * 1024
+MAX_HEADER_SIZE = 16 * 1024
+
+
+class WanTestError(Exception):
+    """WAN test failed - the message is shown on the page."""
+
+
+class WanTest:
+    """State of one WAN test, updated by the background task and rendered by the status endpoint."""
+
+    def __init__(self, client: str, interface: str, target: str, duration: int):
+        self.client = client
+        self.interface = interface
+        self.target = target
+        self.duration = duration
+        self.state = "running"
+        self.phase = "Starting"
+        self.message = ""
+        self.latency = None
+        self.bytes = 0
+        self.transfer_start = None
+        self.transfer_end = None
+        self.task = None
+
+    @property
+    def running(self) -> bool:
+        return self.state == "running"
+
+    @property
+    def transfer_duration(self) -> float:
+        if self.transfer_start is None:
+            return 0.0
+        return (self.transfer_end or time.monotonic()) - self.transfer_start
+
+    @property
+    def speed_mbps(self) -> float:
+        duration = self.transfer_duration
+        return (self.bytes * 8) / (duration * 1000000) if duration > 0 else 0.0
+
+    @property
+    def progress(self) -> int:
+        if not self.running:
+            return 100
+        # latency probes take the first 10%
+        if self.transfer_start is None:
+            return 5
+        return int(10 + min(self.transfer_duration / self.duration, 1) * 90)
+
+
+# The last (or currently running) test, only one runs at a time
+current_test: Optional[WanTest] = None
+
+
+def configured_target() -> str:
+    """Return the default target from the env dir, empty if none is configured."""
+    try:
+        with open(os.path.join(ENV_DIR, TARGET_SETTING)) as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+def lan_interfaces() -> list:
+    """Return LAN interfaces from the env file."""
+    if os.path.exists(LAN_ENV_FILE):
+        with open(LAN_ENV_FILE) as f:
+            return f.read().strip().split("\n")
+    return ["wlan0"]
+
+
+def wan_interfaces() -> list:
+    """Return WAN capable interfaces (not in LAN) which have an address, the active WAN first.
+
+    Backup uplinks without a DHCP lease are not returned, the form tells the user so.
+    """
+    lan = lan_interfaces()
+    active = active_wan_interface()
+    result = []
+    for ifname, iface in ifaces_get().items():
+        if ifname not in allowed_interfaces or ifname in lan:
+            continue
+        if not iface["ipv4"] and not iface["ipv6"]:
+            continue
+        result.append({
+            "interface": ifname,
+            "active": ifname == active,
+            "address": (iface["ipv4"] + iface["ipv6"])[0]
+        })
+    result.sort(key=lambda iface: (not iface["active"], iface["interface"]))
+    return result
+
+
+def bound_socket(family: int, type_: int, proto: int, interface: str) -> socket.socket:
+    """Return a socket which sends and receives only via interface.
+
+    Unprivileged SO_BINDTODEVICE needs kernel 5.7 or later, older kernels are not supported.
+    """
+    sock = socket.socket(family, type_, proto)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BINDTODEVICE, interface.encode("utf-8"))
+    except PermissionError:
+        sock.close()
+        raise WanTestError(f"Cannot bind to {interface}: the WAN test needs Linux 5.7 or later")
+    except OSError as e:
+        sock.close()
+        raise WanTestError(f"Cannot bind to {interface}: {e.strerror}")
+    return sock
+
+
+async def connect_bound(host: str, port: int, interface: str) -> socket.socket:
+    """Return a socket connected to host:port which sends and receives only via interface."""
+    loop = asyncio.get_running_loop()
+    try:
+        addrinfo = await loop.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except socket.gaierror as e:
+        raise WanTestError(f"Cannot resolve {host}: {e}")
+
+    error = None
+    for family, type_, proto, _, address in addrinfo:
+        sock = bound_socket(family, type_, proto, interface)
+        try:
+            sock.setblocking(False)
+            await asyncio.wait_for(loop.sock_connect(sock, address), CONNECT_TIMEOUT)
+            return sock
+        except (OSError, asyncio.TimeoutError) as e:
+            sock.close()
+            error = e
+    raise WanTestError(f"Cannot connect to {host}:{port} via {interface}: {error or 'timeout'}")
+
+
+async def measure_latency(test: WanTest, host: str, port: int) -> dict:
+    """Time TCP handshakes to the target, failed handshakes count as lost."""
+    rtts = []
+    for _ in range(LATENCY_PROBES):
+        start = time.monotonic()
+        try:
+            sock = await connect_bound(host, port, test.interface)
+        except WanTestError as e:
+            logger.debug("WAN test latency probe failed: %s", e)
+            continue
+        rtts.append(time.monotonic() - start)
+        sock.close()
+    if not rtts:
+        raise WanTestError(f"{host}:{port} is not reachable via {test.interface}")
+    return ping_stats(rtts, LATENCY_PROBES)
+
+
+async def receive(test: WanTest, reader: asyncio.StreamReader) -> None:
+    """Count received bytes until the connection is closed or the test duration elapsed."""
+    test.transfer_start = time.monotonic()
+    deadline = test.transfer_start + test.duration
+    try:
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                data = await asyncio.wait_for(reader.read(READ_SIZE), remaining)
+            except asyncio.TimeoutError:
+                break
+            if not data:
+                break
+            test.bytes += len(data)
+    finally:
+        test.transfer_end = time.monotonic()
+
+
+async def run_tcp_target(test: WanTest, target) -> None:
+    """tcp://host:port - read whatever the endpoint sends."""
+    if not target.hostname or not target.port:
+        raise WanTestError("TCP target must be tcp://host:port")
+    test.phase = "Measuring latency"
+    test.latency = await measure_latency(test, target.hostname, target.port)
+
+    test.phase = "Downloading"
+    sock = await connect_bound(target.hostname, target.port, test.interface)
+    reader, writer = await asyncio.open_connection(sock=sock)
+    try:
+        await receive(test, reader)
+    finally:
+        writer.close()
+
+
+async def run_http_target(test: WanTest, target) -> None:
+    """http(s)://host[:port]/path - GET the URL and read the body."""
+    if not target.hostname:
+        raise WanTestError("HTTP target must include a host")
+    use_tls = target.scheme == "https"
+    port = target.port or (443 if use_tls else 80)
+    test.phase = "Measuring latency"
+    test.latency = await measure_latency(test, target.hostname, port)
+
+    test.phase = "Downloading"
+    sock = await connect_bound(target.hostname, port, test.interface)
+    reader, writer = await asyncio.open_connection(
+        sock=sock,
+        ssl=ssl.create_default_context() if use_tls else None,
+        server_hostname=target.hostname if use_tls else None,
+        limit=MAX_HEADER_SIZE
+    )
+    try:
+        path = target.path or "/"
+        if target.query:
+            path += "?" + target.query
+        writer.write((
+            f"GET {path} HTTP/1.1\r\n"
+            f"Host: {target.netloc}\r\n"
+            "User-Agent: rpiap-speedtest\r\n"
+            "Accept-Encoding: identity\r\n"
+            "Connection: close\r\n"
+            "\r\n"
+        ).encode("ascii"))
+        await writer.drain()
+
+        try:
+            header = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), CONNECT_TIMEOUT)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError):
+            raise WanTestError("Invalid HTTP response from target")
+        status_line = header.split(b"\r\n", 1)[0].decode("latin-1")
+        parts = status_line.split(" ", 2)
+        if len(parts) < 2 or not parts[1].startswith("2"):
+            raise WanTestError(f"Target answered '{status_line}'")
+
+        await receive(test, reader)
+    finally:
+        writer.close()
+
+
+# URL scheme -> test runner, add new target types here
+TARGET_RUNNERS = {
+    "http": run_http_target,
+    "https": run_http_target,
+    "tcp": run_tcp_target,
+}
+
+
+async def run_wan_test(test: WanTest) -> None:
+    """Background task running one WAN test."""
+    target = urlsplit(test.target)
+    try:
+        await TARGET_RUNNERS[target.scheme](test, target)
+        test.state = "done"
+        test.message = f"{test.bytes} bytes in {test.transfer_duration:.2f} s via {test.interface}"
+        logger.info("WAN test via %s to %s: %.2f Mbps", test.interface, test.target, test.speed_mbps)
+        await run_in_threadpool(
+            history_store.add,
+            client=test.client,
+            test_type="wan",
+            interface=test.interface,
+            download_mbps=test.speed_mbps,
+            ping_ms=test.latency["avg"],
+            jitter_ms=test.latency["jitter"],
+            bytes=test.bytes
+        )
+    except WanTestError as e:
+        test.state = "error"
+        test.message = str(e)
+    except asyncio.CancelledError:
+        test.state = "error"
+        test.message = "Test was stopped"
+        raise
+    except Exception as e:
+        logger.error("WAN test via %s failed: %s", test.interface, e)
+        test.state = "error"
+        test.message = f"Error: {e}"
+
+
+def render_status(request: Request, test: Optional[WanTest], error: str = "") -> HTMLResponse:
+    return templates.TemplateResponse("partials/speedtest_wan_status.html", {
+        "request": request,
+        "test": test,
+        "error": error
+    })
+
+
+@router.get("/speedtest/wan/form", response_class=HTMLResponse)
+async def speedtest_wan_form(request: Request):
+    """WAN test form - interfaces available for the test and the configured target"""
+    return templates.TemplateResponse("partials/speedtest_wan_form.html", {
+        "request": request,
+        "interfaces": wan_interfaces(),
+        "target": current_test.target if current_test else configured_target(),
+        "duration": DEFAULT_DURATION,
+        "test": current_test
+    })
+
+
+@router.get("/speedtest/wan", response_class=HTMLResponse)
+async def speedtest_wan_status(request: Request):
+    """WAN test status partial - polls itself while the test is running"""
+    return render_status(request, current_test)
+
+
+@router.post("/speedtest/wan", response_class=HTMLResponse)
+async def speedtest_wan_start(
+    request: Request,
+    interface: str = Form(...),
+    target: str = Form(""),
+    duration: int = Form(DEFAULT_DURATION)
+):
+    """Start WAN test in the background and return its status partial"""
+    global current_test
+
+    if current_test is not None and current_test.running:
+        return render_status(request, current_test, "A WAN test is already running")
+
+    if interface not in [iface["interface"] for iface in wan_interfaces()]:
+        return render_status(request, current_test, f"Interface '{interface}' is not an active WAN interface")
+
+    target = target.strip() or configured_target()
+    if not target:
+        return render_status(request, current_test, "No target given and none configured")
+    if urlsplit(target).scheme not in TARGET_RUNNERS:
+        schemes = ", ".join(f"{scheme}://" for scheme in TARGET_RUNNERS)
+        return render_status(request, current_test, f"Unsupported target, use {schemes}")
+
+    client = request.client.host if request.client else ""
+    current_test = WanTest(client, interface, target, max(1, min(duration, MAX_DURATION)))
+    current_test.task = asyncio.create_task(run_wan_test(current_test))
+    logger.info("WAN test started via %s to %s", interface, target)
+    return render_status(request, current_test)
+
+
+@router.delete("/speedtest/wan", response_class=HTMLResponse)
+async def speedtest_wan_stop(request: Request):
+    """Stop the running WAN test"""
+    if current_test is not None and current_test.running and current_test.task is not None:
+        current_test.task.cancel()
+        try:
+            await current_test.task
+        except asyncio.CancelledError:
+            pass
+    return render_status(request, current_test)
@@ -6,11 +6,11 @@ Home router - handles / endpoint
 import logging
 from fastapi import APIRouter, Request
 from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
+from templating import templates
+from fragments import cached_template_response
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
-templates = Jinja2Templates(directory="templates")
 
 
 @router.get("/", response_class=HTMLResponse)
@@ -29,8 +29,7 @@ async def home(request: Request) -> HTMLResponse:
     # Check if this is a partial request (HTMX content update)
     if request.query_params.get("partial") == "true":
         logger.debug("Home: partial load - returning content area only")
-        return templates.TemplateResponse("partials/home_content.html", {
-            "request": request,
+        return cached_template_response(request, templates, "partials/home_content.html", {
             "css_theme": theme
         })
 
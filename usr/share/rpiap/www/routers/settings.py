@@ -4,21 +4,14 @@ Settings router - handles settings pages and submenu
 """
 
 import logging
-import os
 from fastapi import APIRouter, Request
 from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
+from templating import templates
+from fragments import cached_template_response
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-# Get the directory where this script is located
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-
-# Setup templates
-templates_dir = os.path.join(BASE_DIR, "templates")
-templates = Jinja2Templates(directory=templates_dir)
-
 
 @router.get("/settings/submenu")
 async def settings_submenu(request: Request) -> HTMLResponse:
@@ -32,10 +25,11 @@ async def settings_submenu(request: Request) -> HTMLResponse:
     """
     # Get current_path from query parameter, fallback to request.url.path
     current_path = request.query_params.get("current_path", request.url.path)
-    return templates.TemplateResponse(
+    return cached_template_response(
+        request,
+        templates,
         "partials/settings_submenu.html",
         {
-            "request": request,
             "current_path": current_path,
         }
     )
@@ -59,8 +53,7 @@ async def settings_dns(request: Request) -> HTMLResponse:
     is_partial = request.query_params.get("partial") == "true"
     
     if is_partial:
-        return templates.TemplateResponse("partials/settings_dns_content.html", {
-            "request": request,
+        return cached_template_response(request, templates, "partials/settings_dns_content.html", {
             "css_theme": theme
         })
         
@@ -90,8 +83,7 @@ async def settings_wlan(request: Request) -> HTMLResponse:
     is_partial = request.query_params.get("partial") == "true"
     
     if is_partial:
-        return templates.TemplateResponse("partials/settings_wlan_content.html", {
-            "request": request,
+        return cached_template_response(request, templates, "partials/settings_wlan_content.html", {
             "css_theme": theme
         })
         
@@ -121,8 +113,7 @@ async def settings_wcli(request: Request) -> HTMLResponse:
     is_partial = request.query_params.get("partial") == "true"
     
     if is_partial:
-        return templates.TemplateResponse("partials/settings_wcli_content.html", {
-            "request": request,
+        return cached_template_response(request, templates, "partials/settings_wcli_content.html", {
             "css_theme": theme
         })
         
@@ -152,8 +143,7 @@ async def settings_mode(request: Request) -> HTMLResponse:
     is_partial = request.query_params.get("partial") == "true"
     
     if is_partial:
-        return templates.TemplateResponse("partials/settings_mode_content.html", {
-            "request": request,
+        return cached_template_response(request, templates, "partials/settings_mode_content.html", {
             "css_theme": theme
         })
         
@@ -164,3 +154,33 @@ async def settings_mode(request: Request) -> HTMLResponse:
         "css_theme": theme
     })
 
+
+
+@router.get("/settings/shaping")
+async def settings_shaping(request: Request) -> HTMLResponse:
+    """Return HTML page for traffic shaping settings.
+
+    Args:
+        request: FastAPI request object.
+
+    Returns:
+        HTMLResponse: Rendered traffic shaping settings page.
+    """
+    from app import get_current_theme
+    theme = get_current_theme(request)
+
+    # Check if this is an HTMX request (partial content)
+    # If partial=true query param or HX-Request header and target is content-area
+    is_partial = request.query_params.get("partial") == "true"
+
+    if is_partial:
+        return cached_template_response(request, templates, "partials/settings_shaping_content.html", {
+            "css_theme": theme
+        })
+
+    # Full page load
+    return templates.TemplateResponse("index.html", {
+        "request": request,
+        "content_template": "partials/settings_shaping_content.html",
+        "css_theme": theme
+    })
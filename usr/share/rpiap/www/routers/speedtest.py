@@ -4,21 +4,14 @@ Speedtest router - handles /speedtest endpoint
 """
 
 import logging
-import os
 from fastapi import APIRouter, Request
 from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
+from templating import templates
+from fragments import cached_template_response
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-# Get the directory where this script is located
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-
-# Setup templates
-templates_dir = os.path.join(BASE_DIR, "templates")
-templates = Jinja2Templates(directory=templates_dir)
-
 
 @router.get("/speedtest", response_class=HTMLResponse)
 async def speedtest(request: Request) -> HTMLResponse:
@@ -36,8 +29,7 @@ async def speedtest(request: Request) -> HTMLResponse:
     # Check if this is a partial request (HTMX content update)
     if request.query_params.get("partial") == "true":
         logger.debug("Speedtest: partial load - returning content area only")
-        return templates.TemplateResponse("partials/speedtest_content.html", {
-            "request": request,
+        return cached_template_response(request, templates, "partials/speedtest_content.html", {
             "css_theme": theme
         })
 
@@ -6,11 +6,10 @@ Test Select router - handles /test/select endpoint
 import logging
 from fastapi import APIRouter, Request
 from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
+from templating import templates
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
-templates = Jinja2Templates(directory="templates")
 
 
 @router.get("/test/select", response_class=HTMLResponse)
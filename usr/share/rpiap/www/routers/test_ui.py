@@ -4,21 +4,13 @@ Test UI router - handles /test/ui endpoint with UI components gallery
 """
 
 import logging
-import os
 from fastapi import APIRouter, Request
 from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
+from templating import templates
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-# Get the directory where this script is located
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-
-# Setup templates
-templates_dir = os.path.join(BASE_DIR, "templates")
-templates = Jinja2Templates(directory=templates_dir)
-
 
 @router.get("/test/ui", response_class=HTMLResponse)
 async def test_ui_page(request: Request) -> HTMLResponse:
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Startup profiler for the web UI
+Every run starts a fresh interpreter which imports app and runs the startup
+handlers, like uvicorn does before it accepts connections.
+
+    python3 startup_profile.py --importtime    # import time per module and package, startup steps
+    python3 startup_profile.py --runs 10       # cold-start benchmark (min/median/max)
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Runs in the child interpreter, prints timings as JSON
+CHILD = """
+import json, time, asyncio
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+asyncio.run(app.app.router.startup())
+started = time.perf_counter()
+print(json.dumps({"import": imported - start, "startup": started - imported, "steps": app.startup_timings}))
+"""
+
+
+def run_child(importtime: bool = False) -> dict:
+    """Start app in a fresh interpreter, return its timings (seconds) and importtime lines."""
+    cmd = [sys.executable]
+    if importtime:
+        cmd += ["-X", "importtime"]
+    cmd += ["-c", CHILD]
+    env = dict(os.environ, RPIAP_LOG_LEVEL=os.environ.get("RPIAP_LOG_LEVEL", "WARNING"))
+
+    start = time.perf_counter()
+    proc = subprocess.run(cmd, cwd=BASE_DIR, env=env, capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    if proc.returncode != 0:
+        sys.stderr.write(proc.stderr)
+        raise SystemExit(f"startup failed with exit code {proc.returncode}")
+
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["wall"] = wall
+    result["importtime"] = [line for line in proc.stderr.splitlines() if line.startswith("import time:")]
+    return result
+
+
+def parse_importtime(lines: list) -> list:
+    """Return (self us, cumulative us, module) tuples from -X importtime output."""
+    modules = []
+    for line in lines:
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        modules.append((int(fields[0]), int(fields[1]), fields[2].strip()))
+    return modules
+
+
+def report_importtime(top: int) -> None:
+    result = run_child(importtime=True)
+    modules = parse_importtime(result["importtime"])
+
+    print(f"Slowest {top} modules (self time, ms):")
+    for self_us, cumulative_us, name in sorted(modules, reverse=True)[:top]:
+        print(f"  {self_us / 1000:8.1f}  {cumulative_us / 1000:8.1f} cumulative  {name}")
+
+    packages = {}
+    for self_us, _, name in modules:
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0) + self_us
+    print(f"\nSlowest {top} packages (sum of self time, ms):")
+    for package, self_us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]:
+        print(f"  {self_us / 1000:8.1f}  {package}")
+
+    print("\nStartup steps (ms):")
+    for step, seconds in result["steps"].items():
+        print(f"  {seconds * 1000:8.1f}  {step}")
+    print(f"\nimport app {result['import'] * 1000:.1f} ms, startup {result['startup'] * 1000:.1f} ms, "
+          f"process total {result['wall'] * 1000:.1f} ms (with -X importtime overhead)")
+
+
+def report_benchmark(runs: int, warmup: int) -> None:
+    for _ in range(warmup):
+        run_child()
+    results = [run_child() for _ in range(runs)]
+
+    print(f"Cold start, {runs} runs ({warmup} warmup), ms:")
+    print(f"  {'':10} {'min':>8} {'median':>8} {'max':>8}")
+    for key in ("import", "startup", "wall"):
+        values = [result[key] * 1000 for result in results]
+        print(f"  {key:10} {min(values):8.1f} {statistics.median(values):8.1f} {max(values):8.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure web UI import and startup time")
+    parser.add_argument("--importtime", action="store_true", help="report import time per module and startup steps")
+    parser.add_argument("--top", type=int, default=25, help="modules/packages listed by --importtime")
+    parser.add_argument("--runs", type=int, default=0, help="cold-start benchmark with this many runs")
+    parser.add_argument("--warmup", type=int, default=1, help="runs discarded before the benchmark")
+    args = parser.parse_args()
+
+    if not args.importtime and not args.runs:
+        parser.error("use --importtime and/or --runs N")
+    if args.importtime:
+        report_importtime(args.top)
+    if args.runs:
+        if args.importtime:
+            print()
+        report_benchmark(args.runs, args.warmup)
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Wi-Fi station statistics
+Samples connected clients from the hostapd control interface (STA-FIRST/STA-NEXT)
+into a per-station table: signal, tx/rx bitrate, throughput, retries, inactivity.
+
+A fake hostapd can stand in for the real one (development, machines without Wi-Fi):
+
+    python3 stations.py --fake /tmp/hostapd-wlan0 --fixture stations.json
+    RPIAP_HOSTAPD_CTRL=/tmp/hostapd-wlan0 uvicorn app:app
+    python3 stations.py --ctrl /tmp/hostapd-wlan0     # print stations once
+
+The fixture is a list of stations as hostapd reports them ({"addr": mac, key: value}).
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import logging
+import argparse
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# hostapd ctrl_interface, see /etc/rpiap/hostapd.conf
+HOSTAPD_CTRL_DIR = "/run/rpiap/hostapd"
+STATION_INTERFACE = "wlan0"
+CTRL_ENV = "RPIAP_HOSTAPD_CTRL"
+
+SAMPLE_INTERVAL = 10
+REQUEST_TIMEOUT = 2.0
+REPLY_SIZE = 4096
+# STA-NEXT loop guard
+MAX_STATIONS = 256
+
+
+class HostapdError(Exception):
+    """hostapd control interface not reachable or request failed."""
+
+
+class HostapdControl:
+    """Client of one hostapd control socket (datagram, one request at a time)."""
+
+    def __init__(self, path: str, timeout: float = REQUEST_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+        self.sock = None
+
+    def open(self) -> None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            # autobind to an abstract address, hostapd replies to it
+            sock.bind("")
+            sock.connect(self.path)
+        except OSError as e:
+            sock.close()
+            raise HostapdError(f"Cannot connect to hostapd at {self.path}: {e}")
+        sock.setblocking(False)
+        self.sock = sock
+
+    def close(self) -> None:
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    async def request(self, command: str) -> str:
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.sock_sendall(self.sock, command.encode("ascii"))
+            reply = await asyncio.wait_for(loop.sock_recv(self.sock, REPLY_SIZE), self.timeout)
+        except asyncio.TimeoutError:
+            raise HostapdError(f"hostapd did not answer {command.split()[0]}")
+        except OSError as e:
+            raise HostapdError(f"hostapd request {command.split()[0]} failed: {e}")
+        reply = reply.decode("utf-8", errors="replace")
+        if reply.startswith(("FAIL", "UNKNOWN COMMAND")):
+            raise HostapdError(f"hostapd answered {reply.strip()} to {command.split()[0]}")
+        return reply
+
+    async def stations(self) -> list:
+        """Return raw station replies, parsed by parse_station."""
+        result = []
+        reply = await self.request("STA-FIRST")
+        while reply.strip() and len(result) < MAX_STATIONS:
+            station = parse_station(reply)
+            if station is None:
+                break
+            result.append(station)
+            reply = await self.request(f"STA-NEXT {station['addr']}")
+        return result
+
+
+def parse_station(reply: str) -> Optional[dict]:
+    """Parse STA reply: MAC on the first line, key=value lines follow."""
+    lines = reply.strip().splitlines()
+    if not lines or lines[0].count(":") != 5:
+        return None
+    station = {"addr": lines[0].strip().lower()}
+    for line in lines[1:]:
+        key, sep, value = line.partition("=")
+        if sep:
+            station[key.strip()] = value.strip()
+    return station
+
+
+def to_int(value: Optional[str]) -> Optional[int]:
+    """Leading integer of a hostapd value ("650 mcs 7 shortGI" -> 650)."""
+    if not value:
+        return None
+    try:
+        return int(value.split()[0])
+    except ValueError:
+        return None
+
+
+class Station:
+    """One connected client, last sample and rates since the previous one."""
+
+    __slots__ = ("mac", "signal", "tx_rate", "rx_rate", "rx_bytes", "tx_bytes", "tx_packets",
+                 "tx_retries", "tx_failed", "inactive_ms", "connected_s", "rx_bps", "tx_bps",
+                 "retry_percent", "sampled")
+
+    def __init__(self, mac: str):
+        self.mac = mac
+        self.rx_bps = None
+        self.tx_bps = None
+        self.retry_percent = None
+        self.sampled = None
+
+    def update(self, raw: dict, now: float) -> None:
+        rx_bytes = to_int(raw.get("rx_bytes"))
+        tx_bytes = to_int(raw.get("tx_bytes"))
+        tx_packets = to_int(raw.get("tx_packets"))
+        tx_retries = to_int(raw.get("tx_retry_count"))
+        if self.sampled is not None and now > self.sampled:
+            elapsed = now - self.sampled
+            if rx_bytes is not None and self.rx_bytes is not None and rx_bytes >= self.rx_bytes:
+                self.rx_bps = (rx_bytes - self.rx_bytes) * 8 / elapsed
+            if tx_bytes is not None and self.tx_bytes is not None and tx_bytes >= self.tx_bytes:
+                self.tx_bps = (tx_bytes - self.tx_bytes) * 8 / elapsed
+            if None not in (tx_retries, self.tx_retries, tx_packets, self.tx_packets):
+                packets = tx_packets - self.tx_packets
+                if packets > 0:
+                    self.retry_percent = min(100.0, max(0, tx_retries - self.tx_retries) * 100 / packets)
+
+        self.signal = to_int(raw.get("signal"))
+        # rate_info is in 100 kbps
+        tx_rate = to_int(raw.get("tx_rate_info"))
+        rx_rate = to_int(raw.get("rx_rate_info"))
+        self.tx_rate = tx_rate / 10 if tx_rate is not None else None
+        self.rx_rate = rx_rate / 10 if rx_rate is not None else None
+        self.rx_bytes = rx_bytes
+        self.tx_bytes = tx_bytes
+        self.tx_packets = tx_packets
+        self.tx_retries = tx_retries
+        self.tx_failed = to_int(raw.get("tx_retry_failed"))
+        self.inactive_ms = to_int(raw.get("inactive_msec"))
+        self.connected_s = to_int(raw.get("connected_time"))
+        self.sampled = now
+
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class StationCollector:
+    """Samples stations every interval seconds in a background task."""
+
+    def __init__(self, ctrl_path: str, interval: float = SAMPLE_INTERVAL):
+        self.ctrl_path = ctrl_path
+        self.interval = interval
+        self.stations = {}
+        self.updated = None
+        self.error = ""
+        self.task = None
+
+    async def sample(self) -> None:
+        control = HostapdControl(self.ctrl_path)
+        control.open()
+        try:
+            raw_stations = await control.stations()
+        finally:
+            control.close()
+
+        now = time.monotonic()
+        stations = {}
+        for raw in raw_stations:
+            station = self.stations.get(raw["addr"]) or Station(raw["addr"])
+            station.update(raw, now)
+            stations[station.mac] = station
+        # disconnected stations are dropped
+        self.stations = stations
+        self.updated = time.time()
+        self.error = ""
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.sample()
+            except HostapdError as e:
+                if str(e) != self.error:
+                    logger.warning("Station statistics unavailable: %s", e)
+                self.error = str(e)
+                self.stations = {}
+            except Exception as e:
+                logger.error("Station sampling failed: %s", e)
+                self.error = f"Error: {e}"
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    def snapshot(self) -> list:
+        """Return stations as dicts, weakest signal first (slow, distant clients on top)."""
+        stations = [station.as_dict() for station in self.stations.values()]
+        stations.sort(key=lambda station: (station["signal"] is None, station["signal"] or 0))
+        return stations
+
+
+station_collector = StationCollector(os.environ.get(CTRL_ENV) or os.path.join(HOSTAPD_CTRL_DIR, STATION_INTERFACE))
+
+
+class FakeHostapd:
+    """Answers STA-FIRST/STA-NEXT from a fixture, byte counters grow between requests."""
+
+    def __init__(self, stations: list):
+        self.stations = stations
+        self.start = time.monotonic()
+
+    def reply(self, command: str) -> str:
+        if command == "PING":
+            return "PONG\n"
+        if command == "STA-FIRST":
+            index = 0
+        elif command.startswith("STA-NEXT "):
+            addrs = [station["addr"] for station in self.stations]
+            addr = command.split()[1]
+            index = addrs.index(addr) + 1 if addr in addrs else len(addrs)
+        else:
+            return "UNKNOWN COMMAND\n"
+        if index >= len(self.stations):
+            return ""
+        station = dict(self.stations[index])
+        # traffic at roughly a tenth of the tx bitrate
+        elapsed = time.monotonic() - self.start
+        rate = (to_int(station.get("tx_rate_info")) or 0) * 100000 / 8 / 10
+        for key in ("rx_bytes", "tx_bytes"):
+            station[key] = str((to_int(station.get(key)) or 0) + int(rate * elapsed))
+        lines = [station.pop("addr")] + [f"{key}={value}" for key, value in station.items()]
+        return "\n".join(lines) + "\n"
+
+    def serve(self, path: str) -> None:
+        if os.path.exists(path):
+            os.unlink(path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.bind(path)
+        print(f"Fake hostapd with {len(self.stations)} stations on {path}")
+        while True:
+            data, addr = sock.recvfrom(REPLY_SIZE)
+            # empty replies (no next station) are sent as empty datagrams, like hostapd does
+            sock.sendto(self.reply(data.decode("ascii", errors="replace").strip()).encode(), addr)
+
+
+async def print_stations(path: str) -> None:
+    collector = StationCollector(path)
+    await collector.sample()
+    print(f"{'station':17} {'signal':>7} {'tx Mbps':>8} {'rx Mbps':>8} {'inactive':>9}")
+    for station in collector.snapshot():
+        values = [station["signal"], station["tx_rate"], station["rx_rate"], station["inactive_ms"]]
+        signal, tx_rate, rx_rate, inactive = ["--" if value is None else value for value in values]
+        print(f"{station['mac']:17} {signal:>7} {tx_rate:>8} {rx_rate:>8} {inactive:>7}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show Wi-Fi stations from hostapd, or run a fake hostapd")
+    parser.add_argument("--ctrl", default=station_collector.ctrl_path, help="hostapd control socket")
+    parser.add_argument("--fake", help="run fake hostapd control socket at this path")
+    parser.add_argument("--fixture", help="stations answered by the fake hostapd (JSON)")
+    args = parser.parse_args()
+
+    try:
+        if args.fake:
+            fixture = []
+            if args.fixture:
+                with open(args.fixture) as f:
+                    fixture = json.load(f)
+            FakeHostapd(fixture).serve(args.fake)
+        else:
+            asyncio.run(print_stations(args.ctrl))
+    except HostapdError as e:
+        sys.exit(f"stations: {e}")
+    except KeyboardInterrupt:
+        pass
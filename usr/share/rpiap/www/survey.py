@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+"""
+Wi-Fi channel survey
+Scans for neighbouring networks with nl80211 (generic netlink, no iw needed),
+counts BSSes and their signal per channel and scores the channels allowed for
+the country - the lower the score, the less co-channel interference.
+
+A recorded scan can stand in for the radio (development, machines without Wi-Fi):
+
+    python3 survey.py --record scan.json               # record a scan of wlan0
+    RPIAP_SURVEY_FIXTURE=scan.json uvicorn app:app     # web UI uses the recording
+    python3 survey.py --fixture scan.json --country CZ # print channel scores
+"""
+
+import os
+import sys
+import json
+import time
+import errno
+import select
+import socket
+import struct
+import logging
+import argparse
+import threading
+from typing import Optional
+
+from netlink import (nla, nla_parse, SOL_NETLINK, NETLINK_ADD_MEMBERSHIP, NLM_F_REQUEST, NLM_F_ACK, NLM_F_DUMP,
+                     NLMSG_DONE, NLMSG_ERROR)
+
+logger = logging.getLogger(__name__)
+
+SURVEY_INTERFACE = "wlan0"
+SURVEY_CACHE_FILE = "/var/cache/rpiap/survey.json"
+SCAN_TIMEOUT = 15.0
+FIXTURE_ENV = "RPIAP_SURVEY_FIXTURE"
+
+# netlink
+NETLINK_GENERIC = 16
+
+# generic netlink controller
+GENL_ID_CTRL = 0x10
+CTRL_CMD_GETFAMILY = 3
+CTRL_ATTR_FAMILY_ID = 1
+CTRL_ATTR_FAMILY_NAME = 2
+CTRL_ATTR_MCAST_GROUPS = 7
+CTRL_ATTR_MCAST_GRP_NAME = 1
+CTRL_ATTR_MCAST_GRP_ID = 2
+
+# nl80211
+NL80211_CMD_GET_SCAN = 32
+NL80211_CMD_TRIGGER_SCAN = 33
+NL80211_CMD_NEW_SCAN_RESULTS = 34
+NL80211_CMD_SCAN_ABORTED = 35
+NL80211_ATTR_IFINDEX = 3
+NL80211_ATTR_BSS = 47
+NL80211_ATTR_SCAN_FLAGS = 158
+NL80211_SCAN_FLAG_AP = 1 << 2
+NL80211_BSS_BSSID = 1
+NL80211_BSS_FREQUENCY = 2
+NL80211_BSS_INFORMATION_ELEMENTS = 6
+NL80211_BSS_SIGNAL_MBM = 7
+
+# 2.4 GHz channels are 5 MHz apart and 20 MHz wide, so a BSS disturbs
+# up to 4 channels on both sides, less the further away it is
+OVERLAP_CHANNELS = 5
+# Non-overlapping 2.4 GHz channels, preferred when scores are equal
+PREFERRED_CHANNELS = (1, 6, 11)
+# Signal (dBm) mapped to weight 0..1, weaker BSSes disturb less
+SIGNAL_FLOOR = -95
+SIGNAL_CEILING = -35
+
+
+class SurveyError(Exception):
+    """Scan failed - the message is shown on the page."""
+
+
+def freq_to_channel(freq: int) -> Optional[int]:
+    """Return channel number of a 2.4/5 GHz frequency (MHz)."""
+    if freq == 2484:
+        return 14
+    if 2412 <= freq <= 2472:
+        return (freq - 2407) // 5
+    if 5160 <= freq <= 5885:
+        return (freq - 5000) // 5
+    return None
+
+
+def channel_to_freq(channel: int) -> Optional[int]:
+    """Return frequency (MHz) of a 2.4/5 GHz channel, None for unknown channels."""
+    if channel == 14:
+        return 2484
+    if 1 <= channel <= 13:
+        return 2407 + channel * 5
+    if 32 <= channel <= 177:
+        return 5000 + channel * 5
+    return None
+
+
+def channel_band(channel: int) -> str:
+    """Return "2.4" or "5" (GHz)."""
+    return "2.4" if 1 <= channel <= 14 else "5"
+
+
+def parse_ssid(ies: bytes) -> str:
+    """Return SSID from the information elements of a beacon/probe response."""
+    offset = 0
+    while offset + 2 <= len(ies):
+        element_id, length = ies[offset], ies[offset + 1]
+        if element_id == 0:
+            return ies[offset + 2:offset + 2 + length].decode("utf-8", errors="replace")
+        offset += 2 + length
+    return ""
+
+
+class Nl80211:
+    """Minimal nl80211 client: trigger a scan and dump its results."""
+
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_GENERIC)
+        self.sock.bind((0, 0))
+        self.seq = 0
+        self.family_id, self.mcast_groups = self._resolve_family("nl80211")
+
+    def close(self) -> None:
+        self.sock.close()
+
+    def _send(self, msg_type: int, flags: int, cmd: int, attrs: bytes = b"") -> int:
+        self.seq += 1
+        # genlmsghdr: cmd, version, reserved
+        payload = struct.pack("BBH", cmd, 1, 0) + attrs
+        self.sock.send(struct.pack("IHHII", 16 + len(payload), msg_type, flags, self.seq, 0) + payload)
+        return self.seq
+
+    def _messages(self, seq: Optional[int]):
+        """Yield (type, genl cmd, attributes) of replies to seq (None: multicast events)."""
+        while True:
+            data = self.sock.recv(65536)
+            offset = 0
+            while offset + 16 <= len(data):
+                length, msg_type, _, msg_seq, _ = struct.unpack_from("IHHII", data, offset)
+                if length < 16:
+                    return
+                body = data[offset + 16:offset + length]
+                offset += (length + 3) & ~3
+                if seq is not None and msg_seq != seq:
+                    continue
+                if msg_type == NLMSG_DONE:
+                    return
+                if msg_type == NLMSG_ERROR:
+                    error = -struct.unpack_from("i", body)[0]
+                    if error:
+                        raise OSError(error, os.strerror(error))
+                    return
+                yield msg_type, body[0], nla_parse(body[4:])
+            # events are read one datagram at a time
+            if seq is None:
+                return
+
+    def _resolve_family(self, name: str):
+        seq = self._send(GENL_ID_CTRL, NLM_F_REQUEST, CTRL_CMD_GETFAMILY,
+                         nla(CTRL_ATTR_FAMILY_NAME, name.encode() + b"\0"))
+        for _, _, attrs in self._messages(seq):
+            family_id = struct.unpack("H", attrs[CTRL_ATTR_FAMILY_ID][:2])[0]
+            groups = {}
+            for group in nla_parse(attrs.get(CTRL_ATTR_MCAST_GROUPS, b"")).values():
+                group = nla_parse(group)
+                group_name = group[CTRL_ATTR_MCAST_GRP_NAME].rstrip(b"\0").decode()
+                groups[group_name] = struct.unpack("I", group[CTRL_ATTR_MCAST_GRP_ID][:4])[0]
+            return family_id, groups
+        raise SurveyError(f"Generic netlink family {name} not found")
+
+    def trigger_scan(self, ifindex: int, timeout: float) -> bool:
+        """Scan (also while running as an AP), return False if the scan was aborted."""
+        self.sock.setsockopt(SOL_NETLINK, NETLINK_ADD_MEMBERSHIP, self.mcast_groups["scan"])
+        seq = self._send(self.family_id, NLM_F_REQUEST | NLM_F_ACK, NL80211_CMD_TRIGGER_SCAN,
+                         nla(NL80211_ATTR_IFINDEX, struct.pack("I", ifindex)) +
+                         nla(NL80211_ATTR_SCAN_FLAGS, struct.pack("I", NL80211_SCAN_FLAG_AP)))
+        try:
+            for _ in self._messages(seq):
+                pass
+        except OSError as e:
+            # a scan is already running, wait for its results
+            if e.errno != errno.EBUSY:
+                raise
+
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([self.sock], [], [], remaining)[0]:
+                raise SurveyError("Timeout waiting for scan results")
+            for _, cmd, attrs in self._messages(None):
+                if struct.unpack("I", attrs.get(NL80211_ATTR_IFINDEX, b"\0\0\0\0")[:4])[0] != ifindex:
+                    continue
+                if cmd == NL80211_CMD_NEW_SCAN_RESULTS:
+                    return True
+                if cmd == NL80211_CMD_SCAN_ABORTED:
+                    return False
+
+    def get_scan(self, ifindex: int) -> list:
+        """Return BSSes known to the interface (results of the last scans)."""
+        seq = self._send(self.family_id, NLM_F_REQUEST | NLM_F_DUMP, NL80211_CMD_GET_SCAN,
+                         nla(NL80211_ATTR_IFINDEX, struct.pack("I", ifindex)))
+        bsses = []
+        for _, _, attrs in self._messages(seq):
+            if NL80211_ATTR_BSS not in attrs:
+                continue
+            bss = nla_parse(attrs[NL80211_ATTR_BSS])
+            if NL80211_BSS_FREQUENCY not in bss:
+                continue
+            signal = None
+            if NL80211_BSS_SIGNAL_MBM in bss:
+                signal = struct.unpack("i", bss[NL80211_BSS_SIGNAL_MBM][:4])[0] / 100
+            bsses.append({
+                "bssid": ":".join(f"{b:02x}" for b in bss.get(NL80211_BSS_BSSID, b"")),
+                "ssid": parse_ssid(bss.get(NL80211_BSS_INFORMATION_ELEMENTS, b"")),
+                "freq": struct.unpack("I", bss[NL80211_BSS_FREQUENCY][:4])[0],
+                "signal": signal
+            })
+        return bsses
+
+
+def scan(interface: str, timeout: float = SCAN_TIMEOUT) -> dict:
+    """Scan with the radio of interface, return scan record (see load_fixture)."""
+    try:
+        ifindex = socket.if_nametoindex(interface)
+    except OSError:
+        raise SurveyError(f"Interface {interface} not found")
+    try:
+        client = Nl80211()
+    except OSError as e:
+        raise SurveyError(f"nl80211 not available: {e}")
+    try:
+        try:
+            triggered = client.trigger_scan(ifindex, timeout)
+        except OSError as e:
+            # no permission or driver cannot scan in AP mode, use what the radio already knows
+            logger.warning("Scan on %s not triggered: %s", interface, e)
+            triggered = False
+        bsses = client.get_scan(ifindex)
+    except OSError as e:
+        raise SurveyError(f"Scan on {interface} failed: {e}")
+    finally:
+        client.close()
+    return {"timestamp": time.time(), "interface": interface, "triggered": triggered, "bss": bsses}
+
+
+def load_fixture(path: str) -> dict:
+    """Load recorded scan: {"timestamp", "interface", "triggered", "bss": [{bssid, ssid, freq, signal}]}"""
+    try:
+        with open(path, "r") as f:
+            record = json.load(f)
+    except (OSError, ValueError) as e:
+        raise SurveyError(f"Cannot load scan fixture {path}: {e}")
+    record.setdefault("timestamp", os.path.getmtime(path))
+    record.setdefault("interface", "fixture")
+    record.setdefault("triggered", False)
+    record.setdefault("bss", [])
+    return record
+
+
+def signal_weight(signal: Optional[float]) -> float:
+    if signal is None:
+        signal = SIGNAL_FLOOR
+    weight = (signal - SIGNAL_FLOOR) / (SIGNAL_CEILING - SIGNAL_FLOOR)
+    return min(1.0, max(0.05, weight))
+
+
+def overlap(channel: int, other: int) -> float:
+    """Interference factor of a BSS on other channel to channel (0..1)."""
+    if channel_band(channel) != channel_band(other):
+        return 0.0
+    if channel_band(channel) == "2.4":
+        return max(0.0, 1 - abs(channel - other) / OVERLAP_CHANNELS)
+    # 5 GHz channels do not overlap at 20 MHz
+    return 1.0 if channel == other else 0.0
+
+
+def score_channels(bsses: list, channels: list) -> list:
+    """Return channel statistics with score, the least congested channel first.
+
+    Args:
+        bsses: Scanned BSSes ({bssid, ssid, freq, signal}).
+        channels: Candidate channel numbers.
+    """
+    seen = []
+    for bss in bsses:
+        channel = freq_to_channel(bss.get("freq") or 0)
+        if channel is not None:
+            seen.append((channel, bss.get("signal")))
+
+    results = []
+    for channel in channels:
+        same = [signal for other, signal in seen if other == channel]
+        overlapping = [signal for other, signal in seen if other != channel and overlap(channel, other) > 0]
+        signals = [signal for signal in same if signal is not None]
+        results.append({
+            "channel": channel,
+            "band": channel_band(channel),
+            "bss_count": len(same),
+            "overlapping_count": len(overlapping),
+            "strongest": max(signals) if signals else None,
+            "score": round(sum(overlap(channel, other) * signal_weight(signal) for other, signal in seen), 2)
+        })
+    results.sort(key=lambda result: (result["score"], result["channel"] not in PREFERRED_CHANNELS, result["channel"]))
+    return results
+
+
+def best_channel(scores: list, band: Optional[str] = None) -> Optional[dict]:
+    """Return the least congested channel, in band if given."""
+    for result in scores:
+        if band is None or result["band"] == band:
+            return result
+    return None
+
+
+class ChannelSurvey:
+    """Last scan of the AP radio, kept in memory and in the cache file across restarts."""
+
+    def __init__(self, interface: str, cache_file: Optional[str], fixture: Optional[str] = None):
+        self.interface = interface
+        self.cache_file = cache_file
+        self.fixture = fixture
+        self.record = None
+        self.lock = threading.Lock()
+
+    def _load_cache(self) -> Optional[dict]:
+        if not self.cache_file:
+            return None
+        try:
+            with open(self.cache_file, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning("Cannot read survey cache %s: %s", self.cache_file, e)
+            return None
+
+    def _save_cache(self, record: dict) -> None:
+        if not self.cache_file:
+            return
+        try:
+            tmp = f"{self.cache_file}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(record, f)
+            os.replace(tmp, self.cache_file)
+        except OSError as e:
+            logger.warning("Cannot write survey cache %s: %s", self.cache_file, e)
+
+    def get(self, refresh: bool = False) -> Optional[dict]:
+        """Return the cached scan record (None before the first scan), scanning only when refresh is requested.
+
+        A scan briefly takes the AP off channel, so it is never started implicitly.
+        Blocks while scanning, call from a thread.
+        """
+        with self.lock:
+            if self.record is None and not self.fixture:
+                self.record = self._load_cache()
+            if not refresh:
+                return self.record
+
+            start = time.monotonic()
+            if self.fixture:
+                record = load_fixture(self.fixture)
+            else:
+                record = scan(self.interface)
+                self._save_cache(record)
+            logger.info("Channel survey on %s: %s BSSes in %.2fs", record["interface"], len(record["bss"]),
+                        time.monotonic() - start)
+            self.record = record
+            return record
+
+
+channel_survey = ChannelSurvey(SURVEY_INTERFACE, SURVEY_CACHE_FILE, os.environ.get(FIXTURE_ENV))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Survey Wi-Fi channels and suggest the least congested one")
+    parser.add_argument("--interface", default=SURVEY_INTERFACE, help="interface of the radio to scan with")
+    parser.add_argument("--fixture", help="use recorded scan instead of the radio")
+    parser.add_argument("--record", help="save the scan to this file")
+    parser.add_argument("--country", default="", help="score channels allowed in this country (static/settings.json)")
+    args = parser.parse_args()
+
+    try:
+        record = load_fixture(args.fixture) if args.fixture else scan(args.interface)
+    except SurveyError as e:
+        sys.exit(f"survey: {e}")
+    if args.record:
+        with open(args.record, "w") as f:
+            json.dump(record, f, indent=2)
+
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "settings.json")) as f:
+        countries = {c.get("code", ""): c for c in json.load(f).get("countries", [])}
+    allowed = countries.get(args.country, {}).get("allowed_channels", [])
+    channels = [ch["id"] for ch in allowed if channel_to_freq(ch["id"])] or list(range(1, 14))
+
+    print(f"{len(record['bss'])} BSSes on {record['interface']}, "
+          f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record['timestamp']))}")
+    print(f"{'channel':>8} {'BSSes':>6} {'overlap':>8} {'strongest':>10} {'score':>6}")
+    for result in score_channels(record["bss"], channels):
+        strongest = f"{result['strongest']:.0f} dBm" if result["strongest"] is not None else "--"
+        print(f"{result['channel']:>8} {result['bss_count']:>6} {result['overlapping_count']:>8} "
+              f"{strongest:>10} {result['score']:>6}")
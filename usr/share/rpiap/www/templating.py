@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Shared Jinja2 templates
+One template environment for all routers, with a persistent bytecode cache
+and eager compilation of all templates at startup
+"""
+
+import os
+import time
+import logging
+from jinja2 import FileSystemBytecodeCache
+from fastapi.templating import Jinja2Templates
+from assets import asset_manifest
+
+logger = logging.getLogger(__name__)
+
+# Get the directory where this script is located
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
+
+# Compiled templates survive service restarts here
+BYTECODE_CACHE_DIR = "/var/cache/rpiap/jinja2"
+
+
+def create_bytecode_cache(directory: str):
+    """Return bytecode cache in directory, or None if the directory is not usable."""
+    try:
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        if not os.access(directory, os.W_OK):
+            raise PermissionError(f"{directory} is not writable")
+    except OSError as e:
+        logger.warning("Jinja2 bytecode cache disabled: %s", e)
+        return None
+    return FileSystemBytecodeCache(directory)
+
+
+templates = Jinja2Templates(directory=TEMPLATES_DIR)
+templates.env.bytecode_cache = create_bytecode_cache(BYTECODE_CACHE_DIR)
+# {{ static_url('css/styles.css') }} -> fingerprinted URL
+templates.env.globals["static_url"] = asset_manifest.url
+
+
+def precompile_templates() -> None:
+    """Compile all templates now, so the first request after a restart does not pay for it."""
+    start = time.monotonic()
+    names = templates.env.list_templates()
+    for name in names:
+        try:
+            templates.get_template(name)
+        except Exception as e:
+            logger.error("Error compiling template %s: %s", name, e)
+    logger.info("Compiled %s templates in %.3fs", len(names), time.monotonic() - start)